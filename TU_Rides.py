@@ -5,13 +5,17 @@ import re
 import uuid
 import datetime
 
-from .database import (
+from database import (
     init_db,
     insert_signup,
     cancel_signup_by_token,
     list_signups,
 )
-from .email_utils import send_confirmation_email
+from email_utils import send_confirmation_email
+import migrate_schema
+import maintenance
+import reminders
+import waitlist
 
 
 # -----------------------
@@ -24,8 +28,15 @@ DB_PATH = os.getenv("TEAMUGLY_DB_PATH", "data/teamugly.sqlite")
 ADMIN_PASSWORD = os.getenv("TEAMUGLY_ADMIN_PASSWORD", "change_me")
 TIMEZONE_LABEL = os.getenv("TEAMUGLY_TIMEZONE_LABEL", "America/Chicago")
 
-# Create DB on startup
+# Create DB on startup; finish moving any schema.sql signups into the
+# shared normalized tables, and keep the file checkpointed, analyzed and
+# backed up, in the background. Spots freed by a cancellation go to the
+# ride's waitlist; day-before reminders go out when TEAMUGLY_SMTP_HOST is set.
 init_db(DB_PATH)
+migrate_schema.start_background(DB_PATH)
+maintenance.start_background(DB_PATH)
+waitlist.start_background(DB_PATH)
+reminders.start_background(DB_PATH)
 
 
 def is_valid_email(email: str) -> bool:
@@ -76,7 +87,7 @@ app_ui = ui.page_fluid(
     ),
     ui.br(),
     ui.navset_tab(
-        ui.nav(
+        ui.nav_panel(
             "Sign Up",
             ui.layout_columns(
                 ui.card(
@@ -133,7 +144,7 @@ app_ui = ui.page_fluid(
                 ),
             ),
         ),
-        ui.nav(
+        ui.nav_panel(
             "Cancel RSVP",
             ui.card(
                 ui.card_header("Cancel using your cancellation code"),
@@ -152,7 +163,7 @@ app_ui = ui.page_fluid(
                 ui.output_ui("cancel_status"),
             ),
         ),
-        ui.nav(
+        ui.nav_panel(
             "Admin",
             ui.layout_columns(
                 ui.card(
@@ -187,7 +198,7 @@ def server(input, output, session):
     # Handle cancel token via URL: ?cancel=<token>
     @reactive.effect
     def _handle_url_cancel():
-        qs = parse_qs(session.clientdata.url_search.get() or "")
+        qs = parse_qs(session.clientdata.url_search() or "")
         token = None
         if "cancel" in qs and len(qs["cancel"]) > 0:
             token = qs["cancel"][0]
@@ -195,6 +206,7 @@ def server(input, output, session):
         if token:
             cancelled = cancel_signup_by_token(DB_PATH, token)
             if cancelled:
+                waitlist.wake()
                 cancel_msg.set(ui.div({"class": "okbox"}, "Your RSVP has been cancelled."))
             else:
                 cancel_msg.set(ui.div({"class": "warnbox"}, "Cancel link already used or not found."))
@@ -214,6 +226,7 @@ def server(input, output, session):
     def admin_status():
         return ui.div({"class": "small"}, admin_msg.get())
 
+    @reactive.effect
     @reactive.event(input.admin_unlock)
     def _unlock_admin():
         pw = (input.admin_pw() or "").strip()
@@ -224,6 +237,7 @@ def server(input, output, session):
             admin_unlocked.set(False)
             admin_msg.set("Locked. Incorrect password.")
 
+    @reactive.effect
     @reactive.event(input.submit)
     def _submit_rsvp():
         public_msg.set(None)
@@ -254,7 +268,7 @@ def server(input, output, session):
         token = str(uuid.uuid4())
         created_utc = now_utc_iso()
 
-        insert_signup(
+        status = insert_signup(
             db_path=DB_PATH,
             created_utc=created_utc,
             ride_name=ride_name,
@@ -272,6 +286,10 @@ def server(input, output, session):
         )
 
         cancel_link = f"{APP_URL}?cancel={token}"
+        waitlisted = ui.p(
+            "This ride is full, so you're on the waitlist. "
+            "You'll get the first spot that opens up after the riders ahead of you."
+        ) if status == "WAITLISTED" else None
 
         email_sent = False
         try:
@@ -294,6 +312,7 @@ def server(input, output, session):
                 ui.div(
                     {"class": "okbox"},
                     ui.p("RSVP received. A confirmation email has been sent."),
+                    waitlisted,
                     ui.p({"class": "small"}, "Keep that email for your self-cancel link."),
                 )
             )
@@ -302,10 +321,12 @@ def server(input, output, session):
                 ui.div(
                     {"class": "warnbox"},
                     ui.p("RSVP saved, but email could not be sent from the server."),
+                    waitlisted,
                     ui.p({"class": "small"}, f"Your cancellation code is: {token}"),
                 )
             )
 
+    @reactive.effect
     @reactive.event(input.cancel_btn)
     def _cancel_manual():
         token = (input.cancel_token_input() or "").strip()
@@ -315,6 +336,7 @@ def server(input, output, session):
 
         cancelled = cancel_signup_by_token(DB_PATH, token)
         if cancelled:
+            waitlist.wake()
             cancel_msg.set(ui.div({"class": "okbox"}, "Your RSVP has been cancelled."))
         else:
             cancel_msg.set(ui.div({"class": "warnbox"}, "Not found or already cancelled."))
@@ -0,0 +1,115 @@
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+
+TOKEN_TTL    = 8 * 3600      # seconds an admin login stays valid
+MAX_FAILURES = 5             # failed attempts allowed per window ...
+FAIL_WINDOW  = 15 * 60       # ... within this many seconds
+LOCKOUT      = 15 * 60       # then logins from that client are refused this long
+GLOBAL_MAX_FAILURES = 500    # failed attempts from all clients together per window
+GLOBAL_LOCKOUT      = 5 * 60 # then logins from everyone are refused this long
+
+# Failures are counted per client address and, under this key, for all
+# clients together, so an attacker spreading guesses over many addresses
+# is still capped. The shared limit is far above anything a team of
+# admins mistyping could reach, and its lockout is short, since it locks
+# out the real admins too.
+ALL_CLIENTS = "*"
+
+# Signing key for admin tokens and check-in links. TEAMUGLY_SECRET_KEY
+# wins; otherwise app.py calls set_secret() at startup with the key stored
+# in the database, so tokens and links survive restarts and are accepted
+# by every worker. The random fallback only covers code run without that.
+SECRET = (os.getenv("TEAMUGLY_SECRET_KEY") or secrets.token_hex(32)).encode()
+
+
+def set_secret(stored):
+    global SECRET
+    if not os.getenv("TEAMUGLY_SECRET_KEY"):
+        SECRET = stored.encode()
+
+
+_salt = b""
+_hash = b""
+_failures = {}
+_lock = threading.Lock()
+
+
+# ---------- PASSWORD ----------
+def hash_password(password, salt):
+    return hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, 200_000)
+
+
+def set_password(password):
+    # Only the salted hash is kept in memory.
+    global _salt, _hash
+    _salt = os.urandom(16)
+    _hash = hash_password(password, _salt)
+
+
+def check_password(password):
+    return hmac.compare_digest(hash_password(password or "", _salt), _hash)
+
+
+# ---------- LOCKOUT ----------
+def locked_for(key):
+    # Seconds remaining on a lockout for this client, or 0.
+    with _lock:
+        entry = _failures.get(key)
+        if not entry:
+            return 0
+        return max(0, int(entry[2] - time.monotonic()))
+
+
+def record_failure(key, limit=MAX_FAILURES, lockout=LOCKOUT):
+    now = time.monotonic()
+    with _lock:
+        count, first, until = _failures.get(key, (0, now, 0))
+        if now - first > FAIL_WINDOW:
+            count, first = 0, now
+        count += 1
+        if count >= limit:
+            until = now + lockout
+            count, first = 0, now
+        _failures[key] = (count, first, until)
+
+
+def clear_failures(key):
+    with _lock:
+        _failures.pop(key, None)
+
+
+# ---------- TOKENS ----------
+def sign(payload):
+    return hmac.new(SECRET, payload.encode(), hashlib.sha256).hexdigest()
+
+
+def issue_token():
+    payload = f"{int(time.time()) + TOKEN_TTL}.{secrets.token_hex(8)}"
+    return f"{payload}.{sign(payload)}"
+
+
+def verify_token(token):
+    if not token:
+        return False
+    payload, _, sig = token.rpartition(".")
+    if not hmac.compare_digest(sign(payload), sig):
+        return False
+    expires = payload.split(".", 1)[0]
+    return expires.isdigit() and int(expires) > time.time()
+
+
+def login(password, client_key):
+    # Returns (token, message); token is None when the login is refused.
+    wait = max(locked_for(client_key), locked_for(ALL_CLIENTS))
+    if wait:
+        return None, f"Too many failed attempts. Try again in {wait // 60 + 1} minutes."
+    if not check_password(password):
+        record_failure(client_key)
+        record_failure(ALL_CLIENTS, GLOBAL_MAX_FAILURES, GLOBAL_LOCKOUT)
+        return None, "Incorrect password."
+    clear_failures(client_key)
+    return issue_token(), ""
@@ -0,0 +1,205 @@
+import json
+import smtplib
+
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+import async_db
+import email_utils
+import ratelimit
+import waitlist
+from database import (
+    OCCURRENCE,
+    catalog_version,
+    get_ride_details,
+    get_ride_route,
+    list_ride_details,
+    roster_compact,
+    roster_version,
+)
+
+# Small JSON API next to the Shiny app, for phone shortcuts and scripts
+# that just want to list rides or sign up without opening a session.
+# Reads are served from bodies cached per data version (the counters in
+# meta that triggers bump on every change), with ETags so an unchanged
+# poll costs one meta lookup and a 304.
+
+# key -> (version, body)
+_cache = {}
+
+
+def dumps(data):
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+
+
+def cached(key, version, build):
+    hit = _cache.get(key)
+    if hit and hit[0] == version:
+        return hit[1]
+    body = build()
+    if body is not None:
+        _cache[key] = (version, body)
+    return body
+
+
+def etag_response(request, etag, body_fn):
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    body = body_fn()
+    if body is None:
+        return JSONResponse({"error": "not found"}, status_code=404)
+    return Response(body, media_type="application/json", headers=headers)
+
+
+def error(message, status_code=400):
+    return JSONResponse({"error": message}, status_code=status_code)
+
+
+# ---------- READS ----------
+# Plain endpoints, like the calendar feeds: Starlette runs them on its
+# thread pool so the SQLite reads stay off the event loop.
+def ride_json(ride_id, name, date, time, loc, route):
+    return {"id": ride_id, "name": name, "date": date, "time": time,
+            "meeting_point": loc, "route": route,
+            "calendar": f"/calendar/ride/{ride_id}.ics"}
+
+
+def build_rides():
+    return dumps({"rides": [ride_json(*r) for r in list_ride_details()]})
+
+
+def build_ride(ride_id):
+    details = get_ride_details(ride_id)
+    if not details:
+        return None
+    data = ride_json(ride_id, *details)
+    stats = get_ride_route(ride_id)
+    if stats:
+        data["distance_m"], data["elevation_gain_m"] = round(stats[0] or 0), round(stats[1] or 0)
+    return dumps(data)
+
+
+def build_roster():
+    return [{"id": ride_id, "name": name, "date": date, "riders": riders}
+            for ride_id, name, date, riders in roster_compact().by_ride()]
+
+
+def rides(request):
+    version = catalog_version()
+    return etag_response(request, f'"rides-v{version}"',
+                         lambda: cached("rides", version, build_rides))
+
+
+def ride(request):
+    ride_id = request.path_params["ride_id"]
+    ride_id = int(ride_id) if ride_id.isdigit() else ride_id
+    version = catalog_version()
+    return etag_response(request, f'"ride-{ride_id}-v{version}"',
+                         lambda: cached(("ride", ride_id), version, lambda: build_ride(ride_id)))
+
+
+def roster(request):
+    # Version covers both signups and rides (a renamed or deleted ride).
+    version = (roster_version(), catalog_version())
+    ride_id = request.query_params.get("ride_id", "")
+    if ride_id and not ride_id.isdigit():
+        return error("ride_id must be a number")
+
+    def body():
+        rows = cached("roster", version, build_roster)
+        if not ride_id:
+            return dumps({"rides": rows})
+        match = [r for r in rows if r["id"] == int(ride_id)]
+        return dumps(match[0]) if match else None
+
+    return etag_response(request, f'"roster-{ride_id or "all"}-v{version[0]}.{version[1]}"', body)
+
+
+async def rider_rides(request):
+    # ?q= a confirmation code, which shows just that signup, or an email
+    # address, whose rides are mailed to it (202, the same answer whether
+    # or not it has any). Not cached by ETag: database.my_rides keeps its
+    # own short per-code cache.
+    query = request.query_params.get("q", "").strip()
+    if not query:
+        return error("q (email or confirmation code) is required")
+    if not ratelimit.allow_request("lookup", request):
+        return error("too many lookups, try again shortly", 429)
+    if "@" in query:
+        if not email_utils.SMTP_HOST:
+            return error("email lookups are not available, use a confirmation code", 503)
+        try:
+            await async_db.run(email_utils.email_my_rides, query)
+        except (OSError, smtplib.SMTPException):
+            return error("could not send email, try again later", 503)
+        return JSONResponse({"emailed": True}, status_code=202,
+                            headers={"Cache-Control": "no-store"})
+    rows = await async_db.my_rides(query)
+    if rows is None:
+        return error("confirmation code not found", 404)
+    return JSONResponse({"rides": [
+        dict(ride_json(ride_id, name, date, time, loc, None),
+             confirmation_code=code, waitlisted=status == "WAITLISTED")
+        for code, status, ride_id, name, date, time, loc in rows
+    ]}, headers={"Cache-Control": "no-store"})
+
+
+# ---------- WRITES ----------
+async def read_json(request):
+    try:
+        data = await request.json()
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+async def api_signup(request):
+    data = await read_json(request)
+    if data is None:
+        return error("expected a JSON object")
+    ride_id, name = data.get("ride_id"), str(data.get("full_name") or "").strip()
+    # ride_id is a number, or an occurrence key ("s3-2026-05-02") for a
+    # series date nobody has signed up for yet.
+    if not (isinstance(ride_id, int) or OCCURRENCE.match(str(ride_id))) or not name:
+        return error("ride_id and full_name are required")
+    key = ratelimit.signup_key(ride_id, name)
+    code = ratelimit.recent_signups.get(key)
+    if code:
+        ratelimit.rejected["signup_duplicate"] += 1
+    else:
+        if not ratelimit.allow_request("signup", request):
+            return error("too many signups, try again shortly", 429)
+        code = await async_db.signup(ride_id, name)
+        if code is None:
+            return error("ride not found", 404)
+        ratelimit.recent_signups.put(key, code)
+    # waitlist_position is null when the rider got a spot on the roster.
+    return JSONResponse({"ride_id": ride_id, "confirmation_code": code,
+                         "waitlist_position": await async_db.waitlist_position(code)},
+                        status_code=201)
+
+
+async def api_cancel(request):
+    data = await read_json(request)
+    if data is None:
+        return error("expected a JSON object")
+    code = str(data.get("confirmation_code") or "").strip()
+    if not code:
+        return error("confirmation_code is required")
+    if not ratelimit.allow_request("cancel", request):
+        return error("too many attempts, try again in a minute", 429)
+    if not await async_db.cancel_signup(code):
+        return error("confirmation code not found", 404)
+    waitlist.wake()
+    return JSONResponse({"cancelled": True})
+
+
+routes = [
+    Route("/api/rides", rides),
+    Route("/api/rides/{ride_id}", ride),
+    Route("/api/roster", roster),
+    Route("/api/my-rides", rider_rides),
+    Route("/api/signup", api_signup, methods=["POST"]),
+    Route("/api/cancel", api_cancel, methods=["POST"]),
+]
@@ -1,54 +1,107 @@
-import base64
+import asyncio
 import csv
+import datetime
 import os
+import smtplib
 import urllib.parse
+
 import pandas as pd
 from shiny import App, ui, render, reactive
+from starlette.applications import Starlette
+from starlette.responses import FileResponse
+from starlette.routing import Mount, Route
 
-from database import (
-    init_db,
+from database import init_db, email_key, replay_journal, secret_key, SERIES_WEEKS
+from async_db import (
+    run as run_db,
     create_ride,
+    create_series,
+    list_series,
+    end_series,
+    change_ride,
     list_rides,
     get_ride_details,
     signup,
     cancel_signup,
-    roster,
-    delete_ride
+    waitlist_position,
+    ride_spots,
+    roster_compact,
+    delete_ride,
+    get_ride_route,
+    list_places,
+    season_stats,
+    my_rides
 )
+from ride_import import import_file
+import api
+import ical
+import checkin
+from gpx import attach_gpx, route_svg
+from geo import nearest_rides, rides_near, METERS_PER_MILE
+import ratelimit
+import admin_auth
+import sessions
+import sqlprofile
+import migrate_schema
+import maintenance
+import notify
+import waitlist
+import reminders
+import email_utils
+from email_utils import email_my_rides
 
 init_db()
-
-ADMIN_PASS  = "passwordmakeitsocomplicated!"
+admin_auth.set_secret(secret_key())
+restored = replay_journal()
+if any(restored):
+    print(f"journal: restored {restored[0]} signups and {restored[1]} cancellations")
+migrate_schema.start_background()
+maintenance.start_background()
+waitlist.start_background()
+reminders.start_background()
+
+admin_auth.set_password(os.getenv("TEAMUGLY_ADMIN_PASS", "passwordmakeitsocomplicated!"))
 TEAM_LINK    = "https://tinyurl.com/TeamUglyRides"
 BIKEMS_LINK  = "https://events.nationalmssociety.org/teams/TeamUgly"
 MAILING_CSV  = "contacts.csv"
 
+WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
 NAVY   = "#002D5C"
 BLUE   = "#0078BF"
 ORANGE = "#F47920"
 WHITE  = "#FFFFFF"
 
-# ---------- ENCODE TEAM PHOTO ----------
-def encode_image(path):
-    with open(path, "rb") as f:
-        data = base64.b64encode(f.read()).decode("utf-8")
-    return f"data:image/png;base64,{data}"
+# ---------- TEAM PHOTO ----------
+# Served as a cacheable file rather than inlined as base64, which put the
+# 2 MB photo into every page four times (once per tab sidebar).
+TEAM_PHOTO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "team_photo.png")
+team_photo_src = "team_photo.png"
+
 
-team_photo_src = encode_image("team_photo.png")
+def team_photo(request):
+    return FileResponse(TEAM_PHOTO, headers={"Cache-Control": "public, max-age=86400"})
 
 # ---------- MAILING LIST HELPERS ----------
 def load_contacts():
     if not os.path.exists(MAILING_CSV):
         return []
-    contacts = []
+    # One contact per email key (case, spacing and, with FOLD_PLUS, +tags
+    # ignored), so an address listed twice gets one message. The first
+    # row's address is kept; a first name comes from any row that has one.
+    contacts = {}
     with open(MAILING_CSV, newline="", encoding="utf-8") as f:
         reader = csv.DictReader(f)
         for row in reader:
             email = (row.get("Email") or row.get("email") or row.get("EMAIL") or "").strip()
             first = (row.get("First Name") or row.get("first name") or row.get("first") or "").strip()
-            if email:
-                contacts.append({"email": email, "first": first})
-    return contacts
+            key = email_key(email)
+            if key is None:
+                continue
+            contact = contacts.setdefault(key, {"email": email, "first": first})
+            if not contact["first"]:
+                contact["first"] = first
+    return list(contacts.values())
 
 
 def build_gmail_url(emails, subject, body):
@@ -74,21 +127,10 @@ def build_notify_urls(ride_name, ride_date, ride_time, ride_loc, ride_route):
     if not contacts:
         return None, None, None
     emails  = [c["email"] for c in contacts]
-    subject = f"Team Ugly Training Ride: {ride_name} on {ride_date}"
-    body = (
-        f"Hey Team Ugly!\n\n"
-        f"A training ride has been posted:\n\n"
-        f"  Ride:          {ride_name}\n"
-        f"  Date:          {ride_date}\n"
-        f"  Time:          {ride_time}\n"
-        f"  Meeting Point: {ride_loc}\n"
-        f"  GPS Route:     {ride_route}\n\n"
-        f"Sign up for the ride at:\n"
-        f"{TEAM_LINK}\n\n"
-        f"Not yet on Team Ugly for Bike MS? Join us here:\n"
-        f"{BIKEMS_LINK}\n\n"
-        f"See you out there!\n— Team Ugly"
-    )
+    context = notify.ride_context((ride_name, ride_date, ride_time, ride_loc, ride_route),
+                                  TEAM_LINK, BIKEMS_LINK)
+    subject = notify.render_subject(context)
+    body    = notify.render_text(context).rstrip()
     return (
         build_gmail_url(emails, subject, body),
         build_mailto_url(emails, subject, body),
@@ -146,6 +188,14 @@ def notify_panel(gmail_url, mailto_url, email_str):
                     "font-weight:700; font-size:15px; cursor:pointer; margin-bottom:10px;"
                 )
             ),
+            ui.download_button(
+                "notify_mbox", "Download Personalized Emails (.mbox)",
+                style=(
+                    f"width:100%; background:{BLUE}; color:{WHITE}; border:none; "
+                    "padding:12px; border-radius:5px; "
+                    "font-weight:700; font-size:15px; margin-bottom:10px;"
+                )
+            ),
             ui.div(
                 ui.p("Or copy manually:", style="color:#aad4f0; font-size:12px; margin:4px 0;"),
                 ui.tags.textarea(
@@ -408,7 +458,17 @@ app_ui = ui.page_fluid(
 
     # Viewport meta tag for proper mobile scaling
     ui.tags.head(
-        ui.tags.meta(name="viewport", content="width=device-width, initial-scale=1.0")
+        ui.tags.meta(name="viewport", content="width=device-width, initial-scale=1.0"),
+        ui.tags.script("""
+            $(document).on('change', '#near', function() {
+                if (this.value === '__me__' && navigator.geolocation) {
+                    navigator.geolocation.getCurrentPosition(function(p) {
+                        Shiny.setInputValue('my_location', [p.coords.latitude, p.coords.longitude]);
+                    });
+                }
+            });
+        """),
+        ui.tags.script(sessions.activity_js)
     ),
 
     global_css,
@@ -420,7 +480,13 @@ app_ui = ui.page_fluid(
         ui.nav_panel(
             "Sign Up",
             with_sidebar(
+                ui.output_ui("near_filter"),
                 ui.output_ui("ride_list"),
+                ui.p(
+                    ui.a("Subscribe to the season calendar", href="calendar/season.ics",
+                         style=f"color:{ORANGE}; font-size:13px;"),
+                    style="margin:6px 0 0 0;"
+                ),
                 ui.output_ui("ride_details"),
                 ui.input_text("name", "Full Name"),
                 ui.input_action_button(
@@ -448,6 +514,21 @@ app_ui = ui.page_fluid(
             )
         ),
 
+        # ---- MY RIDES ----
+        ui.nav_panel(
+            "My Rides",
+            with_sidebar(
+                ui.input_text("my_rides_query", "Email or Confirmation Number"),
+                ui.input_action_button(
+                    "my_rides_btn", "Find My Rides",
+                    style=f"background:{BLUE}; color:{WHITE}; border:none; padding:13px 20px; "
+                          "border-radius:6px; width:100%; font-weight:700; font-size:16px; "
+                          "cursor:pointer; margin-top:10px; display:block;"
+                ),
+                ui.output_ui("my_rides_list")
+            )
+        ),
+
         # ---- ROSTER ----
         ui.nav_panel(
             "Roster",
@@ -463,7 +544,7 @@ app_ui = ui.page_fluid(
         ui.nav_panel(
             "Admin",
             with_sidebar(
-                ui.input_password("admin_pass", "Password"),
+                ui.output_ui("admin_login"),
                 ui.output_ui("admin_panel")
             )
         )
@@ -477,24 +558,94 @@ def server(input, output, session):
     signup_msg_val    = reactive.Value("")
     cancel_msg_val    = reactive.Value("")
     admin_msg_val     = reactive.Value("")
+    import_msg_val    = reactive.Value("")
     delete_msg_val    = reactive.Value("")
-    notify_gmail_val  = reactive.Value("")
-    notify_mailto_val = reactive.Value("")
-    notify_emails_val = reactive.Value("")
+    change_msg_val    = reactive.Value("")
+    series_msg_val    = reactive.Value("")
+    my_rides_val      = reactive.Value("")
+    gpx_msg_val       = reactive.Value("")
+    admin_token       = reactive.Value("")
+    login_msg_val     = reactive.Value("")
+    notify_key_val    = reactive.Value("")
+
+    sessions.track(session, [
+        signup_msg_val, cancel_msg_val, admin_msg_val, import_msg_val,
+        delete_msg_val, gpx_msg_val, admin_token, login_msg_val, notify_key_val,
+        change_msg_val, series_msg_val, my_rides_val,
+    ])
+
+    def is_admin():
+        return admin_auth.verify_token(admin_token.get())
+
+    @reactive.effect
+    @reactive.event(input.last_active)
+    def _touch():
+        sessions.touch(session.id)
+
+    # ---- NEAR FILTER ----
+    @output
+    @render.ui
+    async def near_filter():
+        places = await list_places()
+        if not places:
+            return ui.div()
+        return ui.div(
+            ui.input_select(
+                "near",
+                "Rides Near",
+                {"": "Anywhere", "__me__": "My location",
+                 **{f"{lat},{lon}": name for name, lat, lon in places}}
+            ),
+            ui.input_select(
+                "near_miles",
+                "Within",
+                {"5": "5 miles", "10": "10 miles", "25": "25 miles", "50": "50 miles",
+                 "closest5": "Closest 5 rides", "closest10": "Closest 10 rides"},
+                selected="25"
+            )
+        )
+
+    def near_origin():
+        near = input.near() if "near" in input else ""
+        if not near:
+            return None
+        if near == "__me__":
+            if "my_location" not in input or not input.my_location():
+                return "pending"
+            return tuple(input.my_location())
+        lat, lon = near.split(",")
+        return float(lat), float(lon)
 
     # ---- RIDE LIST ----
     @output
     @render.ui
-    def ride_list():
-        rides = list_rides()
-        if not rides:
-            return ui.p("No rides available.", style="color:#aad4f0;")
+    async def ride_list():
+        origin = near_origin()
+        if origin == "pending":
+            return ui.p("Waiting for your location…", style="color:#aad4f0;")
+        if origin:
+            within = input.near_miles()
+            if within.startswith("closest"):
+                hits = await run_db(nearest_rides, origin[0], origin[1], int(within[7:]))
+                if not hits:
+                    return ui.p("No rides have a meeting point on the map yet.", style="color:#aad4f0;")
+            else:
+                miles = float(within)
+                hits = await run_db(rides_near, origin[0], origin[1], miles * METERS_PER_MILE)
+                if not hits:
+                    return ui.p(f"No rides within {miles:g} miles.", style="color:#aad4f0;")
+            choices = {str(h[1]): f"{h[2]} — {h[3]} ({h[0] / METERS_PER_MILE:.1f} mi)" for h in hits}
+        else:
+            rides = await list_rides()
+            if not rides:
+                return ui.p("No rides available.", style="color:#aad4f0;")
+            choices = {str(r[0]): f"{r[1]} — {r[2]}" for r in rides}
         return ui.div(
             ui.input_select(
                 "ride_select",
                 "Select Ride",
-                {str(r[0]): f"{r[1]} — {r[2]}" for r in rides},
-                size=min(len(rides), 8),
+                choices,
+                size=min(len(choices), 8),
                 selectize=False
             ),
             style=(
@@ -507,24 +658,43 @@ def server(input, output, session):
     # ---- RIDE DETAILS ----
     @output
     @render.ui
-    def ride_details():
+    async def ride_details():
         if "ride_select" not in input:
             return ui.p("Select a ride.", style="color:#aad4f0;")
         ride_id = input.ride_select()
         if not ride_id:
             return ui.p("Select a ride.", style="color:#aad4f0;")
-        details = get_ride_details(ride_id)
+        details = await get_ride_details(ride_id)
         if not details:
             return ui.p("No details.", style="color:#aad4f0;")
         name, date, time, loc, route = details
+        route_info = await get_ride_route(ride_id)
+        capacity, riders, waiting = await ride_spots(ride_id)
         return ui.div(
             ui.h4(name, style=f"color:{ORANGE}; margin-bottom:6px; font-size:1rem;"),
             ui.p(f"Date: {date}",         style=f"color:{WHITE}; margin:4px 0;"),
             ui.p(f"Time: {time}",         style=f"color:{WHITE}; margin:4px 0;"),
             ui.p(f"Meeting Point: {loc}", style=f"color:{WHITE}; margin:4px 0;"),
+            ui.p(
+                f"Distance: {route_info[0] / 1609.344:.1f} mi  ·  "
+                f"Climbing: {route_info[1] * 3.28084:,.0f} ft",
+                style=f"color:{WHITE}; margin:4px 0;"
+            ) if route_info else None,
+            ui.div(ui.HTML(route_svg(route_info[3])), style=f"color:{ORANGE}; margin:6px 0;")
+            if route_info and route_info[3] else None,
+            ui.p(
+                f"Spots: {riders} of {capacity} taken"
+                + (f"  ·  {waiting} on the waitlist" if waiting else ""),
+                style=f"color:{WHITE}; margin:4px 0;"
+            ) if capacity is not None else None,
             ui.a("View GPS Route", href=route, target="_blank",
                  style=f"color:{ORANGE}; font-weight:bold; font-size:15px;")
             if route else ui.p("No GPS link.", style="color:#aad4f0;"),
+            ui.p(
+                ui.a("Add to Calendar", href=f"calendar/ride/{ride_id}.ics",
+                     style=f"color:{ORANGE}; font-size:14px;"),
+                style="margin:8px 0 0 0;"
+            ),
             style=(
                 f"background:rgba(0,120,191,0.15); border-left:4px solid {BLUE}; "
                 "padding:12px 14px; border-radius:6px; margin:10px 0;"
@@ -534,7 +704,7 @@ def server(input, output, session):
     # ---- SIGNUP ----
     @reactive.effect
     @reactive.event(input.signup_btn)
-    def do_signup():
+    async def do_signup():
         if "ride_select" not in input:
             signup_msg_val.set("Select a ride.")
             return
@@ -546,8 +716,26 @@ def server(input, output, session):
         if not name:
             signup_msg_val.set("Enter your name.")
             return
-        code = signup(ride_id, name)
-        signup_msg_val.set(f"Confirmed! Your confirmation number is: {code}")
+        key = ratelimit.signup_key(ride_id, name)
+        code = ratelimit.recent_signups.get(key)
+        if code:
+            ratelimit.rejected["signup_duplicate"] += 1
+        else:
+            if not ratelimit.allow_signup(session):
+                signup_msg_val.set("Too many signups — please wait a moment and try again.")
+                return
+            code = await signup(ride_id, name)
+            if code is None:
+                signup_msg_val.set("That ride is no longer available — please pick another.")
+                return
+            ratelimit.recent_signups.put(key, code)
+        position = await waitlist_position(code)
+        if position:
+            signup_msg_val.set(f"This ride is full — you are #{position} on the waitlist and will be "
+                               f"moved onto the roster if a spot opens. "
+                               f"Your confirmation number is: {code}")
+        else:
+            signup_msg_val.set(f"Confirmed! Your confirmation number is: {code}")
 
     @output
     @render.ui
@@ -579,12 +767,17 @@ def server(input, output, session):
     # ---- CANCEL ----
     @reactive.effect
     @reactive.event(input.cancel_btn)
-    def do_cancel():
+    async def do_cancel():
         code = input.cancel_code()
         if not code:
             cancel_msg_val.set("Enter confirmation number.")
             return
-        removed = cancel_signup(code)
+        if not ratelimit.allow_cancel(session):
+            cancel_msg_val.set("Too many attempts — please wait a minute and try again.")
+            return
+        removed = await cancel_signup(code)
+        if removed:
+            waitlist.wake()
         cancel_msg_val.set("Code not found." if removed == 0 else "You have been removed from the ride.")
 
     @output
@@ -592,16 +785,99 @@ def server(input, output, session):
     def cancel_msg():
         return cancel_msg_val.get()
 
+    # ---- MY RIDES ----
+    @reactive.effect
+    @reactive.event(input.my_rides_btn)
+    async def do_my_rides():
+        query = input.my_rides_query().strip()
+        if not query:
+            my_rides_val.set("Enter your email or a confirmation number.")
+            return
+        if not ratelimit.allow_lookup(session):
+            my_rides_val.set("Too many lookups — please wait a moment and try again.")
+            return
+        if "@" in query:
+            if not email_utils.SMTP_HOST:
+                my_rides_val.set("Email lookups aren't available — enter a confirmation number instead.")
+                return
+            try:
+                await run_db(email_my_rides, query)
+            except (OSError, smtplib.SMTPException):
+                my_rides_val.set("Couldn't send email right now — please try again later.")
+                return
+            # The same answer whether or not the address has rides, so the
+            # page never tells anyone who is signed up.
+            my_rides_val.set("If that address has upcoming rides, we've emailed them "
+                             "to it, with their confirmation numbers.")
+            return
+        rows = await my_rides(query)
+        if rows is None:
+            my_rides_val.set("Code not found.")
+        elif not rows:
+            my_rides_val.set("No upcoming rides.")
+        else:
+            my_rides_val.set(rows)
+
+    @output
+    @render.ui
+    def my_rides_list():
+        rows = my_rides_val.get()
+        if not rows:
+            return ui.div()
+        if isinstance(rows, str):
+            return ui.p(rows, style="margin-top:10px;")
+        return ui.div(*[
+            ui.div(
+                ui.p(ui.strong(name), f" — {date} {time}",
+                     style=f"color:{WHITE}; margin:0 0 4px 0;"),
+                ui.p(loc or "", style="color:#aad4f0; margin:0 0 4px 0;"),
+                ui.p(f"Confirmation number: {code}"
+                     + (" (waitlisted)" if status == "WAITLISTED" else ""),
+                     style="font-size:13px; margin:0;"),
+                style=(
+                    f"background:rgba(0,120,191,0.15); border-left:4px solid {BLUE}; "
+                    "padding:10px 14px; border-radius:6px; margin:10px 0;"
+                )
+            )
+            for code, status, ride_id, name, date, time, loc in rows
+        ])
+
     # ---- ADMIN CREATE ----
     @reactive.effect
     @reactive.event(input.create_btn)
-    def do_create():
+    async def do_create():
+        if not is_admin():
+            return
         name = input.ride_name()
         if not name:
             admin_msg_val.set("Enter a ride name.")
             return
-        create_ride(name, str(input.ride_date()), input.ride_time(),
-                    input.ride_loc(), input.ride_route())
+        try:
+            lat = float(input.ride_lat()) if input.ride_lat() else None
+            lon = float(input.ride_lon()) if input.ride_lon() else None
+        except ValueError:
+            admin_msg_val.set("Latitude and longitude must be numbers.")
+            return
+        capacity = input.ride_capacity().strip()
+        if capacity and not capacity.isdigit():
+            admin_msg_val.set("Max riders must be a whole number.")
+            return
+        capacity = int(capacity) if capacity else None
+        if input.ride_weekly():
+            until = input.ride_until().strip()
+            try:
+                if until:
+                    until = datetime.date.fromisoformat(until).isoformat()
+            except ValueError:
+                admin_msg_val.set("Repeat until must be a date like 2026-09-26.")
+                return
+            await create_series(name, str(input.ride_date()), input.ride_time(),
+                                input.ride_loc(), input.ride_route(), lat, lon, capacity, until)
+            admin_msg_val.set(f"Weekly ride '{name}' created. Dates are listed "
+                              f"{SERIES_WEEKS} weeks ahead.")
+            return
+        await create_ride(name, str(input.ride_date()), input.ride_time(),
+                          input.ride_loc(), input.ride_route(), lat, lon, capacity)
         admin_msg_val.set(f"Ride '{name}' created successfully.")
 
     @output
@@ -609,14 +885,76 @@ def server(input, output, session):
     def admin_msg():
         return admin_msg_val.get()
 
-    # ---- ADMIN PANEL (server-side password check) ----
+    # ---- ADMIN IMPORT ----
+    @reactive.effect
+    @reactive.event(input.import_btn)
+    async def do_import():
+        if not is_admin():
+            return
+        files = input.import_file()
+        if not files:
+            import_msg_val.set("Choose a CSV or .ics file.")
+            return
+        f = files[0]
+        inserted, messages = await run_db(import_file, f["name"], f["datapath"])
+        import_msg_val.set("\n".join([f"Imported {inserted} rides."] + messages))
+
+    @output
+    @render.text
+    def import_msg():
+        return import_msg_val.get()
+
+    # ---- ADMIN LOGIN ----
+    # The password box is only read when Log In is clicked, so typing in it
+    # never re-renders the admin panel or re-runs its ride queries.
+    @reactive.effect
+    @reactive.event(input.admin_login_btn)
+    async def do_admin_login():
+        token, msg = await asyncio.to_thread(
+            admin_auth.login, input.admin_pass(), ratelimit.client_ip(session)
+        )
+        login_msg_val.set(msg)
+        if token:
+            admin_token.set(token)
+
+    @reactive.effect
+    @reactive.event(input.admin_logout_btn)
+    def do_admin_logout():
+        admin_token.set("")
+
+    @output
+    @render.ui
+    def admin_login():
+        if is_admin():
+            return ui.input_action_button(
+                "admin_logout_btn", "Log Out",
+                style="background:#555; color:white; border:none; padding:8px 16px; "
+                      "border-radius:6px; font-weight:600; font-size:14px; cursor:pointer;"
+            )
+        return ui.div(
+            ui.input_password("admin_pass", "Password"),
+            ui.input_action_button(
+                "admin_login_btn", "Log In",
+                style=f"background:{BLUE}; color:{WHITE}; border:none; padding:13px 20px; "
+                      "border-radius:6px; width:100%; font-weight:700; font-size:16px; "
+                      "cursor:pointer; margin-top:10px; display:block;"
+            ),
+            ui.output_ui("admin_login_msg")
+        )
+
+    @output
+    @render.ui
+    def admin_login_msg():
+        msg = login_msg_val.get()
+        if not msg:
+            return ui.div()
+        return ui.p(msg, style="color:#ff6b6b; margin-top:8px;")
+
+    # ---- ADMIN PANEL ----
     @output
     @render.ui
     def admin_panel():
-        pw = input.admin_pass()
-        if pw != ADMIN_PASS:
-            if pw:
-                return ui.p("Incorrect password.", style="color:#ff6b6b; margin-top:8px;")
+        if not is_admin():
             return ui.div()
 
         btn_style = (
@@ -630,7 +968,12 @@ def server(input, output, session):
             ui.input_date("ride_date", "Ride Date"),
             ui.input_text("ride_time", "Start Time"),
             ui.input_text("ride_loc", "Meeting Point"),
+            ui.input_text("ride_lat", "Latitude (optional, remembered for this meeting point)"),
+            ui.input_text("ride_lon", "Longitude (optional)"),
             ui.input_text("ride_route", "GPS Link"),
+            ui.input_text("ride_capacity", "Max Riders (optional, later signups join a waitlist)"),
+            ui.input_checkbox("ride_weekly", "Repeat every week on this weekday"),
+            ui.input_text("ride_until", "Repeat until (YYYY-MM-DD, optional)"),
             ui.input_action_button(
                 "create_btn", "Create Ride",
                 style=f"background:{BLUE}; color:{WHITE}; " + btn_style
@@ -639,6 +982,20 @@ def server(input, output, session):
 
             ui.hr(),
 
+            # -- Import Season --
+            ui.h4("Import Season", style=f"color:{ORANGE};"),
+            ui.p("Upload a CSV (Ride Name, Date, Start Time, Meeting Point, GPS Link) "
+                 "or an .ics calendar. Rides matching an existing name and date are skipped.",
+                 style="color:#aad4f0; font-size:13px; margin-bottom:10px;"),
+            ui.input_file("import_file", "Ride File", accept=[".csv", ".ics"]),
+            ui.input_action_button(
+                "import_btn", "Import Rides",
+                style=f"background:{BLUE}; color:{WHITE}; " + btn_style
+            ),
+            ui.output_text_verbatim("import_msg"),
+
+            ui.hr(),
+
             # -- Notify Team --
             ui.h4("Notify Team", style=f"color:{ORANGE};"),
             ui.p("Select any ride and notify teammates.",
@@ -652,6 +1009,45 @@ def server(input, output, session):
 
             ui.hr(),
 
+            # -- Attach GPX --
+            ui.h4("Attach GPX Route", style=f"color:{ORANGE};"),
+            ui.output_ui("gpx_ride_select"),
+            ui.input_file("gpx_file", "GPX File", accept=[".gpx"]),
+            ui.input_action_button(
+                "gpx_btn", "Attach Route",
+                style=f"background:{BLUE}; color:{WHITE}; " + btn_style
+            ),
+            ui.output_text("gpx_msg"),
+
+            ui.hr(),
+
+            # -- Trailhead Check-In --
+            ui.h4("Trailhead Check-In", style=f"color:{ORANGE};"),
+            ui.p("Open this link on the ride leader's phone before heading out. "
+                 "Check-ins work without signal and sync when it returns.",
+                 style="color:#aad4f0; font-size:13px; margin-bottom:10px;"),
+            ui.output_ui("checkin_ride_select"),
+            ui.output_ui("checkin_link"),
+
+            ui.hr(),
+
+            # -- Change One Ride --
+            ui.h4("Change One Ride", style=f"color:{ORANGE};"),
+            ui.p("Changes a single date, such as one week of a weekly ride. "
+                 "Blank fields stay as they are.",
+                 style="color:#aad4f0; font-size:13px; margin-bottom:10px;"),
+            ui.output_ui("change_ride_list"),
+            ui.input_text("change_time", "New Start Time"),
+            ui.input_text("change_loc", "New Meeting Point"),
+            ui.input_text("change_route", "New GPS Link"),
+            ui.input_action_button(
+                "change_btn", "Save Changes",
+                style=f"background:{BLUE}; color:{WHITE}; " + btn_style
+            ),
+            ui.output_text("change_msg"),
+
+            ui.hr(),
+
             # -- Delete Ride --
             ui.h4("Delete Ride", style=f"color:{ORANGE};"),
             ui.output_ui("admin_ride_list"),
@@ -659,14 +1055,70 @@ def server(input, output, session):
                 "delete_btn", "Delete Ride",
                 style="background:#8B0000; color:white; " + btn_style
             ),
-            ui.output_text("delete_msg")
+            ui.output_text("delete_msg"),
+
+            ui.hr(),
+
+            # -- End Weekly Ride --
+            ui.h4("End Weekly Ride", style=f"color:{ORANGE};"),
+            ui.output_ui("series_list"),
+            ui.input_action_button(
+                "end_series_btn", "End Weekly Ride",
+                style="background:#8B0000; color:white; " + btn_style
+            ),
+            ui.output_text("series_msg"),
+
+            ui.hr(),
+
+            # -- Waitlist Promotions --
+            ui.h4("Waitlist Promotions", style=f"color:{ORANGE};"),
+            ui.p("Riders moved off a waitlist onto the roster. Let them know, then "
+                 "mark them notified.",
+                 style="color:#aad4f0; font-size:13px; margin-bottom:10px;"),
+            ui.output_ui("promotion_list"),
+            ui.input_action_button(
+                "promotion_done_btn", "Mark Notified",
+                style=f"background:{BLUE}; color:{WHITE}; " + btn_style
+            ),
+
+            ui.hr(),
+
+            # -- Season Stats --
+            ui.h4("Season Stats", style=f"color:{ORANGE};"),
+            ui.input_action_button(
+                "stats_refresh", "Refresh",
+                style=f"background:{BLUE}; color:{WHITE}; " + btn_style
+            ),
+            ui.output_table("stats_seasons"),
+            ui.h5("Top Riders", style=f"color:{ORANGE};"),
+            ui.output_table("stats_riders"),
+            ui.h5("Recent Weeks", style=f"color:{ORANGE};"),
+            ui.output_table("stats_weeks"),
+            ui.h5("Recent Rides", style=f"color:{ORANGE};"),
+            ui.output_table("stats_rides"),
+
+            ui.hr(),
+            ui.output_text("limit_stats"),
+            ui.output_text("session_stats"),
+            ui.output_text("storage_stats"),
+            ui.output_text_verbatim("maintenance_log"),
+            ui.div(
+                ui.download_button(
+                    "sql_profile", "SQL Profile Report",
+                    style=f"background:{BLUE}; color:{WHITE}; " + btn_style
+                ),
+                ui.input_action_button(
+                    "sql_profile_reset", "Reset SQL Profile",
+                    style=f"background:{ORANGE}; color:{WHITE}; " + btn_style
+                ),
+            ) if sqlprofile.ENABLED else None
         )
 
     # ---- NOTIFY RIDE SELECTOR ----
     @output
     @render.ui
-    def notify_ride_select():
-        rides = list_rides()
+    async def notify_ride_select():
+        rides = await list_rides()
         if not rides:
             return ui.p("No rides yet.", style="color:#aad4f0;")
         return ui.input_select(
@@ -678,26 +1130,27 @@ def server(input, output, session):
     # ---- PREPARE NOTIFICATION ----
     @reactive.effect
     @reactive.event(input.notify_btn)
-    def do_notify():
+    async def do_notify():
+        if not is_admin():
+            return
         if "notify_ride_id" not in input:
             return
         ride_id = input.notify_ride_id()
-        details = get_ride_details(ride_id)
+        details = await get_ride_details(ride_id)
         if not details:
             return
         r_name, r_date, r_time, r_loc, r_route = details
-        gmail, mailto, emails = build_notify_urls(r_name, r_date, r_time, r_loc, r_route)
-        notify_gmail_val.set(gmail or "")
-        notify_mailto_val.set(mailto or "")
-        notify_emails_val.set(emails or "")
+        gmail, mailto, emails = await run_db(build_notify_urls, r_name, r_date, r_time, r_loc, r_route)
+        notify_key_val.set(sessions.store_payload((gmail or "", mailto or "", emails or "")))
 
     # ---- NOTIFY PANEL OUTPUT ----
     @output
     @render.ui
     def notify_panel_output():
-        gmail  = notify_gmail_val.get()
-        mailto = notify_mailto_val.get()
-        emails = notify_emails_val.get()
+        payload = sessions.get_payload(notify_key_val.get())
+        if not payload:
+            return ui.div()
+        gmail, mailto, emails = payload
         if not gmail and not emails:
             return ui.div()
         return ui.div(
@@ -708,11 +1161,93 @@ def server(input, output, session):
             )
         )
 
+    # One multipart text/HTML message per contact, greeted by first name,
+    # rendered and streamed to the browser one message at a time.
+    @output
+    @render.download(filename=lambda: f"team-ugly-ride-{input.notify_ride_id()}.mbox")
+    async def notify_mbox():
+        if not is_admin() or "notify_ride_id" not in input:
+            return
+        details = await get_ride_details(input.notify_ride_id())
+        if not details:
+            return
+        contacts = await run_db(load_contacts)
+        context = notify.ride_context(details, TEAM_LINK, BIKEMS_LINK)
+        for chunk in notify.mbox_chunks(notify.render_messages(contacts, context)):
+            yield chunk
+
+    # ---- CHECK-IN LINK ----
+    @output
+    @render.ui
+    async def checkin_ride_select():
+        rides = await list_rides(series=False)
+        if not rides:
+            return ui.p("No rides yet.", style="color:#aad4f0;")
+        return ui.input_select(
+            "checkin_ride_id",
+            "Select Ride",
+            {str(r[0]): f"{r[1]} — {r[2]}" for r in rides}
+        )
+
+    @output
+    @render.ui
+    def checkin_link():
+        if not is_admin() or "checkin_ride_id" not in input or not input.checkin_ride_id():
+            return ui.div()
+        return ui.a("Open Check-In", href=checkin.checkin_link(int(input.checkin_ride_id())),
+                    target="_blank",
+                    style=f"display:block; text-align:center; background:{BLUE}; color:{WHITE}; "
+                          "padding:12px; border-radius:5px; text-decoration:none; "
+                          "font-weight:700; font-size:15px; margin-top:10px;")
+
+    # ---- GPX ROUTE ----
+    @output
+    @render.ui
+    async def gpx_ride_select():
+        rides = await list_rides()
+        if not rides:
+            return ui.p("No rides yet.", style="color:#aad4f0;")
+        return ui.input_select(
+            "gpx_ride_id",
+            "Select Ride",
+            {str(r[0]): f"{r[1]} — {r[2]}" for r in rides}
+        )
+
+    @reactive.effect
+    @reactive.event(input.gpx_btn)
+    async def do_attach_gpx():
+        if not is_admin():
+            return
+        files = input.gpx_file()
+        if "gpx_ride_id" not in input or not input.gpx_ride_id():
+            gpx_msg_val.set("Select a ride.")
+            return
+        if not files:
+            gpx_msg_val.set("Choose a GPX file.")
+            return
+        try:
+            stats = await run_db(attach_gpx, input.gpx_ride_id(), files[0]["datapath"])
+        except Exception:
+            gpx_msg_val.set("Could not read that GPX file.")
+            return
+        if not stats:
+            gpx_msg_val.set("No track points found in that file.")
+            return
+        gpx_msg_val.set(
+            f"Route attached: {stats['distance_m'] / 1609.344:.1f} mi, "
+            f"{stats['elevation_gain_m'] * 3.28084:,.0f} ft climbing."
+        )
+
+    @output
+    @render.text
+    def gpx_msg():
+        return gpx_msg_val.get()
+
     # ---- ADMIN RIDE LIST ----
     @output
     @render.ui
-    def admin_ride_list():
-        rides = list_rides()
+    async def admin_ride_list():
+        rides = await list_rides()
         if not rides:
             return ui.p("No rides.", style="color:#aad4f0;")
         return ui.input_select(
@@ -721,14 +1256,78 @@ def server(input, output, session):
             {str(r[0]): f"{r[1]} — {r[2]}" for r in rides}
         )
 
+    # ---- CHANGE ONE RIDE ----
+    @output
+    @render.ui
+    async def change_ride_list():
+        rides = await list_rides()
+        if not rides:
+            return ui.p("No rides.", style="color:#aad4f0;")
+        return ui.input_select(
+            "change_ride_select",
+            "Select Ride to Change",
+            {str(r[0]): f"{r[1]} — {r[2]}" for r in rides}
+        )
+
+    @reactive.effect
+    @reactive.event(input.change_btn)
+    async def do_change():
+        if not is_admin():
+            return
+        if "change_ride_select" not in input:
+            change_msg_val.set("Select a ride.")
+            return
+        changed = await change_ride(input.change_ride_select(), input.change_time().strip(),
+                                    input.change_loc().strip(), input.change_route().strip())
+        change_msg_val.set("Ride updated." if changed else "That ride is no longer listed.")
+
+    @output
+    @render.text
+    def change_msg():
+        return change_msg_val.get()
+
+    # ---- END WEEKLY RIDE ----
+    @output
+    @render.ui
+    async def series_list():
+        input.end_series_btn()
+        series = await list_series()
+        if not series:
+            return ui.p("No weekly rides.", style="color:#aad4f0;")
+        return ui.input_select(
+            "series_select",
+            "Select Weekly Ride to End",
+            {str(s[0]): f"{s[1]} — {WEEKDAYS[s[2]]}s from {s[4]}"
+                        + (f" to {s[5]}" if s[5] else "")
+             for s in series}
+        )
+
+    @reactive.effect
+    @reactive.event(input.end_series_btn)
+    async def do_end_series():
+        if not is_admin():
+            return
+        if "series_select" not in input:
+            series_msg_val.set("Select a weekly ride.")
+            return
+        await end_series(input.series_select())
+        series_msg_val.set("Weekly ride ended. Dates riders already signed up for stay listed.")
+
+    @output
+    @render.text
+    def series_msg():
+        return series_msg_val.get()
+
     # ---- DELETE ----
     @reactive.effect
     @reactive.event(input.delete_btn)
-    def do_delete():
+    async def do_delete():
+        if not is_admin():
+            return
         if "admin_ride_select" not in input:
             delete_msg_val.set("Select a ride.")
             return
-        delete_ride(input.admin_ride_select())
+        await delete_ride(input.admin_ride_select())
         delete_msg_val.set("Ride deleted.")
 
     @output
@@ -736,12 +1335,142 @@ def server(input, output, session):
     def delete_msg():
         return delete_msg_val.get()
 
-    # ---- ROSTER ----
+    # ---- WAITLIST PROMOTIONS ----
+    # Ids of the notices on screen, so Mark Notified only clears what the
+    # admin has actually seen.
+    promotions_val = reactive.Value([])
+    promotions_done = reactive.Value(0)
+
+    @output
+    @render.ui
+    async def promotion_list():
+        if not is_admin():
+            return None
+        promotions_done.get()
+        reactive.invalidate_later(30)
+        notices = await run_db(waitlist.pending_notices)
+        promotions_val.set([n[0] for n in notices])
+        if not notices:
+            return ui.p("No one waiting to hear.", style="color:#aad4f0;")
+        return ui.tags.ul(
+            *[ui.tags.li(f"{who} ({code}) — {ride} on {date}")
+              for _, who, code, ride, date, _ in notices],
+            style=f"color:{WHITE};"
+        )
+
+    @reactive.effect
+    @reactive.event(input.promotion_done_btn)
+    async def do_promotion_done():
+        if not is_admin():
+            return
+        ids = promotions_val.get()
+        if ids:
+            await run_db(waitlist.mark_sent, ids)
+            promotions_done.set(promotions_done.get() + 1)
+
+    # ---- SEASON STATS ----
+    # Read from the trigger-maintained stats tables, so this costs the same
+    # however many signups have piled up.
+    @reactive.calc
+    async def stats_data():
+        if not is_admin():
+            return None
+        input.stats_refresh()
+        return await season_stats()
+
+    @output
+    @render.table
+    async def stats_seasons():
+        stats = await stats_data()
+        if stats:
+            return pd.DataFrame(stats["seasons"],
+                                columns=["Season", "Weeks", "Signups", "Cancelled", "Checked In"])
+
     @output
     @render.table
-    def roster_table():
-        rows = roster()
-        return pd.DataFrame(rows, columns=["Ride", "Date", "Name"])
+    async def stats_riders():
+        stats = await stats_data()
+        if stats:
+            return pd.DataFrame(stats["riders"],
+                                columns=["Rider", "Signups", "Cancelled", "Checked In", "Last Signup"])
 
+    @output
+    @render.table
+    async def stats_weeks():
+        stats = await stats_data()
+        if stats:
+            return pd.DataFrame(stats["weeks"],
+                                columns=["Week Of", "Signups", "Cancelled", "Checked In"])
 
-app = App(app_ui, server)
\ No newline at end of file
+    @output
+    @render.table
+    async def stats_rides():
+        stats = await stats_data()
+        if stats:
+            return pd.DataFrame(stats["rides"],
+                                columns=["Ride", "Date", "Signups", "Cancelled", "Checked In"])
+
+    @output
+    @render.text
+    def limit_stats():
+        r = ratelimit.rejected
+        return (f"Blocked since restart — signups: {r['signup_session'] + r['signup_ip']}, "
+                f"cancels: {r['cancel_session'] + r['cancel_ip']}, "
+                f"lookups: {r['lookup_session'] + r['lookup_ip']}, "
+                f"duplicate taps: {r['signup_duplicate']}")
+
+    @output
+    @render.text
+    def session_stats():
+        r = sessions.report()
+        return (f"Open sessions: {r['sessions']} using ~{r['session_bytes'] / 1024:.0f} KB; "
+                f"shared notify payloads: {r['payloads']} (~{r['payload_bytes'] / 1024:.0f} KB)")
+
+    @output
+    @render.text
+    async def storage_stats():
+        return maintenance.summary(await run_db(maintenance.bloat_stats))
+
+    @output
+    @render.text
+    def maintenance_log():
+        entries = list(maintenance.history)[-8:]
+        if not entries:
+            return "No maintenance has run since restart."
+        return "\n".join(maintenance.log_line(e) for e in entries)
+
+    # The profile report goes through the admin's Shiny session, so the
+    # session token never has to appear in a URL.
+    @output
+    @render.download(filename="sql-profile.txt")
+    def sql_profile():
+        if not is_admin():
+            return
+        yield sqlprofile.report()
+
+    @reactive.effect
+    @reactive.event(input.sql_profile_reset)
+    def _reset_sql_profile():
+        if is_admin():
+            sqlprofile.reset()
+
+    # ---- ROSTER ----
+    @output
+    @render.table
+    async def roster_table():
+        rows = await roster_compact()
+        return rows.to_frame()
+
+
+shiny_app = App(app_ui, server)
+
+# The JSON API, calendar feeds and check-in pages are plain HTTP so
+# scripts, calendar apps and phones can use them without opening a Shiny
+# session; everything else falls through to Shiny.
+app = Starlette(routes=[
+    Route("/team_photo.png", team_photo),
+    *api.routes,
+    *ical.routes,
+    *checkin.routes,
+    Mount("/", app=shiny_app),
+])
\ No newline at end of file
@@ -0,0 +1,45 @@
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import database
+
+# SQLite calls run on this pool so a slow query or lock wait in one session
+# never blocks the event loop that serves every other session. The pool
+# size bounds how many connections are open at once.
+DB_WORKERS = int(os.getenv("TEAMUGLY_DB_WORKERS", "4"))
+
+_pool = ThreadPoolExecutor(max_workers=DB_WORKERS, thread_name_prefix="db")
+
+
+async def run(fn, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_pool, functools.partial(fn, *args, **kwargs))
+
+
+def awaitable(fn):
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        return await run(fn, *args, **kwargs)
+    return wrapper
+
+
+create_ride       = awaitable(database.create_ride)
+create_series     = awaitable(database.create_series)
+list_series       = awaitable(database.list_series)
+end_series        = awaitable(database.end_series)
+change_ride       = awaitable(database.change_ride)
+list_rides        = awaitable(database.list_rides)
+get_ride_details  = awaitable(database.get_ride_details)
+get_ride_route    = awaitable(database.get_ride_route)
+list_places       = awaitable(database.list_places)
+delete_ride       = awaitable(database.delete_ride)
+signup            = awaitable(database.signup)
+cancel_signup     = awaitable(database.cancel_signup)
+waitlist_position = awaitable(database.waitlist_position)
+ride_spots        = awaitable(database.ride_spots)
+my_rides          = awaitable(database.my_rides)
+roster            = awaitable(database.roster)
+roster_compact    = awaitable(database.roster_compact)
+season_stats      = awaitable(database.season_stats)
@@ -0,0 +1,364 @@
+import argparse
+import asyncio
+import datetime
+import gc
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Benchmarks for the performance work in database.py and friends. Every
+# run builds its databases from generate_data.py's seeded rows in a fresh
+# temporary directory, so numbers are repeatable for a given --seed and
+# nothing under data/ is touched:
+#
+#   python bench/run.py            # all of them
+#   python bench/run.py import     # just one
+#
+# Timings are wall clock on whatever machine runs them; compare runs on
+# the same machine, not against the numbers in commit messages.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["TEAMUGLY_DB_ENGINE"] = "file"
+
+import database
+import generate_data
+import gpx
+
+START = datetime.date(2026, 1, 3)
+
+
+# ---------- HELPERS ----------
+def fresh_db(workdir, name, rides=0, signups=0, seed=1):
+    # An init_db database at workdir/name, filled by generate_data.
+    path = os.path.join(workdir, name)
+    rng = random.Random(seed)
+    riders = generate_data.rider_pool(rng, 5_000)
+    generate_data.generate_app(path, rng, rides, signups, riders, START)
+    database.DB = path
+    return path
+
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - started
+
+
+def report(label, value):
+    print(f"  {label:50} {value}")
+
+
+# ---------- IMPORT (ride_import) ----------
+def bench_import(workdir, seed):
+    import ride_import
+
+    n = 10_000
+    rides = list(generate_data.ride_rows(random.Random(seed), n, START))
+    lines = ["Ride Name,Date,Start Time,Meeting Point,GPS Link"]
+    lines += [f'"{r[0]}",{r[1]},{r[2]},{r[3]},{r[4]}' for r in rides]
+    csv_text = "\n".join(lines)
+    ics = ["BEGIN:VCALENDAR"]
+    for r in rides:
+        day = r[1].replace("-", "")
+        ics += ["BEGIN:VEVENT", f"SUMMARY:{r[0]}", f"DTSTART;TZID=America/Chicago:{day}T070000",
+                f"LOCATION:{r[3]}", f"URL:{r[4]}", "END:VEVENT"]
+    ics_text = "\r\n".join(ics + ["END:VCALENDAR"])
+
+    fresh_db(workdir, "import-csv.sqlite", rides=200, seed=seed)
+    (inserted, _), seconds = timed(ride_import.import_rides, "season.csv", csv_text)
+    report(f"CSV import, {inserted:,} rides", f"{seconds:.2f} s ({inserted / seconds:,.0f} rides/s)")
+    (again, messages), seconds = timed(ride_import.import_rides, "season.csv", csv_text)
+    report(f"same CSV again ({len(messages):,} duplicates)", f"{seconds:.2f} s, {again} inserted")
+
+    fresh_db(workdir, "import-ics.sqlite", rides=200, seed=seed)
+    (inserted, _), seconds = timed(ride_import.import_rides, "season.ics", ics_text)
+    report(f"iCalendar import, {inserted:,} rides", f"{seconds:.2f} s ({inserted / seconds:,.0f} rides/s)")
+
+    # The old path: one create_ride() (connection + commit) per ride. Each
+    # commit waits on the disk, so a sample is enough to see the cost.
+    fresh_db(workdir, "import-one-by-one.sqlite", rides=200, seed=seed)
+    sample = rides[:200]
+    _, seconds = timed(lambda: [database.create_ride(*r[:5]) for r in sample])
+    report(f"create_ride() one by one, {len(sample):,} rides",
+           f"{seconds:.2f} s ({len(sample) / seconds:,.0f} rides/s)")
+
+
+# ---------- GPX (gpx) ----------
+def gpx_track(path, rng, points):
+    # A seeded random walk from one of generate_data's meeting points, about
+    # 5 m per step with a slowly turning heading, like a bike computer log.
+    _, lat, lon = rng.choice(generate_data.PLACES)
+    heading, ele = rng.uniform(0, 6.283), 180.0
+    with open(path, "w") as fh:
+        fh.write('<?xml version="1.0"?>\n<gpx version="1.1" xmlns="http://www.topografix.com/GPX/1/1">'
+                 "<trk><trkseg>\n")
+        for _ in range(points):
+            heading += rng.gauss(0, 0.05)
+            lat += 5 / 111_320 * math.cos(heading)
+            lon += 5 / 111_320 * math.sin(heading) / math.cos(math.radians(lat))
+            ele += rng.gauss(0, 0.3)
+            fh.write(f'<trkpt lat="{lat:.7f}" lon="{lon:.7f}"><ele>{ele:.1f}</ele></trkpt>\n')
+        fh.write("</trkseg></trk></gpx>\n")
+
+
+def python_distance(lat, lon):
+    # Point-by-point haversine, for comparison with gpx.track_distance.
+    total = 0.0
+    for i in range(1, len(lat)):
+        p1, p2 = math.radians(lat[i - 1]), math.radians(lat[i])
+        a = (math.sin((p2 - p1) / 2) ** 2 + math.cos(p1) * math.cos(p2) *
+             math.sin(math.radians(lon[i] - lon[i - 1]) / 2) ** 2)
+        total += 2 * gpx.EARTH_RADIUS_M * math.asin(math.sqrt(a))
+    return total
+
+
+def bench_gpx(workdir, seed):
+    n = 50_000
+    path = os.path.join(workdir, "track.gpx")
+    gpx_track(path, random.Random(seed), n)
+    size = os.path.getsize(path)
+
+    (lat, lon, ele), seconds = timed(gpx.parse_gpx, path)
+    report(f"parse_gpx, {len(lat):,} points ({size / 1e6:.1f} MB)", f"{seconds * 1000:.0f} ms")
+    distance, seconds = timed(gpx.track_distance, lat, lon)
+    report("track_distance (NumPy haversine)", f"{seconds * 1000:.1f} ms")
+    slow, seconds = timed(python_distance, list(lat), list(lon))
+    report("same distance, pure-Python loop", f"{seconds * 1000:.1f} ms")
+    assert abs(slow - distance) < 1e-6 * distance
+    stats, seconds = timed(gpx.route_stats, lat, lon, ele)
+    report("route_stats (distance, climb, simplify)", f"{seconds * 1000:.0f} ms")
+    kept = len(stats["polyline"]) // 8
+    report("simplified polyline", f"{kept:,} points, {len(stats['polyline']):,} bytes")
+
+    fresh_db(workdir, "gpx.sqlite", rides=10, seed=seed)
+    _, seconds = timed(gpx.attach_gpx, 1, path)
+    report("attach_gpx (parse + stats + save)", f"{seconds * 1000:.0f} ms")
+    route, seconds = timed(database.get_ride_route, 1)
+    report("get_ride_route (ride view read)", f"{seconds * 1000:.2f} ms")
+    _, seconds = timed(gpx.route_svg, route[3])
+    report("route_svg from the stored polyline", f"{seconds * 1000:.2f} ms")
+
+
+# ---------- EVENT LOOP (async_db) ----------
+async def signups_during_roster(roster, signup, ride_ids, count=30, gap=0.05):
+    # One session loads the roster view while another signs riders up
+    # every `gap` seconds. A signup's latency runs from when it was due,
+    # so time spent waiting on a blocked event loop counts.
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+
+    async def rider():
+        latencies = []
+        for i in range(count):
+            await asyncio.sleep(max(0.0, start + i * gap - loop.time()))
+            await signup(ride_ids[i % len(ride_ids)], f"Bench Rider {i}")
+            latencies.append(loop.time() - (start + i * gap))
+        return latencies
+
+    async def admin():
+        if roster is None:
+            return 0, 0.0
+        await asyncio.sleep(gap * 2)
+        began = loop.time()
+        rows = await roster()
+        return len(rows), loop.time() - began
+
+    latencies, (rows, roster_seconds) = await asyncio.gather(rider(), admin())
+    return rows, roster_seconds, sorted(latencies)
+
+
+def bench_event_loop(workdir, seed):
+    import async_db
+
+    path = fresh_db(workdir, "event-loop.sqlite", rides=2_000, signups=500_000, seed=seed)
+    ride_ids = [r[0] for r in database.list_rides(series=False)[-20:]]
+    # Flush the bulk load out of the WAL first, so the runs below time
+    # signups rather than that checkpoint.
+    con = database.connect(path)
+    con.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    con.close()
+    for i in range(5):
+        database.signup(ride_ids[i], f"Warmup Rider {i}")
+
+    async def blocking_roster():
+        return database.roster_compact()
+
+    async def blocking_signup(*args):
+        return database.signup(*args)
+
+    # The roster view's query (roster_compact) over the whole season.
+    for label, roster, signup in (("no roster load (baseline)", None, async_db.signup),
+                                  ("roster on the event loop", blocking_roster, blocking_signup),
+                                  ("roster through async_db", async_db.roster_compact,
+                                   async_db.signup)):
+        rows, roster_seconds, lat = asyncio.run(signups_during_roster(roster, signup, ride_ids))
+        if roster:
+            report(f"{label}: {rows:,} signups", f"{roster_seconds * 1000:.0f} ms")
+        else:
+            report(label, "")
+        report("  signup latency median / p95 / max",
+               f"{lat[len(lat) // 2] * 1000:.0f} / {lat[int(len(lat) * 0.95)] * 1000:.0f} / "
+               f"{lat[-1] * 1000:.0f} ms")
+
+
+# ---------- ROSTER MEMORY (roster_store) ----------
+def measure(build):
+    # (result, bytes still held, peak bytes, seconds), as tracemalloc sees it.
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = build()
+    seconds = time.perf_counter() - started
+    gc.collect()
+    held, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, held, peak, seconds
+
+
+def bench_roster_memory(workdir, seed):
+    import pandas as pd
+
+    fresh_db(workdir, "roster.sqlite", rides=2_000, signups=1_000_000, seed=seed)
+
+    def tuples():
+        rows = database.roster()
+        return rows, pd.DataFrame(rows, columns=["Ride", "Date", "Name"])
+
+    def compact():
+        rows = database.roster_compact()
+        return rows, rows.to_frame()
+
+    for label, build in (("roster() tuples + DataFrame", tuples),
+                         ("roster_compact() + to_frame()", compact)):
+        (rows, frame), held, peak, seconds = measure(build)
+        report(f"{label}, {len(rows):,} signups",
+               f"{held / 2**20:6.0f} MB held, {peak / 2**20:6.0f} MB peak, {seconds:.2f} s")
+        report("  of which the DataFrame (deep)",
+               f"{frame.memory_usage(deep=True).sum() / 2**20:6.0f} MB")
+        del rows, frame
+
+
+# ---------- STATS (rider_stats, ride_stats, weekly_turnout) ----------
+def best_of(runs, fn, *args):
+    return min(timed(fn, *args)[1] for _ in range(runs))
+
+
+def bench_stats(workdir, seed):
+    import pandas as pd
+
+    def from_roster():
+        # What the stats view had to do before the summary tables.
+        frame = pd.DataFrame(database.roster(), columns=["Ride", "Date", "Name"])
+        return frame.groupby(frame["Name"].str.strip().str.lower()).size().nlargest(12)
+
+    for n in (10_000, 100_000, 1_000_000):
+        path = fresh_db(workdir, f"stats-{n}.sqlite", rides=2_000, signups=n, seed=seed)
+        report(f"{n:>9,} signups: season_stats()", f"{best_of(20, database.season_stats) * 1000:7.2f} ms")
+        report("           roster() + pandas groupby", f"{best_of(3, from_roster) * 1000:7.0f} ms")
+
+    # The write side: what the triggers add to each signup insert, on the
+    # largest database, with 10,000 signups in one transaction.
+    con = database.connect(path)
+    rides = [r[0] for r in con.execute("SELECT id FROM rides")]
+    rng = random.Random(seed)
+    batch = [(rng.choice(rides), f"Trigger Rider {i}", f"T{i:07d}") for i in range(10_000)]
+
+    def insert(rows):
+        with con:
+            con.executemany("INSERT INTO signups (ride_id, full_name, confirm_code) VALUES (?,?,?)",
+                            rows)
+
+    _, with_triggers = timed(insert, batch)
+    with con:
+        for name in database.STATS_TRIGGERS:
+            con.execute(f"DROP TRIGGER {name}")
+    _, without = timed(insert, [(r, n, "U" + c[1:]) for r, n, c in batch])
+    con.close()
+    report("10,000 inserts with / without stats triggers",
+           f"{with_triggers * 1000:.0f} / {without * 1000:.0f} ms "
+           f"({(with_triggers - without) / len(batch) * 1e6:.0f} us per signup)")
+
+
+# ---------- JOURNAL (journal) ----------
+def per_call(fn, args):
+    # Sorted per-call seconds.
+    times = []
+    for a in args:
+        started = time.perf_counter()
+        fn(*a)
+        times.append(time.perf_counter() - started)
+    return sorted(times)
+
+
+def spread(times):
+    return (f"median {times[len(times) // 2] * 1e6:,.0f} us, "
+            f"p99 {times[int(len(times) * 0.99)] * 1e6:,.0f} us")
+
+
+def bench_journal(workdir, seed):
+    import journal
+
+    record = {"t": "2026-01-03T12:00:00Z", "op": "signup", "code": "0123ABCD", "ride": 17,
+              "name": "Maya Nguyen"}
+    path = os.path.join(workdir, "append-journal.ndjson")
+    report("journal.append, fsync batched (10,000)",
+           spread(per_call(journal.append, [(path, record)] * 10_000)))
+    fsync_ms, journal.FSYNC_MS = journal.FSYNC_MS, 0
+    path = os.path.join(workdir, "fsync-journal.ndjson")
+    report("journal.append, fsync every line (200)",
+           spread(per_call(journal.append, [(path, record)] * 200)))
+    journal.FSYNC_MS = fsync_ms
+
+    # End to end, alternating so drift in the disk hits both. Another
+    # connection stays open, as in a running app: when the last connection
+    # closes, SQLite checkpoints the WAL, and that would swamp the journal.
+    path = fresh_db(workdir, "journal.sqlite", rides=200, signups=10_000, seed=seed)
+    keeper = database.connect(path)
+    keeper.execute("SELECT count(*) FROM meta").fetchone()
+    rides = [r[0] for r in database.list_rides(series=False)]
+    rng = random.Random(seed)
+    times = {False: [], True: []}
+    for i in range(600):
+        journaled = database.JOURNALED = bool(i % 2)
+        times[journaled] += per_call(database.signup, [(rng.choice(rides), f"Journal Rider {i}")])
+    database.JOURNALED = False
+    keeper.close()
+    for journaled in (False, True):
+        report(f"signup(), journal {'on' if journaled else 'off'} (300)",
+               spread(sorted(times[journaled])))
+
+
+BENCHES = {
+    "import": bench_import,
+    "gpx": bench_gpx,
+    "event-loop": bench_event_loop,
+    "roster-memory": bench_roster_memory,
+    "stats": bench_stats,
+    "journal": bench_journal,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the performance benchmarks.")
+    parser.add_argument("names", nargs="*", metavar="name",
+                        help=f"benchmarks to run (default: all of {', '.join(BENCHES)})")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+    unknown = [n for n in args.names if n not in BENCHES]
+    if unknown:
+        parser.error(f"unknown benchmark {', '.join(unknown)}; choose from {', '.join(BENCHES)}")
+    for name in args.names or BENCHES:
+        workdir = tempfile.mkdtemp(prefix=f"teamugly-bench-{name}-")
+        print(f"{name}:")
+        try:
+            BENCHES[name](workdir, args.seed)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
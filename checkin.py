@@ -0,0 +1,200 @@
+import hashlib
+import hmac
+import json
+
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import HTMLResponse, JSONResponse, Response
+from starlette.routing import Route
+
+import admin_auth
+from database import checkin_roster, get_ride_details, record_checkins
+
+# Trailhead check-in for ride leaders. The phone loads one small page and
+# one compact roster JSON, a service worker keeps both available offline,
+# and check-ins queue in localStorage until they can be synced in a batch.
+# Links carry a per-ride key signed with the admin secret, so only people
+# an admin gave the link to can see the roster or record attendance.
+
+
+def ride_key(ride_id):
+    return admin_auth.sign(f"checkin:{ride_id}")[:24]
+
+
+def checkin_link(ride_id):
+    return f"checkin/{ride_id}?k={ride_key(ride_id)}"
+
+
+def authorized(request, ride_id):
+    return hmac.compare_digest(request.query_params.get("k", ""), ride_key(ride_id))
+
+
+# ---------- ROSTER PAYLOAD ----------
+def roster_payload(ride_id):
+    details = get_ride_details(ride_id)
+    if not details:
+        return None
+    name, date, time, loc, _ = details
+    riders = [[sid, full_name, int(done)] for sid, full_name, done in checkin_roster(ride_id)]
+    return json.dumps({"ride": [name, date, time, loc], "riders": riders},
+                      separators=(",", ":"))
+
+
+def roster_json(request):
+    ride_id = request.path_params["ride_id"]
+    if not authorized(request, ride_id):
+        return Response(status_code=403)
+    body = roster_payload(ride_id)
+    if body is None:
+        return Response(status_code=404)
+    etag = '"' + hashlib.sha1(body.encode()).hexdigest()[:16] + '"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+
+async def sync(request):
+    ride_id = request.path_params["ride_id"]
+    if not authorized(request, ride_id):
+        return Response(status_code=403)
+    try:
+        data = await request.json()
+        checkins = [(int(sid), str(ts)) for sid, ts in data.get("checkins", [])]
+    except (ValueError, TypeError, AttributeError):
+        return JSONResponse({"error": "bad request"}, status_code=400)
+    saved = await run_in_threadpool(record_checkins, ride_id, checkins)
+    return JSONResponse({"saved": saved, "received": len(checkins)})
+
+
+# ---------- PAGE + SERVICE WORKER ----------
+PAGE = """<!doctype html>
+<html><head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1.0">
+<title>Ride Check-In</title>
+<style>
+  body { background:#002D5C; color:#fff; font-family:'Segoe UI', Arial, sans-serif; margin:0; padding:12px; }
+  h1 { font-size:1.2rem; color:#F47920; margin:4px 0; }
+  .meta { color:#aad4f0; font-size:14px; margin-bottom:10px; }
+  #status { font-size:13px; color:#aad4f0; margin:8px 0; }
+  input { width:100%; font-size:16px; padding:10px; border-radius:6px; border:1px solid #0078BF;
+          background:#003f7a; color:#fff; box-sizing:border-box; }
+  ul { list-style:none; padding:0; margin:10px 0; }
+  li { padding:14px 12px; margin:6px 0; border-radius:6px; background:rgba(0,120,191,0.25);
+       font-size:17px; font-weight:600; }
+  li.in { background:#2a7a2a; }
+  li.in::after { content:" \\2713"; }
+</style>
+</head><body>
+<h1 id="ride">Loading…</h1>
+<div class="meta" id="meta"></div>
+<input id="q" placeholder="Search riders" autocomplete="off">
+<div id="status"></div>
+<ul id="list"></ul>
+<script>
+var RIDE = __RIDE__, KEY = __KEY__;
+var base = String(RIDE), qs = "?k=" + encodeURIComponent(KEY);
+var store = "checkin-" + RIDE, queueKey = "checkin-queue-" + RIDE;
+var data = JSON.parse(localStorage.getItem(store) || "null");
+var queue = JSON.parse(localStorage.getItem(queueKey) || "[]");
+var done = {};
+
+function save() {
+  localStorage.setItem(queueKey, JSON.stringify(queue));
+}
+function render() {
+  if (!data) return;
+  document.getElementById("ride").textContent = data.ride[0];
+  document.getElementById("meta").textContent = [data.ride[1], data.ride[2], data.ride[3]].join(" \\u00b7 ");
+  var q = document.getElementById("q").value.toLowerCase(), list = document.getElementById("list");
+  list.innerHTML = "";
+  var count = 0;
+  data.riders.forEach(function(r) {
+    var isIn = r[2] || done[r[0]];
+    if (isIn) count++;
+    if (q && r[1].toLowerCase().indexOf(q) < 0) return;
+    var li = document.createElement("li");
+    li.textContent = r[1];
+    if (isIn) li.className = "in";
+    li.onclick = function() { checkIn(r[0]); };
+    list.appendChild(li);
+  });
+  document.getElementById("status").textContent = count + " of " + data.riders.length +
+    " checked in" + (queue.length ? " \\u00b7 " + queue.length + " waiting to sync" : "");
+}
+function checkIn(id) {
+  if (done[id]) return;
+  done[id] = true;
+  queue.push([id, new Date().toISOString()]);
+  save(); render(); sync();
+}
+function load() {
+  fetch(base + "/roster.json" + qs).then(function(r) {
+    if (r.status === 200) return r.json();
+  }).then(function(j) {
+    if (j) { data = j; localStorage.setItem(store, JSON.stringify(j)); }
+    render();
+  }).catch(render);
+}
+function sync() {
+  if (!queue.length || !navigator.onLine) return;
+  var batch = queue.slice();
+  fetch(base + "/sync" + qs, {method: "POST", headers: {"Content-Type": "application/json"},
+                              body: JSON.stringify({checkins: batch})})
+    .then(function(r) {
+      if (!r.ok) return;
+      queue = queue.slice(batch.length); save(); render();
+    }).catch(function() {});
+}
+queue.forEach(function(c) { done[c[0]] = true; });
+document.getElementById("q").oninput = render;
+window.addEventListener("online", sync);
+setInterval(sync, 30000);
+if ("serviceWorker" in navigator) navigator.serviceWorker.register("sw.js");
+render(); load(); sync();
+</script>
+</body></html>
+"""
+
+SERVICE_WORKER = """
+var CACHE = "checkin-v1";
+self.addEventListener("install", function(e) { self.skipWaiting(); });
+self.addEventListener("activate", function(e) { e.waitUntil(self.clients.claim()); });
+self.addEventListener("fetch", function(e) {
+  var req = e.request;
+  if (req.method !== "GET") return;
+  // Network first, falling back to the last good copy when offline.
+  e.respondWith(
+    fetch(req).then(function(res) {
+      if (res.ok) {
+        var copy = res.clone();
+        caches.open(CACHE).then(function(c) { c.put(req, copy); });
+      }
+      return res;
+    }).catch(function() {
+      return caches.match(req);
+    })
+  );
+});
+"""
+
+
+def page(request):
+    ride_id = request.path_params["ride_id"]
+    if not authorized(request, ride_id):
+        return HTMLResponse("Check-in link is not valid.", status_code=403)
+    html = PAGE.replace("__RIDE__", str(ride_id)).replace("__KEY__", json.dumps(ride_key(ride_id)))
+    return HTMLResponse(html)
+
+
+def service_worker(request):
+    return Response(SERVICE_WORKER, media_type="application/javascript",
+                    headers={"Cache-Control": "no-cache"})
+
+
+routes = [
+    Route("/checkin/sw.js", service_worker),
+    Route("/checkin/{ride_id:int}", page),
+    Route("/checkin/{ride_id:int}/roster.json", roster_json),
+    Route("/checkin/{ride_id:int}/sync", sync, methods=["POST"]),
+]
@@ -1,18 +1,110 @@
 import sqlite3
 import os
+import re
+import secrets
+import time
+import urllib.parse
 import uuid
+import datetime
 
-DB = "data/teamugly.sqlite"
+import journal
+import sqlprofile
+from roster_store import CompactRoster
 
+DB = os.getenv("TEAMUGLY_DB_PATH", "data/teamugly.sqlite")
 
-def connect():
-    os.makedirs("data", exist_ok=True)
-    return sqlite3.connect(DB)
+# Where the database lives:
+#   file    the SQLite file at DB (or the path passed in)
+#   memory  an in-process SQLite database, named after that path and
+#           shared by every connection this process opens to it; gone
+#           when the process exits. For trying things out and for timing
+#           the code without disk writes and fsyncs.
+ENGINE = os.getenv("TEAMUGLY_DB_ENGINE", "file")
+if ENGINE not in ("file", "memory"):
+    raise ValueError(f"TEAMUGLY_DB_ENGINE must be 'file' or 'memory', not {ENGINE!r}")
 
+# The journal exists to survive a crash; a memory database doesn't.
+JOURNALED = journal.ENABLED and ENGINE == "file"
 
-def init_db():
-    con = connect()
+# Recurring series are expanded this many weeks ahead of today.
+SERIES_WEEKS = int(os.getenv("TEAMUGLY_SERIES_WEEKS", "8"))
+
+# Fold plus addresses (ann+rides@x.org -> ann@x.org) into one email key.
+FOLD_PLUS = os.getenv("TEAMUGLY_EMAIL_FOLD_PLUS", "") not in ("", "0")
+
+
+# path -> a connection holding that memory database open
+_memory = {}
+
+
+def memory_uri(db_path):
+    # The memdb VFS shares one database between connections by name and,
+    # unlike shared-cache mode, locks like a file: writers wait out the
+    # busy timeout instead of failing with "table is locked".
+    return "file:" + urllib.parse.quote(os.path.abspath(db_path)) + "?vfs=memdb"
+
+
+def connect(db_path=None):
+    db_path = db_path or DB
+    factory = sqlprofile.ProfilingConnection if sqlprofile.ENABLED else sqlite3.Connection
+    if ENGINE == "memory":
+        uri = memory_uri(db_path)
+        if db_path not in _memory:
+            _memory[db_path] = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        con = sqlite3.connect(uri, uri=True, factory=factory)
+    else:
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        con = sqlite3.connect(db_path, factory=factory)
+    # For backfills and INSERT ... SELECT copies; nothing stored in the
+    # schema (triggers, indexes) calls it, so other tools can still write.
+    con.create_function("email_key", 1, email_key, deterministic=True)
+    return con
+
+
+def now_utc_iso():
+    return datetime.datetime.utcnow().replace(microsecond=0).isoformat() + "Z"
+
+
+def table_columns(cur, table):
+    return [r[1] for r in cur.execute(f"PRAGMA table_info({table})")]
+
+
+def add_column(cur, table, column, decl):
+    if column not in table_columns(cur, table):
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+
+def place_key(loc):
+    return " ".join((loc or "").lower().split())
+
+
+def email_key(email):
+    # The address riders are matched on: trimmed and lowercased, with the
+    # +tag dropped when FOLD_PLUS is on. None for a blank address.
+    key = (email or "").strip().lower()
+    local, at, domain = key.partition("@")
+    if FOLD_PLUS and at:
+        local = local.split("+", 1)[0] or local
+    return (local + at + domain) or None
+
+
+def init_db(db_path=None):
+    con = connect(db_path)
     cur = con.cursor()
+    # Only takes effect on a new, empty file; maintenance's compaction
+    # converts existing ones, after which free pages are reclaimed in
+    # small incremental_vacuum steps.
+    cur.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    # WAL lets the worker-pool readers run while a signup is being written.
+    cur.execute("PRAGMA journal_mode=WAL")
+
+    # A database created by TU_Rides.py from schema.sql has a denormalized
+    # signups table. Move it aside (a metadata-only rename) so the
+    # normalized table can take its place; migrate_schema copies the rows
+    # over in small batches while the app keeps serving.
+    legacy = "ride_name" in table_columns(cur, "signups")
+    if legacy:
+        cur.execute("ALTER TABLE signups RENAME TO signups_legacy")
     cur.execute("""
         CREATE TABLE IF NOT EXISTS rides(
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -31,87 +123,1095 @@ def init_db():
             confirm_code TEXT
         )
     """)
+    add_column(cur, "signups", "email", "TEXT")
+    add_column(cur, "signups", "phone", "TEXT")
+    add_column(cur, "signups", "city", "TEXT")
+    add_column(cur, "signups", "notes", "TEXT")
+    add_column(cur, "signups", "acknowledge", "INTEGER NOT NULL DEFAULT 0")
+    add_column(cur, "signups", "created_utc", "TEXT")
+    add_column(cur, "signups", "cancel_token", "TEXT")
+    add_column(cur, "signups", "status", "TEXT NOT NULL DEFAULT 'ACTIVE'")
+    add_column(cur, "signups", "cancelled_utc", "TEXT")
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_signups_cancel
+        ON signups(cancel_token)
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_signups_confirm_code
+        ON signups(confirm_code)
+    """)
+
+    # Cancelling a signup or deleting a ride is a status change, so history
+    # is kept. Roster queries only ever want ACTIVE rows; partial indexes
+    # cover just those, so their size and lookup cost don't grow with the
+    # cancelled history.
+    add_column(cur, "rides", "status", "TEXT NOT NULL DEFAULT 'ACTIVE'")
+    add_column(cur, "rides", "deleted_utc", "TEXT")
+    cur.execute("DROP INDEX IF EXISTS idx_signups_ride")
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_signups_active_ride
+        ON signups(ride_id) WHERE status = 'ACTIVE'
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_rides_active_date
+        ON rides(ride_date) WHERE status = 'ACTIVE'
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS attendance(
+            signup_id INTEGER PRIMARY KEY,
+            ride_id INTEGER,
+            checked_in_utc TEXT
+        )
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_rides_name_date
+        ON rides(ride_name, ride_date)
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS ride_routes(
+            ride_id INTEGER PRIMARY KEY,
+            distance_m REAL,
+            elevation_gain_m REAL,
+            min_lat REAL,
+            min_lon REAL,
+            max_lat REAL,
+            max_lon REAL,
+            point_count INTEGER,
+            polyline BLOB
+        )
+    """)
+
+    # Recurring rides (every N weeks on one weekday) are stored once in
+    # ride_series. Their occurrences are expanded on the fly by list_rides()
+    # and only get a rides row (series_id, occurrence_date) when something
+    # needs one: a signup, a GPX route or an override. series_exceptions
+    # holds per-date cancellations and overrides (NULL = as the series).
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS ride_series(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ride_name TEXT,
+            weekday INTEGER,
+            interval_weeks INTEGER NOT NULL DEFAULT 1,
+            start_date TEXT,
+            until_date TEXT,
+            start_time TEXT,
+            meeting_point TEXT,
+            route_link TEXT,
+            lat REAL,
+            lon REAL,
+            capacity INTEGER,
+            status TEXT NOT NULL DEFAULT 'ACTIVE'
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS series_exceptions(
+            series_id INTEGER,
+            occurrence_date TEXT,
+            cancelled INTEGER NOT NULL DEFAULT 0,
+            ride_name TEXT,
+            start_time TEXT,
+            meeting_point TEXT,
+            route_link TEXT,
+            PRIMARY KEY (series_id, occurrence_date)
+        )
+    """)
+    add_column(cur, "rides", "series_id", "INTEGER")
+    add_column(cur, "rides", "occurrence_date", "TEXT")
+    cur.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_rides_occurrence
+        ON rides(series_id, occurrence_date) WHERE series_id IS NOT NULL
+    """)
+
+    # Signups are matched to a rider by email_key(email), stored alongside
+    # the raw address. dedupe_signups() merges a rider's repeat signups for
+    # one ride into the first: the extras get status MERGED and point at
+    # the row they were folded into, so their cancel links still work.
+    new_key = "email_key" not in table_columns(cur, "signups")
+    add_column(cur, "signups", "email_key", "TEXT")
+    add_column(cur, "signups", "merged_into", "INTEGER")
+    # The "My rides" email lookup finds a rider's signups by email key.
+    # The index carries every signups column that lookup reads, so it
+    # never touches the table.
+    cur.execute("DROP INDEX IF EXISTS idx_signups_email_key")
+    cur.execute("DROP INDEX IF EXISTS idx_signups_rider_rides")
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_signups_email_rides
+        ON signups(email_key, status, ride_id, confirm_code) WHERE email_key IS NOT NULL
+    """)
+
+    # Bumped on every change to rides (or their routes) so readers
+    # (calendar feeds, the API) can tell whether their cached output is
+    # still current with one lookup.
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS meta(
+            key TEXT PRIMARY KEY,
+            value INTEGER
+        )
+    """)
+    cur.execute("INSERT OR IGNORE INTO meta(key, value) VALUES ('catalog_version', 0)")
+    # Secrets are text and get their own table: in meta (value INTEGER) an
+    # all-digit key would come back as an int. Older databases kept the
+    # signing key in meta; it is moved over unchanged.
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS app_secrets(
+            name TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        )
+    """)
+    cur.execute("""
+        INSERT OR IGNORE INTO app_secrets (name, value)
+        SELECT key, CAST(value AS TEXT) FROM meta WHERE key = 'secret_key'
+    """)
+    cur.execute("DELETE FROM meta WHERE key = 'secret_key'")
+    for table in ("rides", "ride_routes", "ride_series", "series_exceptions"):
+        for event in ("INSERT", "UPDATE", "DELETE"):
+            cur.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {table}_version_{event.lower()}
+                AFTER {event} ON {table}
+                BEGIN
+                    UPDATE meta SET value = value + 1 WHERE key = 'catalog_version';
+                END
+            """)
+    # Same idea for the roster: bumped by any signup, cancellation or move.
+    cur.execute("INSERT OR IGNORE INTO meta(key, value) VALUES ('roster_version', 0)")
+    for event in ("INSERT", "UPDATE", "DELETE"):
+        cur.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS signups_version_{event.lower()}
+            AFTER {event} ON signups
+            BEGIN
+                UPDATE meta SET value = value + 1 WHERE key = 'roster_version';
+            END
+        """)
+    init_stats(cur)
+
+    # Keys are recomputed when the column is new or FOLD_PLUS has changed.
+    fold = cur.execute("SELECT value FROM meta WHERE key='email_fold_plus'").fetchone()
+    if new_key or fold is None or fold[0] != int(FOLD_PLUS):
+        cur.execute("""
+            UPDATE signups SET email_key = email_key(email)
+            WHERE email_key IS NOT email_key(email)
+        """)
+        cur.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('email_fold_plus', ?)",
+                    (int(FOLD_PLUS),))
+
+    # Rides with a capacity put overflow signups on a waitlist (status
+    # WAITLISTED); the waitlist worker promotes them in signup order as
+    # spots free up and queues a notice for each in the outbox.
+    add_column(cur, "rides", "capacity", "INTEGER")
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_signups_waitlist
+        ON signups(ride_id, id) WHERE status = 'WAITLISTED'
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS outbox(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT,
+            signup_id INTEGER,
+            created_utc TEXT,
+            sent_utc TEXT
+        )
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_outbox_pending
+        ON outbox(kind, id) WHERE sent_utc IS NULL
+    """)
+    # At most one day-before reminder per signup, however many times
+    # (or by however many processes) the reminder scheduler queues it.
+    cur.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_outbox_reminder
+        ON outbox(signup_id) WHERE kind = 'REMINDER'
+    """)
+
+    # Meeting point coordinates: entered by an admin, remembered in places
+    # for reuse, and mirrored into an R*Tree for radius / nearest queries.
+    add_column(cur, "rides", "lat", "REAL")
+    add_column(cur, "rides", "lon", "REAL")
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS places(
+            place_key TEXT PRIMARY KEY,
+            name TEXT,
+            lat REAL,
+            lon REAL
+        )
+    """)
+    cur.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS ride_geo
+        USING rtree(id, min_lat, max_lat, min_lon, max_lon)
+    """)
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS ride_geo_insert
+        AFTER INSERT ON rides
+        WHEN new.lat IS NOT NULL AND new.lon IS NOT NULL
+        BEGIN
+            INSERT INTO ride_geo VALUES (new.id, new.lat, new.lat, new.lon, new.lon);
+        END
+    """)
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS ride_geo_update
+        AFTER UPDATE OF lat, lon ON rides
+        BEGIN
+            DELETE FROM ride_geo WHERE id = old.id;
+            INSERT INTO ride_geo
+            SELECT new.id, new.lat, new.lat, new.lon, new.lon
+            WHERE new.lat IS NOT NULL AND new.lon IS NOT NULL;
+        END
+    """)
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS ride_geo_delete
+        AFTER DELETE ON rides
+        BEGIN
+            DELETE FROM ride_geo WHERE id = old.id;
+        END
+    """)
     con.commit()
     con.close()
 
 
+# ---------- STATS ----------
+# Per-rider, per-ride and per-week counts kept up to date by triggers on
+# signups and attendance, so the admin stats read a few small tables
+# instead of aggregating every signup. Each signup row contributes +1 to
+# signups while ACTIVE and +1 to cancellations once CANCELLED (waitlisted
+# rows count for neither until promoted); a status change
+# (cancel, ride deletion) or a move takes the old row's contribution away
+# and adds the new one. Weeks start on Monday of the ride's date.
+# Riders are keyed on their email key, so two people sharing a name stay
+# apart; signups without an email fall back to the trimmed, lowercased
+# name.
+
+STATS_WEEK = "date(r.ride_date, 'weekday 0', '-6 days')"
+STATS_KEY_VERSION = 2   # 1: keyed by name only
+STATS_TRIGGERS = ("signups_stats_insert", "signups_stats_delete", "signups_stats_update",
+                  "attendance_stats_insert", "attendance_stats_delete")
+
+
+def rider_key(row):
+    return f"coalesce({row}email_key, lower(trim({row}full_name)), '')"
+
+
+def stats_sql(row, sign):
+    active = f"{sign}({row}.status = 'ACTIVE')"
+    cancelled = f"{sign}({row}.status = 'CANCELLED')"
+    counts = """
+            signups = signups + excluded.signups,
+            cancellations = cancellations + excluded.cancellations"""
+    return f"""
+        INSERT INTO rider_stats (rider_key, full_name, signups, cancellations, last_signup_utc)
+        VALUES ({rider_key(row + ".")}, trim({row}.full_name),
+                {active}, {cancelled}, {row}.created_utc)
+        ON CONFLICT(rider_key) DO UPDATE SET{counts},
+            last_signup_utc = max(coalesce(last_signup_utc, ''), coalesce(excluded.last_signup_utc, ''));
+        INSERT INTO ride_stats (ride_id, signups, cancellations)
+        VALUES ({row}.ride_id, {active}, {cancelled})
+        ON CONFLICT(ride_id) DO UPDATE SET{counts};
+        INSERT INTO weekly_turnout (week, signups, cancellations)
+        SELECT {STATS_WEEK}, {active}, {cancelled} FROM rides r
+        WHERE r.id = {row}.ride_id AND date(r.ride_date) IS NOT NULL
+        ON CONFLICT(week) DO UPDATE SET{counts};
+    """
+
+
+def checkin_sql(row, sign):
+    return f"""
+        UPDATE ride_stats SET checked_in = checked_in {sign} 1 WHERE ride_id = {row}.ride_id;
+        UPDATE rider_stats SET checked_in = checked_in {sign} 1
+        WHERE rider_key = (SELECT {rider_key("")} FROM signups WHERE id = {row}.signup_id);
+        UPDATE weekly_turnout SET checked_in = checked_in {sign} 1
+        WHERE week = (SELECT {STATS_WEEK} FROM rides r WHERE r.id = {row}.ride_id);
+    """
+
+
+def init_stats(cur):
+    backfill = not has_table(cur, "ride_stats")
+    # Databases keyed the old way get new triggers and a rebuild.
+    version = cur.execute("SELECT value FROM meta WHERE key='stats_key_version'").fetchone()
+    rekey = not backfill and (version is None or version[0] < STATS_KEY_VERSION)
+    if rekey:
+        for name in STATS_TRIGGERS:
+            cur.execute(f"DROP TRIGGER IF EXISTS {name}")
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS rider_stats(
+            rider_key TEXT PRIMARY KEY,
+            full_name TEXT,
+            signups INTEGER NOT NULL DEFAULT 0,
+            cancellations INTEGER NOT NULL DEFAULT 0,
+            checked_in INTEGER NOT NULL DEFAULT 0,
+            last_signup_utc TEXT
+        )
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_rider_stats_signups
+        ON rider_stats(signups)
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS ride_stats(
+            ride_id INTEGER PRIMARY KEY,
+            signups INTEGER NOT NULL DEFAULT 0,
+            cancellations INTEGER NOT NULL DEFAULT 0,
+            checked_in INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS weekly_turnout(
+            week TEXT PRIMARY KEY,
+            signups INTEGER NOT NULL DEFAULT 0,
+            cancellations INTEGER NOT NULL DEFAULT 0,
+            checked_in INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS signups_stats_insert
+        AFTER INSERT ON signups
+        BEGIN {stats_sql("new", "+")} END
+    """)
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS signups_stats_delete
+        AFTER DELETE ON signups
+        BEGIN {stats_sql("old", "-")} END
+    """)
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS signups_stats_update
+        AFTER UPDATE OF status, ride_id, full_name, email_key ON signups
+        WHEN old.status IS NOT new.status OR old.ride_id IS NOT new.ride_id
+          OR old.full_name IS NOT new.full_name OR old.email_key IS NOT new.email_key
+        BEGIN {stats_sql("old", "-")} {stats_sql("new", "+")} END
+    """)
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS attendance_stats_insert
+        AFTER INSERT ON attendance
+        BEGIN {checkin_sql("new", "+")} END
+    """)
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS attendance_stats_delete
+        AFTER DELETE ON attendance
+        BEGIN {checkin_sql("old", "-")} END
+    """)
+    if backfill or rekey:
+        rebuild_stats(cur)
+    cur.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('stats_key_version', ?)",
+                (STATS_KEY_VERSION,))
+
+
+def rebuild_stats(cur):
+    # Recomputes the aggregates from scratch: used once when the tables are
+    # first added to an existing database, and by maintenance --rebuild-stats
+    # as a check that the triggers and the base tables still agree.
+    cur.execute("DELETE FROM rider_stats")
+    cur.execute("DELETE FROM ride_stats")
+    cur.execute("DELETE FROM weekly_turnout")
+    cur.execute(f"""
+        INSERT INTO rider_stats (rider_key, full_name, signups, cancellations, checked_in, last_signup_utc)
+        SELECT {rider_key("s.")}, trim(min(s.full_name)),
+               sum(s.status = 'ACTIVE'), sum(s.status = 'CANCELLED'),
+               count(a.signup_id), max(coalesce(s.created_utc, ''))
+        FROM signups s
+        LEFT JOIN attendance a ON a.signup_id = s.id
+        GROUP BY 1
+    """)
+    cur.execute("""
+        INSERT INTO ride_stats (ride_id, signups, cancellations, checked_in)
+        SELECT s.ride_id, sum(s.status = 'ACTIVE'), sum(s.status = 'CANCELLED'), count(a.signup_id)
+        FROM signups s
+        LEFT JOIN attendance a ON a.signup_id = s.id
+        GROUP BY s.ride_id
+    """)
+    cur.execute(f"""
+        INSERT INTO weekly_turnout (week, signups, cancellations, checked_in)
+        SELECT {STATS_WEEK}, sum(s.status = 'ACTIVE'), sum(s.status = 'CANCELLED'), count(a.signup_id)
+        FROM signups s
+        JOIN rides r ON r.id = s.ride_id
+        LEFT JOIN attendance a ON a.signup_id = s.id
+        WHERE date(r.ride_date) IS NOT NULL
+        GROUP BY 1
+    """)
+
+
+def season_stats(limit=12):
+    # One read transaction over the stats tables for the admin view:
+    # totals per season (calendar year), top riders, and the most recent
+    # weeks and rides.
+    con = connect()
+    cur = con.cursor()
+    cur.execute("BEGIN")
+    stats = {
+        "seasons": cur.execute("""
+            SELECT substr(week, 1, 4), count(*), sum(signups), sum(cancellations), sum(checked_in)
+            FROM weekly_turnout
+            GROUP BY 1
+            ORDER BY 1 DESC
+        """).fetchall(),
+        "riders": cur.execute("""
+            SELECT full_name, signups, cancellations, checked_in, substr(last_signup_utc, 1, 10)
+            FROM rider_stats
+            WHERE signups > 0
+            ORDER BY signups DESC
+            LIMIT ?
+        """, (limit,)).fetchall(),
+        "weeks": cur.execute("""
+            SELECT week, signups, cancellations, checked_in
+            FROM weekly_turnout
+            ORDER BY week DESC
+            LIMIT ?
+        """, (limit,)).fetchall(),
+        "rides": cur.execute("""
+            SELECT r.ride_name, r.ride_date, st.signups, st.cancellations, st.checked_in
+            FROM rides r
+            JOIN ride_stats st
+            ON st.ride_id = r.id
+            WHERE r.status = 'ACTIVE'
+            ORDER BY r.ride_date DESC
+            LIMIT ?
+        """, (limit,)).fetchall(),
+    }
+    con.close()
+    return stats
+
+
 # ---------- RIDES ----------
 
-def create_ride(name, date, time, loc, route):
+def create_ride(name, date, time, loc, route, lat=None, lon=None, capacity=None):
     con = connect()
     cur = con.cursor()
+    if lat is None or lon is None:
+        place = cur.execute("SELECT lat, lon FROM places WHERE place_key=?",
+                            (place_key(loc),)).fetchone()
+        lat, lon = place if place else (None, None)
+    elif loc:
+        cur.execute("""
+            INSERT OR REPLACE INTO places (place_key, name, lat, lon)
+            VALUES (?,?,?,?)
+        """, (place_key(loc), loc, lat, lon))
     cur.execute("""
         INSERT INTO rides
-        (ride_name, ride_date, start_time, meeting_point, route_link)
-        VALUES (?,?,?,?,?)
-    """, (name, date, time, loc, route))
+        (ride_name, ride_date, start_time, meeting_point, route_link, lat, lon, capacity)
+        VALUES (?,?,?,?,?,?,?,?)
+    """, (name, date, time, loc, route, lat, lon, capacity))
     con.commit()
     con.close()
 
 
-def list_rides():
+def create_rides_bulk(rides):
+    # rides: iterable of (name, date, time, loc, route) tuples.
+    # Everything lands in one transaction; rows whose (ride_name, ride_date)
+    # already exist, in the table or earlier in the batch, are skipped.
+    con = connect()
+    cur = con.cursor()
+    existing = set(cur.execute("""
+        SELECT ride_name, ride_date FROM rides WHERE status = 'ACTIVE'
+    """).fetchall())
+    places = {r[0]: (r[1], r[2]) for r in cur.execute("SELECT place_key, lat, lon FROM places")}
+    new_rows = []
+    skipped = []
+    for ride in rides:
+        key = (ride[0], ride[1])
+        if key in existing:
+            skipped.append(ride)
+            continue
+        existing.add(key)
+        new_rows.append(tuple(ride) + places.get(place_key(ride[3]), (None, None)))
+    with con:
+        cur.executemany("""
+            INSERT INTO rides
+            (ride_name, ride_date, start_time, meeting_point, route_link, lat, lon)
+            VALUES (?,?,?,?,?,?,?)
+        """, new_rows)
+    con.close()
+    return len(new_rows), skipped
+
+
+def list_rides(series=True):
+    # Pass series=False for rides that exist as rows only (no upcoming
+    # series occurrences that nobody has signed up for yet).
     con = connect()
     cur = con.cursor()
     rows = cur.execute("""
         SELECT id, ride_name, ride_date
         FROM rides
+        WHERE status = 'ACTIVE'
         ORDER BY ride_date
     """).fetchall()
+    if series:
+        rows = merge_occurrences(rows, [o[:3] for o in expand_series(cur)])
     con.close()
     return rows
 
 
-def get_ride_details(ride_id):
+def list_ride_details():
     con = connect()
     cur = con.cursor()
-    row = cur.execute("""
-        SELECT ride_name, ride_date, start_time,
+    rows = cur.execute("""
+        SELECT id, ride_name, ride_date, start_time,
                meeting_point, route_link
         FROM rides
-        WHERE id=?
-    """, (ride_id,)).fetchone()
+        WHERE status = 'ACTIVE'
+        ORDER BY ride_date
+    """).fetchall()
+    rows = merge_occurrences(rows, expand_series(cur))
+    con.close()
+    return rows
+
+
+def catalog_version(key="catalog_version"):
+    con = connect()
+    cur = con.cursor()
+    row = cur.execute("SELECT value FROM meta WHERE key=?", (key,)).fetchone()
+    con.close()
+    value = row[0] if row else 0
+    if key == "catalog_version":
+        # Series occurrences are expanded from today, so the catalog also
+        # moves on at midnight without any write.
+        return f"{value}.{datetime.date.today():%Y%m%d}"
+    return value
+
+
+def roster_version():
+    return catalog_version("roster_version")
+
+
+def secret_key(db_path=None):
+    # Signing key for admin tokens and check-in links, created once and
+    # kept in app_secrets so links handed out stay valid across restarts
+    # (and every process on this database agrees). INSERT OR IGNORE makes
+    # the first process to get here the one whose key is kept.
+    con = connect(db_path)
+    with con:
+        con.execute("INSERT OR IGNORE INTO app_secrets (name, value) VALUES ('secret_key', ?)",
+                    (secrets.token_hex(32),))
+        key = con.execute("SELECT value FROM app_secrets WHERE name='secret_key'").fetchone()[0]
+    con.close()
+    return key
+
+
+def get_ride_details(ride_id):
+    # ride_id may be an occurrence key for a series date with no row yet.
+    con = connect()
+    cur = con.cursor()
+    ref = ride_ref(cur, ride_id)
+    if ref is None:
+        occ = occurrence(cur, ride_id)
+        row = occ[:5] if occ else None
+    else:
+        row = cur.execute("""
+            SELECT ride_name, ride_date, start_time,
+                   meeting_point, route_link
+            FROM rides
+            WHERE id=? AND status = 'ACTIVE'
+        """, (ref,)).fetchone()
     con.close()
     return row
 
 
 def delete_ride(ride_id):
+    # Soft delete: the ride and its signups drop out of every listing, but
+    # attendance, routes and signup history stay for the season's records.
+    # For a series date this cancels just that occurrence.
+    now = now_utc_iso()
     con = connect()
     cur = con.cursor()
-    cur.execute("DELETE FROM signups WHERE ride_id=?", (ride_id,))
-    cur.execute("DELETE FROM rides WHERE id=?", (ride_id,))
+    key = OCCURRENCE.match(str(ride_id))
+    if key:
+        cur.execute("""
+            INSERT INTO series_exceptions (series_id, occurrence_date, cancelled)
+            VALUES (?,?,1)
+            ON CONFLICT(series_id, occurrence_date) DO UPDATE SET cancelled=1
+        """, (int(key.group(1)), key.group(2)))
+        ride_id = ride_ref(cur, ride_id)
+    cur.execute("""
+        UPDATE rides SET status='DELETED', deleted_utc=?
+        WHERE id=? AND status='ACTIVE'
+    """, (now, ride_id))
+    cur.execute("""
+        UPDATE signups SET status='CANCELLED', cancelled_utc=?
+        WHERE ride_id=? AND status IN ('ACTIVE', 'WAITLISTED')
+    """, (now, ride_id))
     con.commit()
     con.close()
 
 
+# ---------- SERIES ----------
+# Occurrences without a rides row are identified by an occurrence key,
+# "s<series id>-<YYYY-MM-DD>", wherever a ride id is expected from the
+# ride lists; ride_ref() maps a key to its rides.id once it exists.
+
+OCCURRENCE = re.compile(r"^s(\d+)-(\d{4}-\d{2}-\d{2})$")
+
+
+def occurrence_key(series_id, day):
+    return f"s{series_id}-{day}"
+
+
+def place_coords(cur, loc):
+    row = cur.execute("SELECT lat, lon FROM places WHERE place_key=?", (place_key(loc),)).fetchone()
+    return row if row else (None, None)
+
+
+def create_series(name, first_date, time, loc, route, lat=None, lon=None, capacity=None,
+                  until_date=None, interval_weeks=1):
+    # Repeats on first_date's weekday every interval_weeks weeks.
+    weekday = datetime.date.fromisoformat(first_date).weekday()
+    con = connect()
+    cur = con.cursor()
+    if lat is None or lon is None:
+        lat, lon = place_coords(cur, loc)
+    elif loc:
+        cur.execute("""
+            INSERT OR REPLACE INTO places (place_key, name, lat, lon)
+            VALUES (?,?,?,?)
+        """, (place_key(loc), loc, lat, lon))
+    cur.execute("""
+        INSERT INTO ride_series
+        (ride_name, weekday, interval_weeks, start_date, until_date,
+         start_time, meeting_point, route_link, lat, lon, capacity)
+        VALUES (?,?,?,?,?,?,?,?,?,?,?)
+    """, (name, weekday, interval_weeks, first_date, until_date or None,
+          time, loc, route, lat, lon, capacity))
+    series_id = cur.lastrowid
+    con.commit()
+    con.close()
+    return series_id
+
+
+def list_series():
+    con = connect()
+    cur = con.cursor()
+    rows = cur.execute("""
+        SELECT id, ride_name, weekday, interval_weeks, start_date, until_date, start_time
+        FROM ride_series
+        WHERE status = 'ACTIVE'
+        ORDER BY ride_name
+    """).fetchall()
+    con.close()
+    return rows
+
+
+def end_series(series_id):
+    # Stops future occurrences from being listed. Dates that already have
+    # signups keep their rides rows; delete those separately if needed.
+    con = connect()
+    cur = con.cursor()
+    cur.execute("UPDATE ride_series SET status='DELETED' WHERE id=?", (series_id,))
+    con.commit()
+    con.close()
+
+
+def on_schedule(day, weekday, interval_weeks, start_date, until_date):
+    start = datetime.date.fromisoformat(start_date)
+    first = start + datetime.timedelta(days=(weekday - start.weekday()) % 7)
+    if day < first or (until_date and day > datetime.date.fromisoformat(until_date)):
+        return False
+    return (day - first).days % (7 * max(interval_weeks, 1)) == 0
+
+
+def series_dates(weekday, interval_weeks, start_date, until_date, lo, hi):
+    start = datetime.date.fromisoformat(start_date)
+    day = start + datetime.timedelta(days=(weekday - start.weekday()) % 7)
+    step = datetime.timedelta(weeks=max(interval_weeks, 1))
+    if day < lo:
+        day += step * -(-(lo - day).days // step.days)
+    if until_date:
+        hi = min(hi, datetime.date.fromisoformat(until_date))
+    while day <= hi:
+        yield day
+        day += step
+
+
+def expand_series(cur, start=None, weeks=None):
+    # [(key, name, date, time, loc, route)] for series dates from start
+    # (today) through the window that are not cancelled and have no rides
+    # row yet (those are listed as ordinary rides). Costs one small query
+    # per table, whatever the length of the series.
+    lo = start or datetime.date.today()
+    hi = lo + datetime.timedelta(weeks=SERIES_WEEKS if weeks is None else weeks)
+    series = cur.execute("""
+        SELECT id, ride_name, weekday, interval_weeks, start_date, until_date,
+               start_time, meeting_point, route_link
+        FROM ride_series
+        WHERE status = 'ACTIVE' AND start_date <= ?
+          AND (until_date IS NULL OR until_date >= ?)
+    """, (hi.isoformat(), lo.isoformat())).fetchall()
+    if not series:
+        return []
+    window = (lo.isoformat(), hi.isoformat())
+    exceptions = {(r[0], r[1]): r[2:] for r in cur.execute("""
+        SELECT series_id, occurrence_date, cancelled,
+               ride_name, start_time, meeting_point, route_link
+        FROM series_exceptions
+        WHERE occurrence_date BETWEEN ? AND ?
+    """, window)}
+    materialized = set(cur.execute("""
+        SELECT series_id, occurrence_date
+        FROM rides
+        WHERE series_id IS NOT NULL AND occurrence_date BETWEEN ? AND ?
+    """, window).fetchall())
+    rows = []
+    for series_id, name, weekday, interval, first, until, time, loc, route in series:
+        for day in series_dates(weekday, interval, first, until, lo, hi):
+            day = day.isoformat()
+            if (series_id, day) in materialized:
+                continue
+            cancelled, *override = exceptions.get((series_id, day), (0, None, None, None, None))
+            if cancelled:
+                continue
+            o_name, o_time, o_loc, o_route = override
+            rows.append((occurrence_key(series_id, day), o_name or name, day,
+                         o_time or time, o_loc or loc, o_route or route))
+    return rows
+
+
+def occurrence_keys():
+    # {str(rides.id): occurrence key} for series dates that have their own
+    # rides row, so a date keeps the same calendar UID after its first
+    # signup creates the row.
+    con = connect()
+    rows = con.execute("""
+        SELECT id, series_id, occurrence_date
+        FROM rides
+        WHERE series_id IS NOT NULL
+    """).fetchall()
+    con.close()
+    return {str(i): occurrence_key(series_id, day) for i, series_id, day in rows}
+
+
+def merge_occurrences(rows, occurrences):
+    if not occurrences:
+        return rows
+    return sorted(list(rows) + list(occurrences), key=lambda r: r[2] or "")
+
+
+def occurrence(cur, key):
+    # (name, date, time, loc, route, lat, lon, capacity) for a valid,
+    # uncancelled series date, or None.
+    m = OCCURRENCE.match(str(key))
+    if not m:
+        return None
+    series_id, day = int(m.group(1)), m.group(2)
+    row = cur.execute("""
+        SELECT s.ride_name, s.weekday, s.interval_weeks, s.start_date, s.until_date,
+               s.start_time, s.meeting_point, s.route_link, s.lat, s.lon, s.capacity,
+               e.cancelled, e.ride_name, e.start_time, e.meeting_point, e.route_link
+        FROM ride_series s
+        LEFT JOIN series_exceptions e
+        ON e.series_id = s.id AND e.occurrence_date = ?
+        WHERE s.id = ? AND s.status = 'ACTIVE'
+    """, (day, series_id)).fetchone()
+    if not row or row[11]:
+        return None
+    name, weekday, interval, first, until, time, loc, route, lat, lon, capacity = row[:11]
+    try:
+        if not on_schedule(datetime.date.fromisoformat(day), weekday, interval, first, until):
+            return None
+    except ValueError:
+        return None
+    o_name, o_time, o_loc, o_route = row[12:]
+    if o_loc:
+        lat, lon = place_coords(cur, o_loc)
+    return (o_name or name, day, o_time or time, o_loc or loc, o_route or route,
+            lat, lon, capacity)
+
+
+def ride_ref(cur, ride_id, materialize=False):
+    # rides.id for a ride id or occurrence key. An occurrence with no row
+    # yet gives None, unless materialize is set, in which case its row is
+    # created from the series (and any override for that date).
+    m = OCCURRENCE.match(str(ride_id))
+    if not m:
+        return ride_id
+    find = ("SELECT id FROM rides WHERE series_id=? AND occurrence_date=?",
+            (int(m.group(1)), m.group(2)))
+    row = cur.execute(*find).fetchone()
+    if row or not materialize:
+        return row[0] if row else None
+    occ = occurrence(cur, ride_id)
+    if not occ:
+        return None
+    # OR IGNORE: two first signups racing for the same date share one row.
+    cur.execute("""
+        INSERT OR IGNORE INTO rides
+        (ride_name, ride_date, start_time, meeting_point, route_link, lat, lon, capacity,
+         series_id, occurrence_date)
+        VALUES (?,?,?,?,?,?,?,?,?,?)
+    """, occ + find[1])
+    return cur.execute(*find).fetchone()[0]
+
+
+def change_ride(ride_id, time=None, loc=None, route=None):
+    # Overrides one ride's start time, meeting point or route link (None
+    # or "" keeps the current value). For a series date with no row yet
+    # the override is stored as a series exception.
+    con = connect()
+    cur = con.cursor()
+    ref = ride_ref(cur, ride_id)
+    m = OCCURRENCE.match(str(ride_id))
+    if ref is None and m:
+        cur.execute("""
+            INSERT INTO series_exceptions
+            (series_id, occurrence_date, start_time, meeting_point, route_link)
+            VALUES (?,?,?,?,?)
+            ON CONFLICT(series_id, occurrence_date) DO UPDATE SET
+                start_time = coalesce(excluded.start_time, start_time),
+                meeting_point = coalesce(excluded.meeting_point, meeting_point),
+                route_link = coalesce(excluded.route_link, route_link)
+        """, (int(m.group(1)), m.group(2), time or None, loc or None, route or None))
+    else:
+        lat, lon = place_coords(cur, loc) if loc else (None, None)
+        cur.execute("""
+            UPDATE rides SET
+                start_time = coalesce(?, start_time),
+                meeting_point = coalesce(?, meeting_point),
+                route_link = coalesce(?, route_link),
+                lat = CASE WHEN ? IS NULL THEN lat ELSE ? END,
+                lon = CASE WHEN ? IS NULL THEN lon ELSE ? END
+            WHERE id=? AND status='ACTIVE'
+        """, (time or None, loc or None, route or None, loc or None, lat, loc or None, lon, ref))
+    changed = cur.rowcount
+    con.commit()
+    con.close()
+    return changed
+
+
+# ---------- LOCATIONS ----------
+
+def list_places():
+    con = connect()
+    cur = con.cursor()
+    rows = cur.execute("""
+        SELECT name, lat, lon
+        FROM places
+        ORDER BY name
+    """).fetchall()
+    con.close()
+    return rows
+
+
+def rides_in_box(min_lat, max_lat, min_lon, max_lon):
+    con = connect()
+    cur = con.cursor()
+    rows = cur.execute("""
+        SELECT r.id, r.ride_name, r.ride_date, r.lat, r.lon
+        FROM ride_geo g
+        JOIN rides r ON r.id = g.id
+        WHERE r.status = 'ACTIVE'
+          AND g.max_lat >= ? AND g.min_lat <= ?
+          AND g.max_lon >= ? AND g.min_lon <= ?
+    """, (min_lat, max_lat, min_lon, max_lon)).fetchall()
+    con.close()
+    return rows
+
+
+# ---------- ROUTES ----------
+
+def save_ride_route(ride_id, stats):
+    con = connect()
+    cur = con.cursor()
+    ride_id = ride_ref(cur, ride_id, materialize=True)
+    cur.execute("""
+        INSERT OR REPLACE INTO ride_routes
+        (ride_id, distance_m, elevation_gain_m, min_lat, min_lon,
+         max_lat, max_lon, point_count, polyline)
+        VALUES (?,?,?,?,?,?,?,?,?)
+    """, (ride_id, stats["distance_m"], stats["elevation_gain_m"],
+          stats["min_lat"], stats["min_lon"], stats["max_lat"], stats["max_lon"],
+          stats["point_count"], stats["polyline"]))
+    con.commit()
+    con.close()
+
+
+def get_ride_route(ride_id):
+    con = connect()
+    cur = con.cursor()
+    row = cur.execute("""
+        SELECT distance_m, elevation_gain_m, point_count, polyline
+        FROM ride_routes
+        WHERE ride_id=?
+    """, (ride_ref(cur, ride_id),)).fetchone()
+    con.close()
+    return row
+
+
 # ---------- SIGNUP ----------
 
+# The capacity check and the insert are one statement, so two riders
+# taking the last spot at once can't both get it. Once anyone is waiting,
+# new signups queue behind them even if a spot has just freed up; the
+# waitlist worker hands spots out in order. A code that is already in the
+# table (a journal replay of a signup that did commit) is skipped. Both
+# apps insert through it; TU_Rides.py also fills in the contact columns.
+SIGNUP_SQL = """
+    INSERT INTO signups
+    (ride_id, full_name, confirm_code, created_utc, status,
+     email, email_key, phone, city, notes, acknowledge, cancel_token)
+    SELECT :ride, :name, :code, :utc, coalesce((
+        SELECT CASE
+            WHEN r.capacity IS NULL THEN 'ACTIVE'
+            WHEN EXISTS (SELECT 1 FROM signups w
+                         WHERE w.ride_id = r.id AND w.status = 'WAITLISTED') THEN 'WAITLISTED'
+            WHEN (SELECT count(*) FROM signups a
+                  WHERE a.ride_id = r.id AND a.status = 'ACTIVE') >= r.capacity THEN 'WAITLISTED'
+            ELSE 'ACTIVE' END
+        FROM rides r WHERE r.id = :ride
+    ), 'ACTIVE'),
+    :email, email_key(:email), :phone, :city, :notes, :acknowledge, :cancel_token
+    WHERE NOT EXISTS (SELECT 1 FROM signups WHERE confirm_code = :code)
+"""
+
+CANCEL_SQL = """
+    UPDATE signups SET status='CANCELLED', cancelled_utc=:utc
+    WHERE id = (SELECT coalesce(merged_into, id) FROM signups WHERE {key}=:code)
+      AND status IN ('ACTIVE', 'WAITLISTED')
+"""
+CANCEL_BY_CODE_SQL = CANCEL_SQL.format(key="confirm_code")
+CANCEL_BY_TOKEN_SQL = CANCEL_SQL.format(key="cancel_token")
+
+
+def signup_params(ride_id, full_name, code, utc, email=None, phone=None, city=None,
+                  notes=None, acknowledge=0, cancel_token=None):
+    return {"ride": ride_id, "name": full_name, "code": code, "utc": utc,
+            "email": email, "phone": phone, "city": city, "notes": notes,
+            "acknowledge": acknowledge, "cancel_token": cancel_token}
+
+
+# Codes are 8 hex characters, so one can repeat an earlier rider's; the
+# insert then does nothing (SIGNUP_SQL's NOT EXISTS guard) and a fresh
+# code is tried, never handing out a code that belongs to someone else.
+CODE_ATTEMPTS = 5
+
+
+def new_code():
+    return uuid.uuid4().hex[:8].upper()
+
+
+def insert_with_new_code(cur, params):
+    # Runs SIGNUP_SQL with fresh codes until a row goes in; returns the code.
+    for _ in range(CODE_ATTEMPTS):
+        params["code"] = new_code()
+        cur.execute(SIGNUP_SQL, params)
+        if cur.rowcount:
+            return params["code"]
+    raise sqlite3.IntegrityError(f"no unused confirmation code after {CODE_ATTEMPTS} tries")
+
+
+def journal_path(db_path=None):
+    return os.path.splitext(db_path or DB)[0] + "-journal.ndjson"
+
+
+def ride_open(cur, ref):
+    return ref is not None and cur.execute(
+        "SELECT 1 FROM rides WHERE id=? AND status='ACTIVE'", (ref,)).fetchone() is not None
+
+
 def signup(ride_id, full_name):
-    code = str(uuid.uuid4())[:8].upper()
+    # Journaled once committed, so the journal only ever holds codes that
+    # were handed out. The first signup for a series date creates its
+    # rides row in the same transaction. Returns None if the ride doesn't
+    # exist (or was deleted).
+    now = now_utc_iso()
     con = connect()
     cur = con.cursor()
-    cur.execute("""
-        INSERT INTO signups
-        (ride_id, full_name, confirm_code)
-        VALUES (?,?,?)
-    """, (ride_id, full_name, code))
+    ref = ride_ref(cur, ride_id, materialize=True)
+    if not ride_open(cur, ref):
+        con.rollback()
+        con.close()
+        return None
+    try:
+        code = insert_with_new_code(cur, signup_params(ref, full_name, None, now))
+    except sqlite3.Error:
+        con.rollback()
+        con.close()
+        raise
     con.commit()
     con.close()
+    if JOURNALED:
+        journal.append(journal_path(), {"t": now, "op": "signup", "code": code,
+                                        "ride": ride_id, "name": full_name})
+    forget_my_rides()
     return code
 
 
+def waitlist_position(code):
+    # 1-based place in the ride's waitlist, or None if not waitlisted.
+    con = connect()
+    cur = con.cursor()
+    row = cur.execute("""
+        SELECT (SELECT count(*) FROM signups w
+                WHERE w.ride_id = s.ride_id AND w.status = 'WAITLISTED' AND w.id <= s.id)
+        FROM signups s
+        WHERE s.confirm_code=? AND s.status = 'WAITLISTED'
+    """, (code,)).fetchone()
+    con.close()
+    return row[0] if row else None
+
+
+def ride_spots(ride_id):
+    # (capacity, active, waiting); capacity is None for open rides.
+    con = connect()
+    cur = con.cursor()
+    ref = ride_ref(cur, ride_id)
+    if ref is None:
+        occ = occurrence(cur, ride_id)
+        con.close()
+        return (occ[7] if occ else None, 0, 0)
+    row = cur.execute("""
+        SELECT r.capacity,
+               (SELECT count(*) FROM signups a WHERE a.ride_id = r.id AND a.status = 'ACTIVE'),
+               (SELECT count(*) FROM signups w WHERE w.ride_id = r.id AND w.status = 'WAITLISTED')
+        FROM rides r
+        WHERE r.id=?
+    """, (ref,)).fetchone()
+    con.close()
+    return row
+
+
 def cancel_signup(code):
+    # Also takes riders off the waitlist. A freed roster spot is filled by
+    # the waitlist worker; callers wake it with waitlist.wake().
+    now = now_utc_iso()
     con = connect()
     cur = con.cursor()
-    cur.execute("""
-        DELETE FROM signups
-        WHERE confirm_code=?
-    """, (code,))
+    cur.execute(CANCEL_BY_CODE_SQL, {"code": code, "utc": now})
     removed = cur.rowcount
     con.commit()
     con.close()
+    if removed:
+        if JOURNALED:
+            journal.append(journal_path(), {"t": now, "op": "cancel", "code": code})
+        forget_my_rides()
     return removed
 
 
+def replay_journal(db_path=None):
+    # Run once at startup, before serving. Every journal line is applied
+    # again in order; both statements are no-ops for lines that already
+    # reached the database, so only committed writes the database lost
+    # land. A signup is not restored onto a ride that has since been
+    # deleted or a series date since cancelled. The journal is rotated
+    # only if no other process still has it open. Returns (signups
+    # restored, cancellations restored).
+    if ENGINE == "memory":
+        return (0, 0)
+    path = journal_path(db_path)
+    restored = [0, 0]
+    con = connect(db_path)
+    cur = con.cursor()
+    with con:
+        for record in journal.read(path):
+            if record.get("op") == "signup":
+                if cur.execute("SELECT 1 FROM signups WHERE confirm_code=?",
+                               (record.get("code"),)).fetchone():
+                    continue
+                ride_id = ride_ref(cur, record.get("ride"), materialize=True)
+                if not ride_open(cur, ride_id):
+                    continue
+                cur.execute(SIGNUP_SQL, signup_params(ride_id, record.get("name"),
+                                                      record.get("code"), record.get("t")))
+                restored[0] += cur.rowcount
+            elif record.get("op") == "cancel":
+                cur.execute(CANCEL_BY_CODE_SQL, {"code": record.get("code"), "utc": record.get("t")})
+                restored[1] += cur.rowcount
+    con.close()
+    journal.rotate(path)
+    return tuple(restored)
+
+
 def roster():
     con = connect()
     cur = con.cursor()
@@ -122,7 +1222,270 @@ def roster():
         FROM signups s
         JOIN rides r
         ON s.ride_id = r.id
+        WHERE s.status = 'ACTIVE' AND r.status = 'ACTIVE'
         ORDER BY r.ride_date
     """).fetchall()
     con.close()
-    return rows
\ No newline at end of file
+    return rows
+
+
+# ---------- CHECK-IN ----------
+
+def checkin_roster(ride_id):
+    con = connect()
+    cur = con.cursor()
+    rows = cur.execute("""
+        SELECT s.id, s.full_name, a.signup_id IS NOT NULL
+        FROM signups s
+        LEFT JOIN attendance a
+        ON a.signup_id = s.id
+        WHERE s.ride_id=? AND s.status = 'ACTIVE'
+        ORDER BY s.full_name
+    """, (ride_id,)).fetchall()
+    con.close()
+    return rows
+
+
+def record_checkins(ride_id, checkins):
+    # checkins: [(signup_id, checked_in_utc)]. One transaction; ids that are
+    # not signups for this ride, or already checked in, are ignored.
+    con = connect()
+    cur = con.cursor()
+    with con:
+        cur.executemany("""
+            INSERT OR IGNORE INTO attendance (signup_id, ride_id, checked_in_utc)
+            SELECT id, ride_id, ?
+            FROM signups
+            WHERE id=? AND ride_id=? AND status = 'ACTIVE'
+        """, [(ts, signup_id, ride_id) for signup_id, ts in checkins])
+        saved = cur.rowcount
+    con.close()
+    return saved
+
+
+def roster_compact():
+    con = connect()
+    cur = con.cursor()
+    result = CompactRoster(cur.execute("""
+        SELECT id, ride_name, ride_date
+        FROM rides
+        WHERE status = 'ACTIVE'
+        ORDER BY ride_date
+    """).fetchall())
+    for ride_id, full_name in cur.execute("""
+        SELECT s.ride_id, s.full_name
+        FROM signups s
+        JOIN rides r
+        ON s.ride_id = r.id
+        WHERE s.status = 'ACTIVE' AND r.status = 'ACTIVE'
+        ORDER BY r.ride_date
+    """):
+        result.append(ride_id, full_name)
+    con.close()
+    return result
+
+
+# ---------- RSVP (TU_Rides.py) ----------
+# TU_Rides.py collects free-form rides plus contact details. Its signups
+# use the same normalized tables: the ride is looked up (or created) by
+# name and date, and the signup row references it by ride_id.
+
+SIGNUP_FIELDS = ["created_utc", "ride_name", "ride_date", "start_time", "meeting_point",
+                 "route_link", "full_name", "email", "phone", "city", "notes", "status"]
+
+
+def find_or_create_ride(cur, name, date, time, loc, route):
+    row = cur.execute("""
+        SELECT id FROM rides
+        WHERE ride_name=? AND ride_date=? AND status='ACTIVE'
+        ORDER BY id
+        LIMIT 1
+    """, (name, date)).fetchone()
+    if row:
+        return row[0]
+    cur.execute("""
+        INSERT INTO rides
+        (ride_name, ride_date, start_time, meeting_point, route_link)
+        VALUES (?,?,?,?,?)
+    """, (name, date, time, loc, route))
+    return cur.lastrowid
+
+
+def insert_signup(db_path, created_utc, ride_name, ride_date, start_time, meeting_point,
+                  route_link, full_name, email, phone, city, notes, acknowledge, cancel_token):
+    # Same capacity check and waitlist order as app.py's signups, and the
+    # same fresh-code retry. Returns the new row's status, 'ACTIVE' or
+    # 'WAITLISTED'.
+    con = connect(db_path)
+    cur = con.cursor()
+    with con:
+        ride_id = find_or_create_ride(cur, ride_name, ride_date, start_time,
+                                      meeting_point, route_link)
+        insert_with_new_code(cur, signup_params(ride_id, full_name, None, created_utc, email,
+                                                phone, city, notes, acknowledge, cancel_token))
+        status = cur.execute("SELECT status FROM signups WHERE id=?",
+                             (cur.lastrowid,)).fetchone()[0]
+    con.close()
+    forget_my_rides()
+    return status
+
+
+def has_table(cur, name):
+    return cur.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?",
+                       (name,)).fetchone() is not None
+
+
+def cancel_signup_by_token(db_path, token):
+    # Like cancel_signup(), a freed spot is filled by the waitlist worker;
+    # callers wake it with waitlist.wake().
+    con = connect(db_path)
+    cur = con.cursor()
+    with con:
+        cur.execute(CANCEL_BY_TOKEN_SQL, {"code": token, "utc": now_utc_iso()})
+        cancelled = cur.rowcount
+        # Rows not yet copied by an in-progress migration still live here.
+        if has_table(cur, "signups_legacy"):
+            cur.execute("""
+                UPDATE signups_legacy SET status='CANCELLED'
+                WHERE cancel_token=? AND status='ACTIVE'
+            """, (token,))
+            cancelled = cancelled or cur.rowcount
+    con.close()
+    if cancelled:
+        forget_my_rides()
+    return cancelled > 0
+
+
+def list_signups(db_path):
+    con = connect(db_path)
+    cur = con.cursor()
+    rows = cur.execute("""
+        SELECT s.created_utc, r.ride_name, r.ride_date, r.start_time,
+               r.meeting_point, r.route_link, s.full_name, s.email,
+               s.phone, s.city, s.notes, s.status
+        FROM signups s
+        JOIN rides r
+        ON s.ride_id = r.id
+        ORDER BY s.created_utc DESC
+    """).fetchall()
+    if has_table(cur, "signups_legacy"):
+        rows = cur.execute("""
+            SELECT created_utc, ride_name, ride_date, start_time,
+                   meeting_point, route_link, full_name, email,
+                   phone, city, notes, status
+            FROM signups_legacy
+            WHERE id > (SELECT coalesce(max(value), 0) FROM meta WHERE key='legacy_migrated_id')
+        """).fetchall() + rows
+        rows.sort(key=lambda r: r[0] or "", reverse=True)
+    con.close()
+    return [dict(zip(SIGNUP_FIELDS, r)) for r in rows]
+
+
+# ---------- EMAIL ----------
+MERGE_FIELDS = ("phone", "city", "notes")
+
+
+def dedupe_signups(cur):
+    # Merges repeat signups (same ride, same email key, still ACTIVE or
+    # WAITLISTED) into one row: the earliest one holding a roster spot, or
+    # the earliest waitlisted one. It picks up the newest non-empty phone,
+    # city and notes from the others. Returns the number of rows merged.
+    rows = cur.execute("""
+        SELECT s.id, s.ride_id, s.email_key, s.status, s.phone, s.city, s.notes
+        FROM (SELECT email_key, ride_id FROM signups
+              WHERE email_key IS NOT NULL AND status IN ('ACTIVE', 'WAITLISTED')
+              GROUP BY email_key, ride_id
+              HAVING count(*) > 1) d
+        JOIN signups s ON s.email_key = d.email_key AND s.ride_id = d.ride_id
+        WHERE s.status IN ('ACTIVE', 'WAITLISTED')
+        ORDER BY s.email_key, s.ride_id, s.status = 'ACTIVE' DESC, s.id
+    """).fetchall()
+    groups = {}
+    for row in rows:
+        groups.setdefault((row[2], row[1]), []).append(row)
+    merged = 0
+    for group in groups.values():
+        keep, extras = group[0], group[1:]
+        values = {}
+        for row in sorted(group, key=lambda r: r[0]):
+            for field, value in zip(MERGE_FIELDS, row[4:]):
+                if value:
+                    values[field] = value
+        cur.execute("UPDATE signups SET phone=?, city=?, notes=? WHERE id=?",
+                    [values.get(f) for f in MERGE_FIELDS] + [keep[0]])
+        cur.executemany("UPDATE signups SET status='MERGED', merged_into=? WHERE id=?",
+                        [(keep[0], row[0]) for row in extras])
+        merged += len(extras)
+    return merged
+
+
+# ---------- MY RIDES ----------
+# A confirmation code only ever shows its own signup, since the code is
+# also what cancels it. The full list for an email address is only ever
+# mailed to that address (email_utils.email_my_rides), never shown to
+# whoever typed it in. Code lookups are kept for MY_RIDES_SECONDS so
+# repeated refreshes don't reopen the database. Signups, cancellations
+# and waitlist promotions in this process clear them at once; other
+# changes (edited rides, TU_Rides.py) show within the window.
+MY_RIDES_SECONDS = 10
+
+MY_RIDES_SQL = """
+    SELECT s.confirm_code, s.status, r.id, r.ride_name, r.ride_date, r.start_time, r.meeting_point
+    FROM signups s
+    JOIN rides r ON r.id = s.ride_id
+    WHERE {rider} AND s.status IN ('ACTIVE', 'WAITLISTED')
+      AND r.status = 'ACTIVE' AND r.ride_date >= ?
+    ORDER BY r.ride_date, r.start_time, r.id
+"""
+MY_RIDES_BY = {
+    # A merged duplicate's code follows it to the row it was folded into.
+    "code": "s.id = (SELECT coalesce(merged_into, id) FROM signups WHERE confirm_code = ?)",
+    "email": "s.email_key = ?",
+}
+
+# code -> (expires, rows)
+_my_rides = {}
+
+
+def forget_my_rides():
+    _my_rides.clear()
+
+
+def my_rides(code):
+    # Returns None for an unknown code, else the code's signup as a
+    # (confirm_code, status, ride_id, name, date, time, meeting point) row,
+    # or no rows once the ride has passed or the signup was cancelled.
+    code = (code or "").strip().upper()
+    if not code:
+        return None
+    now = time.monotonic()
+    hit = _my_rides.get(code)
+    if hit and hit[0] > now:
+        return hit[1]
+    con = connect()
+    cur = con.cursor()
+    if not cur.execute("SELECT 1 FROM signups WHERE confirm_code=?", (code,)).fetchone():
+        con.close()
+        return None
+    rows = cur.execute(MY_RIDES_SQL.format(rider=MY_RIDES_BY["code"]),
+                       (code, datetime.date.today().isoformat())).fetchall()
+    con.close()
+    rows = [(code, *row[1:]) for row in rows]
+    if len(_my_rides) >= 1000:
+        for k in [k for k, v in list(_my_rides.items()) if v[0] <= now]:
+            _my_rides.pop(k, None)
+    _my_rides[code] = (now + MY_RIDES_SECONDS, rows)
+    return rows
+
+
+def rides_for_email(email):
+    # Every upcoming signup under this email, in my_rides() rows. Only for
+    # mailing to that address.
+    key = email_key(email)
+    if key is None:
+        return []
+    con = connect()
+    rows = con.execute(MY_RIDES_SQL.format(rider=MY_RIDES_BY["email"]),
+                       (key, datetime.date.today().isoformat())).fetchall()
+    con.close()
+    return rows
@@ -0,0 +1,49 @@
+import os
+import smtplib
+
+import notify
+from database import rides_for_email
+
+# Outgoing mail: TU_Rides.py's RSVP confirmations and "My Rides" lists.
+# Messages are the notify templates serialized by notify.message_batch(),
+# sent to the SMTP server in TEAMUGLY_SMTP_HOST / TEAMUGLY_SMTP_PORT. With
+# no server set, sending raises; TU_Rides.py then shows the rider their
+# cancel code instead, and "My Rides" only takes confirmation numbers.
+SMTP_HOST = os.getenv("TEAMUGLY_SMTP_HOST", "")
+SMTP_PORT = int(os.getenv("TEAMUGLY_SMTP_PORT", "25"))
+
+
+def smtp_bytes(data):
+    # message_batch() writes LF line endings (what an mbox wants); SMTP
+    # needs CRLF, and smtplib leaves bytes messages as they are.
+    return data.replace(b"\r\n", b"\n").replace(b"\n", b"\r\n")
+
+
+def send(messages):
+    if not SMTP_HOST:
+        raise RuntimeError("TEAMUGLY_SMTP_HOST is not set")
+    with smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=30) as smtp:
+        for to, data in notify.message_batch(messages):
+            smtp.sendmail(notify.MAIL_FROM, [to], smtp_bytes(data))
+
+
+def send_confirmation_email(to_email, full_name, ride_name, ride_date, start_time,
+                            meeting_point, route_link, cancel_link):
+    context = notify.ride_context((ride_name, ride_date, start_time, meeting_point, route_link),
+                                  "", "")
+    contact = {"email": to_email, "first": (full_name or "").split(" ")[0],
+               "cancel_link": cancel_link}
+    send(notify.render_messages([contact], context, "confirmation"))
+
+
+def email_my_rides(email):
+    # Mails the upcoming rides booked under this address, with their
+    # confirmation numbers, to that address only. Nothing is sent when
+    # there are none. Returns the number of rides listed.
+    rows = rides_for_email(email)
+    if rows:
+        rides = [{"code": code, "waitlisted": status == "WAITLISTED", "name": name,
+                  "date": date, "time": time, "loc": loc or ""}
+                 for code, status, _, name, date, time, loc in rows]
+        send(notify.render_messages([{"email": email.strip(), "rides": rides}], {}, "my_rides"))
+    return len(rows)
@@ -0,0 +1,187 @@
+import argparse
+import csv
+import datetime
+import os
+import random
+import sqlite3
+import time
+
+import database
+
+FIRST = ["Ana", "Ben", "Carla", "Dev", "Elena", "Frank", "Grace", "Hector", "Ivy", "Jamal",
+         "Kim", "Luis", "Maya", "Nate", "Olivia", "Priya", "Quinn", "Rosa", "Sam", "Tara",
+         "Uma", "Victor", "Wes", "Ximena", "Yusuf", "Zoe"]
+LAST = ["Adams", "Brooks", "Chen", "Diaz", "Evans", "Foster", "Garcia", "Hughes", "Ito",
+        "Johnson", "Khan", "Lopez", "Murphy", "Nguyen", "Ortiz", "Patel", "Reyes", "Smith",
+        "Turner", "Walker", "Young"]
+RIDES = ["Saturday Training Ride", "Weeknight Ride", "Long Ride", "Social / Coffee Ride",
+         "Hill Repeats", "Recovery Spin"]
+TIMES = ["6:30 AM", "7:00 AM", "7:30 AM", "8:00 AM", "6:00 PM", "6:30 PM"]
+PLACES = [
+    ("Katy Trail Outpost", 32.8051, -96.8036),
+    ("White Rock Lake Boathouse", 32.8259, -96.7261),
+    ("Arbor Hills Nature Preserve", 33.0479, -96.8510),
+    ("Frisco Commons Park", 33.1540, -96.8260),
+    ("Bob Woodruff Park", 33.0350, -96.6740),
+    ("Trinity Trails Fort Worth", 32.7355, -97.3640),
+]
+CITIES = ["Dallas", "Plano", "Frisco", "Richardson", "Fort Worth", "McKinney", "Allen"]
+
+CHUNK = 50_000
+
+
+# ---------- ROW FACTORIES ----------
+def rider_pool(rng, size):
+    riders = []
+    for i in range(size):
+        first, last = rng.choice(FIRST), rng.choice(LAST)
+        riders.append((first, f"{first} {last}", f"{first}.{last}{i}@example.com".lower()))
+    return riders
+
+
+def ride_rows(rng, count, start):
+    for i in range(count):
+        name, lat, lon = rng.choice(PLACES)
+        day = start + datetime.timedelta(days=i * 365 // count)
+        yield (f"{rng.choice(RIDES)} #{i + 1}", day.isoformat(), rng.choice(TIMES),
+               name, f"https://ridewithgps.com/routes/{rng.randint(10**6, 10**7)}", lat, lon)
+
+
+def chunks(rows, size=CHUNK):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def fast_load(con):
+    # Throwaway fixture databases: skip durability for load speed.
+    con.execute("PRAGMA synchronous=OFF")
+    con.execute("PRAGMA cache_size=-200000")
+
+
+# ---------- APP SCHEMA (database.init_db) ----------
+def generate_app(db_path, rng, n_rides, n_signups, riders, start):
+    database.DB = db_path
+    database.init_db()
+    con = sqlite3.connect(db_path)
+    fast_load(con)
+    with con:
+        con.executemany("""
+            INSERT INTO rides
+            (ride_name, ride_date, start_time, meeting_point, route_link, lat, lon)
+            VALUES (?,?,?,?,?,?,?)
+        """, ride_rows(rng, n_rides, start))
+        con.executemany("""
+            INSERT OR IGNORE INTO places (place_key, name, lat, lon)
+            VALUES (?,?,?,?)
+        """, [(database.place_key(n), n, lat, lon) for n, lat, lon in PLACES])
+    first_id = con.execute("SELECT min(id) FROM rides").fetchone()[0]
+    last_id = con.execute("SELECT max(id) FROM rides").fetchone()[0]
+
+    def signups():
+        for _ in range(n_signups):
+            yield (rng.randint(first_id, last_id), rng.choice(riders)[1], f"{rng.getrandbits(32):08X}")
+
+    for batch in chunks(signups()):
+        with con:
+            con.executemany("""
+                INSERT INTO signups (ride_id, full_name, confirm_code)
+                VALUES (?,?,?)
+            """, batch)
+    con.close()
+
+
+# ---------- LEGACY SCHEMA (schema.sql, TU_Rides.py) ----------
+def generate_legacy(db_path, rng, n_rides, n_signups, riders, start):
+    con = sqlite3.connect(db_path)
+    fast_load(con)
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "schema.sql")) as f:
+        con.executescript(f.read())
+    rides = list(ride_rows(rng, n_rides, start))
+    stamp = datetime.datetime(start.year, 1, 1)
+
+    def signups():
+        for i in range(n_signups):
+            ride = rng.choice(rides)
+            _, full_name, email = rng.choice(riders)
+            created = stamp + datetime.timedelta(seconds=i * 7)
+            token = "%08x-%04x-%04x-%04x-%012x" % (rng.getrandbits(32), rng.getrandbits(16),
+                                                   rng.getrandbits(16), rng.getrandbits(16),
+                                                   rng.getrandbits(48))
+            yield (created.isoformat() + "Z", ride[0], ride[1], ride[2], ride[3], ride[4],
+                   full_name, email, "", rng.choice(CITIES), "", 1, token,
+                   "CANCELLED" if rng.random() < 0.1 else "ACTIVE")
+
+    for batch in chunks(signups()):
+        with con:
+            con.executemany("""
+                INSERT INTO signups
+                (created_utc, ride_name, ride_date, start_time, meeting_point, route_link,
+                 full_name, email, phone, city, notes, acknowledge, cancel_token, status)
+                VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?)
+            """, batch)
+    con.close()
+
+
+# ---------- CONTACTS ----------
+def generate_contacts(path, rng, riders, count):
+    # Includes some case/whitespace variants of the same address, as real
+    # mailing lists collected over several seasons do.
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["First Name", "Email"])
+        for first, _, email in rng.sample(riders, min(count, len(riders))):
+            writer.writerow([first, email])
+            if rng.random() < 0.05:
+                writer.writerow([first, " " + email.title() + " "])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate seeded synthetic ride data.")
+    parser.add_argument("--db", default="data/synthetic.sqlite")
+    parser.add_argument("--schema", choices=["app", "legacy"], default="app",
+                        help="app: database.init_db tables; legacy: schema.sql signups")
+    parser.add_argument("--rides", type=int, default=200)
+    parser.add_argument("--signups", type=int, default=10_000)
+    parser.add_argument("--riders", type=int, default=5_000)
+    parser.add_argument("--contacts", type=int, default=2_000,
+                        help="rows for contacts.csv (0 to skip)")
+    parser.add_argument("--contacts-csv", default="data/contacts.csv")
+    parser.add_argument("--start", default="2026-01-03", help="first ride date")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--force", action="store_true", help="replace an existing --db file")
+    args = parser.parse_args(argv)
+
+    if os.path.exists(args.db):
+        if not args.force:
+            parser.error(f"{args.db} exists; pass --force to replace it")
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(args.db + suffix):
+                os.remove(args.db + suffix)
+    os.makedirs(os.path.dirname(args.db) or ".", exist_ok=True)
+
+    rng = random.Random(args.seed)
+    start = datetime.date.fromisoformat(args.start)
+    riders = rider_pool(rng, args.riders)
+
+    t0 = time.perf_counter()
+    if args.schema == "app":
+        generate_app(args.db, rng, args.rides, args.signups, riders, start)
+    else:
+        generate_legacy(args.db, rng, args.rides, args.signups, riders, start)
+    elapsed = time.perf_counter() - t0
+    print(f"{args.db}: {args.rides} rides, {args.signups} signups in {elapsed:.1f}s")
+
+    if args.contacts:
+        os.makedirs(os.path.dirname(args.contacts_csv) or ".", exist_ok=True)
+        generate_contacts(args.contacts_csv, rng, riders, args.contacts)
+        print(f"{args.contacts_csv}: {args.contacts} contacts")
+
+
+if __name__ == "__main__":
+    main()
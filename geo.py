@@ -0,0 +1,44 @@
+import math
+
+from database import rides_in_box
+
+EARTH_RADIUS_M = 6371008.8
+METERS_PER_MILE = 1609.344
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp, dl = p2 - p1, math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+
+def bounding_box(lat, lon, radius_m):
+    dlat = math.degrees(radius_m / EARTH_RADIUS_M)
+    coslat = max(math.cos(math.radians(lat)), 1e-6)
+    dlon = min(math.degrees(radius_m / (EARTH_RADIUS_M * coslat)), 180.0)
+    return lat - dlat, lat + dlat, lon - dlon, lon + dlon
+
+
+# ---------- QUERIES ----------
+def rides_near(lat, lon, radius_m):
+    # R*Tree box lookup, then exact great-circle filter.
+    # Returns [(distance_m, id, ride_name, ride_date)] nearest first.
+    hits = []
+    for ride_id, name, date, rlat, rlon in rides_in_box(*bounding_box(lat, lon, radius_m)):
+        d = haversine_m(lat, lon, rlat, rlon)
+        if d <= radius_m:
+            hits.append((d, ride_id, name, date))
+    hits.sort()
+    return hits
+
+
+def nearest_rides(lat, lon, k, start_radius_m=5000, max_radius_m=EARTH_RADIUS_M * math.pi):
+    # Grow the search box until it holds k rides; anything inside the
+    # circle of that radius is guaranteed closer than anything outside.
+    radius = start_radius_m
+    while True:
+        hits = rides_near(lat, lon, radius)
+        if len(hits) >= k or radius >= max_radius_m:
+            return hits[:k]
+        radius *= 4
@@ -0,0 +1,141 @@
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+from database import save_ride_route
+
+EARTH_RADIUS_M = 6371008.8
+SIMPLIFY_M     = 10.0    # Douglas–Peucker tolerance
+POLYLINE_SCALE = 1e5     # stored as int32 degrees * 1e5 (~1 m)
+
+
+# ---------- PARSING ----------
+def parse_gpx(source):
+    # Streams track/route points with iterparse and clears each element as
+    # soon as it is read, so large files never build a full tree in memory.
+    lats, lons, eles = [], [], []
+    for _, elem in ET.iterparse(source, events=("end",)):
+        tag = elem.tag.rsplit("}", 1)[-1]
+        if tag in ("trkpt", "rtept"):
+            lats.append(float(elem.get("lat")))
+            lons.append(float(elem.get("lon")))
+            ele = None
+            for child in elem:
+                if child.tag.rsplit("}", 1)[-1] == "ele" and child.text:
+                    ele = float(child.text)
+            eles.append(np.nan if ele is None else ele)
+            elem.clear()
+        elif tag in ("trkseg", "trk", "rte"):
+            elem.clear()
+    return np.array(lats), np.array(lons), np.array(eles)
+
+
+# ---------- STATS ----------
+def haversine(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = (np.sin((lat2 - lat1) / 2) ** 2 +
+         np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+
+
+def track_distance(lat, lon):
+    if len(lat) < 2:
+        return 0.0
+    return float(haversine(lat[:-1], lon[:-1], lat[1:], lon[1:]).sum())
+
+
+def elevation_gain(ele):
+    ele = ele[~np.isnan(ele)]
+    if len(ele) < 2:
+        return 0.0
+    diffs = np.diff(ele)
+    return float(diffs[diffs > 0].sum())
+
+
+def simplify(lat, lon, tolerance=SIMPLIFY_M):
+    # Douglas–Peucker on a local equirectangular projection (metres).
+    # Iterative, with each segment's distances computed in one NumPy pass.
+    n = len(lat)
+    if n < 3:
+        return np.ones(n, dtype=bool)
+    lat0 = np.radians(lat.mean())
+    x = np.radians(lon) * np.cos(lat0) * EARTH_RADIUS_M
+    y = np.radians(lat) * EARTH_RADIUS_M
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        dx, dy = x[end] - x[start], y[end] - y[start]
+        px, py = x[start + 1:end] - x[start], y[start + 1:end] - y[start]
+        seg = np.hypot(dx, dy)
+        if seg == 0:
+            dist = np.hypot(px, py)
+        else:
+            dist = np.abs(dx * py - dy * px) / seg
+        i = int(dist.argmax())
+        if dist[i] > tolerance:
+            mid = start + 1 + i
+            keep[mid] = True
+            stack.append((start, mid))
+            stack.append((mid, end))
+    return keep
+
+
+def encode_polyline(lat, lon):
+    pts = np.empty((len(lat), 2), dtype="<i4")
+    pts[:, 0] = np.round(lat * POLYLINE_SCALE)
+    pts[:, 1] = np.round(lon * POLYLINE_SCALE)
+    return pts.tobytes()
+
+
+def decode_polyline(blob):
+    pts = np.frombuffer(blob, dtype="<i4").reshape(-1, 2)
+    return pts[:, 0] / POLYLINE_SCALE, pts[:, 1] / POLYLINE_SCALE
+
+
+def route_svg(blob, width=280, height=160, pad=6):
+    # Inline SVG outline of the stored simplified track for the ride view,
+    # north up, on the same equirectangular projection as simplify().
+    lat, lon = decode_polyline(blob or b"")
+    if len(lat) < 2:
+        return ""
+    x = lon * np.cos(np.radians(lat.mean()))
+    y = -lat
+    spans = [span / room for span, room in ((np.ptp(x), width - 2 * pad),
+                                            (np.ptp(y), height - 2 * pad)) if span > 0]
+    if not spans:
+        return ""
+    scale = 1 / max(spans)
+    x = pad + (width - 2 * pad - np.ptp(x) * scale) / 2 + (x - x.min()) * scale
+    y = pad + (height - 2 * pad - np.ptp(y) * scale) / 2 + (y - y.min()) * scale
+    points = " ".join(f"{a:.1f},{b:.1f}" for a, b in zip(x, y))
+    return (f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {width} {height}" '
+            f'width="{width}" height="{height}" role="img" aria-label="Route map">'
+            f'<polyline points="{points}" fill="none" stroke="currentColor" '
+            f'stroke-width="2" stroke-linejoin="round" stroke-linecap="round"/></svg>')
+
+
+def route_stats(lat, lon, ele):
+    keep = simplify(lat, lon)
+    return {
+        "distance_m":       track_distance(lat, lon),
+        "elevation_gain_m": elevation_gain(ele),
+        "min_lat": float(lat.min()), "min_lon": float(lon.min()),
+        "max_lat": float(lat.max()), "max_lon": float(lon.max()),
+        "point_count": int(len(lat)),
+        "polyline": encode_polyline(lat[keep], lon[keep]),
+    }
+
+
+# ---------- ATTACH ----------
+def attach_gpx(ride_id, source):
+    # Returns the stored stats, or None if the file has no track points.
+    lat, lon, ele = parse_gpx(source)
+    if len(lat) == 0:
+        return None
+    stats = route_stats(lat, lon, ele)
+    save_ride_route(ride_id, stats)
+    return stats
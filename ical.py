@@ -0,0 +1,170 @@
+import datetime
+import re
+
+from starlette.responses import Response
+from starlette.routing import Route
+
+from database import catalog_version, get_ride_details, list_ride_details, occurrence_keys
+
+CAL_NAME     = "Team Ugly Training Rides"
+CAL_TIMEZONE = "America/Chicago"
+RIDE_HOURS   = 2
+
+# RFC 5545 needs a VTIMEZONE for every TZID an event uses; clients such as
+# Outlook drop or shift events without one. These are the US rules in
+# force since 2007 (second Sunday of March to first Sunday of November);
+# a different CAL_TIMEZONE needs its own definition here.
+VTIMEZONE = [
+    "BEGIN:VTIMEZONE",
+    f"TZID:{CAL_TIMEZONE}",
+    "BEGIN:DAYLIGHT",
+    "TZOFFSETFROM:-0600",
+    "TZOFFSETTO:-0500",
+    "TZNAME:CDT",
+    "DTSTART:20070311T020000",
+    "RRULE:FREQ=YEARLY;BYMONTH=3;BYDAY=2SU",
+    "END:DAYLIGHT",
+    "BEGIN:STANDARD",
+    "TZOFFSETFROM:-0500",
+    "TZOFFSETTO:-0600",
+    "TZNAME:CST",
+    "DTSTART:20071104T020000",
+    "RRULE:FREQ=YEARLY;BYMONTH=11;BYDAY=1SU",
+    "END:STANDARD",
+    "END:VTIMEZONE",
+]
+
+# (kind, ride_id) -> (version, body); replaced whenever the catalog moves on.
+_cache = {}
+
+
+# ---------- ICS FORMATTING ----------
+def escape_text(value):
+    return (str(value or "").replace("\\", "\\\\").replace(";", "\\;")
+            .replace(",", "\\,").replace("\n", "\\n"))
+
+
+def fold(line):
+    # RFC 5545: content lines are folded at 75 octets.
+    data = line.encode("utf-8")
+    if len(data) <= 75:
+        return line
+    parts = []
+    while len(data) > 75:
+        cut = 75 if not parts else 74
+        while cut > 0 and (data[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(data[:cut].decode("utf-8"))
+        data = data[cut:]
+    parts.append(data.decode("utf-8"))
+    return "\r\n ".join(parts)
+
+
+def parse_start_time(value):
+    m = re.match(r"^\s*(\d{1,2})(?::(\d{2}))?\s*([AaPp])?\.?[Mm]?\.?\s*$", value or "")
+    if not m:
+        return None
+    hour, minute = int(m.group(1)), int(m.group(2) or 0)
+    ampm = (m.group(3) or "").upper()
+    if ampm == "P" and hour < 12:
+        hour += 12
+    elif ampm == "A" and hour == 12:
+        hour = 0
+    if hour > 23 or minute > 59:
+        return None
+    return datetime.time(hour, minute)
+
+
+def ride_event(ride_id, name, date, time, loc, route, stamp, uids):
+    try:
+        day = datetime.date.fromisoformat(date)
+    except (TypeError, ValueError):
+        return []
+    lines = [
+        "BEGIN:VEVENT",
+        f"UID:ride-{uids.get(str(ride_id), ride_id)}@teamugly",
+        f"DTSTAMP:{stamp}",
+    ]
+    start = parse_start_time(time)
+    if start:
+        begin = datetime.datetime.combine(day, start)
+        end = begin + datetime.timedelta(hours=RIDE_HOURS)
+        lines.append(f"DTSTART;TZID={CAL_TIMEZONE}:{begin:%Y%m%dT%H%M%S}")
+        lines.append(f"DTEND;TZID={CAL_TIMEZONE}:{end:%Y%m%dT%H%M%S}")
+    else:
+        lines.append(f"DTSTART;VALUE=DATE:{day:%Y%m%d}")
+    lines.append(f"SUMMARY:{escape_text(name)}")
+    if loc:
+        lines.append(f"LOCATION:{escape_text(loc)}")
+    if route:
+        lines.append(f"URL:{route}")
+        lines.append(f"DESCRIPTION:{escape_text('GPS Route: ' + route)}")
+    lines.append("END:VEVENT")
+    return lines
+
+
+def build_calendar(rides, uids=None):
+    # uids maps a series date's rides.id to its occurrence key, which is
+    # the UID it had before the row existed.
+    uids = uids or {}
+    stamp = datetime.datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+    lines = [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        "PRODID:-//Team Ugly//Training Rides//EN",
+        "CALSCALE:GREGORIAN",
+        f"X-WR-CALNAME:{escape_text(CAL_NAME)}",
+        f"X-WR-TIMEZONE:{CAL_TIMEZONE}",
+        *VTIMEZONE,
+    ]
+    for ride in rides:
+        lines.extend(ride_event(*ride, stamp, uids))
+    lines.append("END:VCALENDAR")
+    return "\r\n".join(fold(l) for l in lines) + "\r\n"
+
+
+# ---------- CACHED FEEDS ----------
+def cached_calendar(kind, ride_id, version):
+    hit = _cache.get((kind, ride_id))
+    if hit and hit[0] == version:
+        return hit[1]
+    if kind == "season":
+        rides = list_ride_details()
+    else:
+        details = get_ride_details(ride_id)
+        rides = [(ride_id, *details)] if details else []
+        if not rides:
+            return None
+    body = build_calendar(rides, occurrence_keys())
+    _cache[(kind, ride_id)] = (version, body)
+    return body
+
+
+def calendar_response(request, kind, ride_id=None):
+    version = catalog_version()
+    etag = f'"{kind}-{ride_id or 0}-v{version}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    body = cached_calendar(kind, ride_id, version)
+    if body is None:
+        return Response("Ride not found.", status_code=404)
+    filename = "team-ugly-rides.ics" if kind == "season" else f"ride-{ride_id}.ics"
+    headers["Content-Disposition"] = f'inline; filename="{filename}"'
+    return Response(body, media_type="text/calendar; charset=utf-8", headers=headers)
+
+
+# Plain (non-async) endpoints: Starlette runs them on its thread pool, so
+# the SQLite reads never block the event loop shared with Shiny sessions.
+def season_feed(request):
+    return calendar_response(request, "season")
+
+
+def ride_feed(request):
+    return calendar_response(request, "ride", request.path_params["ride_id"])
+
+
+routes = [
+    Route("/calendar/season.ics", season_feed),
+    Route("/calendar/ride/{ride_id}.ics", ride_feed),
+]
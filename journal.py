@@ -0,0 +1,119 @@
+import atexit
+import json
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, rotation is unguarded
+    fcntl = None
+
+# Append-only NDJSON log of signups and cancellations. database.signup()
+# and cancel_signup() append a line once their write has committed, so the
+# log holds exactly the codes that were handed out: on startup
+# replay_journal() re-applies any line the database has lost since (a
+# power cut before the WAL reached disk, a restore from backup), then
+# rotates the file. Every process appending holds a shared lock on it, and
+# rotate() leaves the file alone while any other process holds one. A line
+# goes to the OS with one write() (it survives the process dying); fsync is
+# batched by a background thread every FSYNC_MS so a burst of signups
+# shares one flush (0 = fsync every line).
+ENABLED  = os.getenv("TEAMUGLY_JOURNAL", "1") not in ("", "0")
+FSYNC_MS = float(os.getenv("TEAMUGLY_JOURNAL_FSYNC_MS", "50"))
+
+_fds = {}
+_dirty = set()
+_lock = threading.Lock()
+_flusher = None
+
+
+def append(path, record):
+    line = (json.dumps(record, separators=(",", ":"), ensure_ascii=False) + "\n").encode("utf-8")
+    with _lock:
+        fd = _fds.get(path)
+        if fd is None:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            fd = _fds[path] = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o640)
+            if fcntl:
+                fcntl.flock(fd, fcntl.LOCK_SH)
+        os.write(fd, line)
+        if FSYNC_MS <= 0:
+            os.fsync(fd)
+        else:
+            _dirty.add(fd)
+            start_flusher()
+
+
+def flush():
+    with _lock:
+        fds = list(_dirty)
+        _dirty.clear()
+    for fd in fds:
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+
+
+def start_flusher():
+    global _flusher
+    if _flusher is not None:
+        return
+
+    def loop():
+        while True:
+            time.sleep(FSYNC_MS / 1000)
+            flush()
+
+    _flusher = threading.Thread(target=loop, name="journal-fsync", daemon=True)
+    _flusher.start()
+
+
+atexit.register(flush)
+
+
+def read(path):
+    # Yields records in write order. A torn last line (the process died
+    # mid-write) or any other unparsable line is skipped.
+    if not os.path.exists(path):
+        return
+    with open(path, "rb") as fh:
+        for line in fh:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(record, dict):
+                yield record
+
+
+def rotate(path):
+    # Keeps the previous journal as <path>.1 and starts a new one. Only
+    # called at startup, after replay, before this process appends. If
+    # another process is still appending, renaming the file would send
+    # its lines to <path>.1, so it is left to grow until a start that has
+    # it to itself. Returns whether the journal was rotated.
+    flush()
+    with _lock:
+        fd = _fds.pop(path, None)
+        if fd is not None:
+            _dirty.discard(fd)
+            # Unlock first: an fsync still running on the flusher thread
+            # keeps the file (and its lock) open past close().
+            if fcntl:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+        if not os.path.exists(path):
+            return True
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            if fcntl:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return False
+            os.replace(path, path + ".1")
+        finally:
+            os.close(fd)
+        return True
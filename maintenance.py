@@ -0,0 +1,381 @@
+import argparse
+import datetime
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+
+from database import DB, ENGINE, connect, dedupe_signups, rebuild_stats
+
+# In-process maintenance scheduler, started next to the app. Every task is
+# broken into short steps (one table per ANALYZE, a few pages per
+# incremental_vacuum step) with a pause in between, so a rider's
+# signup never waits behind maintenance for more than a few milliseconds.
+# Tasks run when the database has been quiet for QUIET_SECONDS; the
+# nightly ones only in the NIGHTLY_HOUR window. Last-run times live in
+# meta, so restarts and a second process (TU_Rides.py) don't repeat work.
+NIGHTLY_HOUR        = int(os.getenv("TEAMUGLY_MAINT_HOUR", "3"))
+COMPACT_MIN_RECLAIM = float(os.getenv("TEAMUGLY_COMPACT_MIN_RECLAIM", "0.2"))
+BACKUP_KEEP         = int(os.getenv("TEAMUGLY_BACKUP_KEEP", "7"))
+
+TICK          = 60      # seconds between scheduler checks
+QUIET_SECONDS = 5       # no commits for this long before a task starts
+STEP_PAUSE    = 0.02    # seconds between steps, leaving the write lock free
+VACUUM_PAGES  = 64     # pages freed per incremental_vacuum step
+ANALYZE_LIMIT = 400     # rows sampled per index by ANALYZE
+BUSY_MS       = 250     # how long a step waits for the lock before giving up
+
+HOURLY  = 3600
+NIGHTLY = 20 * 3600
+
+history = deque(maxlen=50)
+_running = set()
+
+
+def snapshot_path(db_path):
+    return os.path.splitext(db_path)[0] + "-compact.sqlite"
+
+
+def backup_dir(db_path):
+    return os.path.join(os.path.dirname(db_path) or ".", "backups")
+
+
+def file_size(path):
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+
+def page_bytes(cur, pragma="page_count"):
+    page_size = cur.execute("PRAGMA page_size").fetchone()[0]
+    return page_size * cur.execute(f"PRAGMA {pragma}").fetchone()[0]
+
+
+class Steps:
+    # Times each short step so the log shows the longest single hold.
+    def __init__(self, con):
+        self.con = con
+        self.count = 0
+        self.longest = 0.0
+
+    def run(self, fn, *args):
+        t0 = time.perf_counter()
+        result = fn(*args)
+        self.longest = max(self.longest, time.perf_counter() - t0)
+        self.count += 1
+        return result
+
+    def pause(self):
+        # Checkpoint between steps, outside the write lock, so the WAL never
+        # grows to where a commit (ours or a rider's) pays for a big one.
+        self.con.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+        time.sleep(STEP_PAUSE)
+
+
+# ---------- TASKS ----------
+def task_optimize(con, steps):
+    steps.run(con.execute, "PRAGMA optimize")
+    return ""
+
+
+def task_checkpoint(con, steps):
+    # PASSIVE copies frames back without blocking anyone; TRUNCATE then
+    # only has a nearly empty WAL left to finish, and gives up after
+    # BUSY_MS rather than queueing writers behind a long-running reader.
+    wal = file_size(con.db_path + "-wal")
+    steps.run(lambda: con.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone())
+    busy = steps.run(lambda: con.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone())[0]
+    return f"wal {wal / 1e6:.1f} MB -> {file_size(con.db_path + '-wal') / 1e6:.1f} MB" + (
+        " (busy, retry next hour)" if busy else "")
+
+
+def task_analyze(con, steps):
+    con.execute(f"PRAGMA analysis_limit={ANALYZE_LIMIT}")
+    tables = [r[0] for r in con.execute("""
+        SELECT name FROM sqlite_master
+        WHERE type='table' AND name NOT LIKE 'sqlite_%' AND sql NOT LIKE 'CREATE VIRTUAL%'
+    """)]
+    for name in tables:
+        steps.run(con.execute, f'ANALYZE "{name}"')
+        steps.pause()
+    return f"{len(tables)} tables"
+
+
+def task_incremental_vacuum(con, steps):
+    if con.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        return "auto_vacuum not incremental yet (set by the next full compaction)"
+    cur = con.cursor()
+    freed = page_bytes(cur, "freelist_count")
+    while cur.execute("PRAGMA freelist_count").fetchone()[0]:
+        # executescript steps the pragma to completion; execute() would
+        # free a single page per call.
+        steps.run(con.executescript, f"PRAGMA incremental_vacuum({VACUUM_PAGES})")
+        steps.pause()
+    return f"freed {freed / 1e6:.1f} MB"
+
+
+def task_backup(con, steps):
+    folder = backup_dir(con.db_path)
+    os.makedirs(folder, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(con.db_path))[0]
+    path = os.path.join(folder, f"{stem}-{datetime.datetime.now():%Y%m%d-%H%M}.sqlite")
+    dest = sqlite3.connect(path + ".tmp")
+    # One step: in WAL mode that is a single read snapshot, which never
+    # blocks writers. Copying in several steps would restart from the top
+    # every time another connection commits, so it never finishes on a
+    # database that is taking signups.
+    steps.run(con.backup, dest)
+    dest.close()
+    os.replace(path + ".tmp", path)
+    old = sorted(f for f in os.listdir(folder) if f.startswith(stem + "-") and f.endswith(".sqlite"))
+    for name in old[:-BACKUP_KEEP]:
+        os.remove(os.path.join(folder, name))
+    return f"{os.path.basename(path)} ({file_size(path) / 1e6:.1f} MB)"
+
+
+def task_compact(con, steps, min_reclaim=COMPACT_MIN_RECLAIM):
+    # VACUUM INTO needs only a read snapshot. The full VACUUM is the one
+    # step that holds the write lock for its whole run, so it happens only
+    # when the compacted copy shows enough to reclaim; it also switches the
+    # file to incremental auto_vacuum so later free pages go in small steps.
+    # The copy is only a measurement and is removed once its size is known.
+    cur = con.cursor()
+    snapshot = snapshot_path(con.db_path)
+    if os.path.exists(snapshot):
+        os.remove(snapshot)
+    before = page_bytes(cur)
+    try:
+        steps.run(cur.execute, "VACUUM INTO ?", (snapshot,))
+        compacted = file_size(snapshot)
+    finally:
+        if os.path.exists(snapshot):
+            os.remove(snapshot)
+    reclaim = 1 - compacted / before if before else 0
+    vacuumed = reclaim >= min_reclaim
+    if vacuumed:
+        cur.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        steps.run(cur.execute, "VACUUM")
+        cur.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+    after = page_bytes(cur)
+    return (f"{before / 1e6:.1f} -> {after / 1e6:.1f} MB "
+            f"(copy {compacted / 1e6:.1f} MB, vacuum {'run' if vacuumed else 'skipped'})")
+
+
+def task_dedupe(con, steps):
+    # One short write transaction; duplicates are rare, so the merge is a
+    # handful of row updates. A freed spot is picked up by the waitlist
+    # worker's next sweep.
+    def merge():
+        cur = con.cursor()
+        cur.execute("BEGIN IMMEDIATE")
+        try:
+            merged = dedupe_signups(cur)
+        except sqlite3.Error:
+            cur.execute("ROLLBACK")
+            raise
+        cur.execute("COMMIT")
+        return merged
+    return f"merged {steps.run(merge)} duplicate signups"
+
+
+TASKS = [
+    ("checkpoint",         task_checkpoint,         HOURLY),
+    ("optimize",           task_optimize,           HOURLY),
+    ("analyze",            task_analyze,            NIGHTLY),
+    ("incremental_vacuum", task_incremental_vacuum, NIGHTLY),
+    ("backup",             task_backup,             NIGHTLY),
+    ("compact",            task_compact,            NIGHTLY),
+    ("dedupe",             task_dedupe,             NIGHTLY),
+]
+
+
+# ---------- SCHEDULER ----------
+class Connection(sqlite3.Connection):
+    db_path = None
+
+
+def open_db(db_path):
+    con = sqlite3.connect(db_path, timeout=BUSY_MS / 1000, isolation_level=None,
+                          factory=Connection)
+    con.db_path = db_path
+    con.execute("PRAGMA wal_autocheckpoint=0")
+    return con
+
+
+def last_run(con, name):
+    row = con.execute("SELECT value FROM meta WHERE key=?", (f"maint_{name}",)).fetchone()
+    return row[0] if row else 0
+
+
+def record_run(db_path, name):
+    # Ordinary busy timeout: this is bookkeeping, not a maintenance step.
+    con = connect(db_path)
+    with con:
+        con.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                    (f"maint_{name}", int(time.time())))
+    con.close()
+
+
+def is_due(con, name, every, now=None):
+    now = now or time.time()
+    if now - last_run(con, name) < every:
+        return False
+    return every < NIGHTLY or datetime.datetime.fromtimestamp(now).hour == NIGHTLY_HOUR
+
+
+def wait_quiet(con, limit=TICK):
+    # data_version changes whenever another connection commits.
+    deadline = time.monotonic() + limit
+    version = con.execute("PRAGMA data_version").fetchone()[0]
+    quiet_since = time.monotonic()
+    while time.monotonic() < deadline:
+        time.sleep(1)
+        current = con.execute("PRAGMA data_version").fetchone()[0]
+        if current != version:
+            version, quiet_since = current, time.monotonic()
+        elif time.monotonic() - quiet_since >= QUIET_SECONDS:
+            return True
+    return False
+
+
+def run_task(db_path, name, fn=None):
+    fn = fn or dict((n, f) for n, f, _ in TASKS)[name]
+    con = open_db(db_path)
+    steps = Steps(con)
+    started = time.perf_counter()
+    try:
+        detail = fn(con, steps)
+        record_run(db_path, name)
+    except sqlite3.Error as e:
+        detail = f"failed: {e}"
+    finally:
+        con.close()
+    entry = {
+        "task": name,
+        "started": datetime.datetime.now().strftime("%Y-%m-%d %H:%M"),
+        "seconds": round(time.perf_counter() - started, 3),
+        "steps": steps.count,
+        "longest_step_ms": round(steps.longest * 1000, 1),
+        "detail": detail,
+    }
+    history.append(entry)
+    print("maintenance: " + log_line(entry))
+    return entry
+
+
+def run_due(db_path):
+    con = open_db(db_path)
+    try:
+        due = [(name, fn) for name, fn, every in TASKS if is_due(con, name, every)]
+        if due and not wait_quiet(con):
+            return []
+    finally:
+        con.close()
+    return [run_task(db_path, name, fn) for name, fn in due]
+
+
+def start_background(db_path=None):
+    # Every task works on the database file; a memory database has none.
+    if ENGINE == "memory":
+        return None
+    db_path = os.path.abspath(db_path or DB)
+    if db_path in _running:
+        return None
+    _running.add(db_path)
+
+    def loop():
+        while True:
+            time.sleep(TICK)
+            try:
+                run_due(db_path)
+            except sqlite3.Error as e:
+                print(f"maintenance: scheduler check failed: {e}")
+
+    thread = threading.Thread(target=loop, name="maintenance", daemon=True)
+    thread.start()
+    return thread
+
+
+def log_line(entry):
+    return (f"{entry['started']} {entry['task']}: {entry['seconds']}s, "
+            f"{entry['steps']} steps, longest {entry['longest_step_ms']} ms — {entry['detail']}")
+
+
+# ---------- BLOAT METRICS ----------
+def bloat_stats(db_path=None):
+    db_path = db_path or DB
+    con = connect(db_path)
+    cur = con.cursor()
+    stats = {
+        "file_bytes": file_size(db_path),
+        "wal_bytes": file_size(db_path + "-wal"),
+        "db_bytes": page_bytes(cur),
+        "free_bytes": page_bytes(cur, "freelist_count"),
+        "signups": dict(cur.execute("SELECT status, count(*) FROM signups GROUP BY status")),
+        "rides": dict(cur.execute("SELECT status, count(*) FROM rides GROUP BY status")),
+        "tables": None,
+    }
+    # dbstat is a compile-time option; without it only the freelist is known.
+    try:
+        stats["tables"] = {
+            name: {"bytes": size, "unused": unused}
+            for name, size, unused in cur.execute(
+                "SELECT name, pgsize, unused FROM dbstat WHERE aggregate=1")
+        }
+    except sqlite3.OperationalError:
+        pass
+    con.close()
+    if stats["tables"] is not None:
+        stats["unused_bytes"] = sum(t["unused"] for t in stats["tables"].values())
+    else:
+        stats["unused_bytes"] = None
+    return stats
+
+
+def summary(stats):
+    s, r = stats["signups"], stats["rides"]
+    line = (f"Database {stats['file_bytes'] / 1e6:.1f} MB (+{stats['wal_bytes'] / 1e6:.1f} MB WAL); "
+            f"signups {s.get('ACTIVE', 0):,} active / {s.get('CANCELLED', 0):,} cancelled; "
+            f"rides {r.get('ACTIVE', 0):,} active / {r.get('DELETED', 0):,} deleted; "
+            f"free pages {stats['free_bytes'] / 1e6:.1f} MB")
+    if stats["unused_bytes"] is not None:
+        line += f", unused in pages {stats['unused_bytes'] / 1e6:.1f} MB"
+    return line
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Report table bloat and run maintenance tasks.")
+    parser.add_argument("--db", default=DB)
+    parser.add_argument("--run", nargs="*", metavar="TASK", choices=[t[0] for t in TASKS],
+                        help="run these tasks now (all of them if none are named)")
+    parser.add_argument("--compact", action="store_true", help="same as --run compact")
+    parser.add_argument("--rebuild-stats", action="store_true",
+                        help="recompute the stats tables from signups and report any drift")
+    args = parser.parse_args(argv)
+
+    if args.rebuild_stats:
+        con = connect(args.db)
+        cur = con.cursor()
+        totals = "SELECT count(*), sum(signups), sum(cancellations), sum(checked_in) FROM ride_stats"
+        with con:
+            before = cur.execute(totals).fetchone()
+            rebuild_stats(cur)
+            after = cur.execute(totals).fetchone()
+        con.close()
+        print(f"stats rebuilt: rides/signups/cancellations/check-ins {after}"
+              + ("" if before == after else f" (were {before})"))
+
+    names = args.run
+    if names == []:
+        names = [t[0] for t in TASKS]
+    if args.compact:
+        names = (names or []) + ["compact"]
+    for name in names or []:
+        run_task(args.db, name)
+    stats = bloat_stats(args.db)
+    print(summary(stats))
+    for name, t in sorted((stats["tables"] or {}).items(), key=lambda kv: -kv[1]["bytes"]):
+        print(f"  {name:32} {t['bytes'] / 1e6:8.2f} MB  {t['unused'] / 1e6:8.2f} MB unused")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+import argparse
+import os
+import threading
+import time
+
+from database import DB, connect, has_table, init_db
+
+BATCH = 500      # legacy rows copied per transaction
+PAUSE = 0.05     # seconds between batches, leaving the write lock free
+
+# Copies rows from signups_legacy (the schema.sql layout, moved aside by
+# init_db) into the normalized rides/signups tables. Each batch is its own
+# short transaction and records a watermark in meta, so writers are only
+# ever blocked for one batch and an interrupted run resumes where it left
+# off. Until a row is copied, list_signups/cancel_signup_by_token read and
+# update it in signups_legacy.
+
+_running = set()
+
+
+def watermark(cur):
+    row = cur.execute("SELECT value FROM meta WHERE key='legacy_migrated_id'").fetchone()
+    return row[0] if row else 0
+
+
+def copy_batch(con, batch=BATCH):
+    # Returns the number of legacy rows consumed (0 when finished).
+    cur = con.cursor()
+    with con:
+        # IMMEDIATE: take the write lock before reading the watermark, so two
+        # processes (app.py and TU_Rides.py) never copy the same batch.
+        cur.execute("BEGIN IMMEDIATE")
+        lo = watermark(cur)
+        hi = cur.execute("""
+            SELECT max(id) FROM (
+                SELECT id FROM signups_legacy WHERE id > ? ORDER BY id LIMIT ?
+            )
+        """, (lo, batch)).fetchone()[0]
+        if hi is None:
+            return 0
+        cur.execute("""
+            INSERT INTO rides (ride_name, ride_date, start_time, meeting_point, route_link)
+            SELECT l.ride_name, l.ride_date, min(l.start_time), min(l.meeting_point), min(l.route_link)
+            FROM signups_legacy l
+            WHERE l.id > ? AND l.id <= ?
+              AND NOT EXISTS (
+                  SELECT 1 FROM rides r
+                  WHERE r.ride_name = l.ride_name AND r.ride_date = l.ride_date
+                    AND r.status = 'ACTIVE'
+              )
+            GROUP BY l.ride_name, l.ride_date
+        """, (lo, hi))
+        cur.execute("""
+            INSERT INTO signups
+            (ride_id, full_name, confirm_code, email, email_key, phone, city, notes,
+             acknowledge, created_utc, cancel_token, status)
+            SELECT (SELECT min(r.id) FROM rides r
+                    WHERE r.ride_name = l.ride_name AND r.ride_date = l.ride_date
+                      AND r.status = 'ACTIVE'),
+                   l.full_name, upper(substr(l.cancel_token, 1, 8)), l.email, email_key(l.email),
+                   l.phone, l.city, l.notes, l.acknowledge, l.created_utc, l.cancel_token, l.status
+            FROM signups_legacy l
+            WHERE l.id > ? AND l.id <= ?
+            ORDER BY l.id
+        """, (lo, hi))
+        copied = cur.rowcount
+        cur.execute("""
+            INSERT OR REPLACE INTO meta (key, value) VALUES ('legacy_migrated_id', ?)
+        """, (hi,))
+    return copied
+
+
+def migrate(db_path=None, batch=BATCH, pause=PAUSE, drop=True, log=None):
+    con = connect(db_path)
+    cur = con.cursor()
+    if not has_table(cur, "signups_legacy"):
+        con.close()
+        return 0
+    total = 0
+    started = time.perf_counter()
+    while True:
+        n = copy_batch(con, batch)
+        if not n:
+            break
+        total += n
+        # Checkpoint here rather than leaving the WAL to grow until some
+        # rider's signup commit trips the auto-checkpoint and pays for it.
+        cur.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+        if log:
+            log(f"copied through legacy id {watermark(cur)} ({total} rows)")
+        time.sleep(pause)
+    if drop:
+        with con:
+            cur.execute("DROP TABLE signups_legacy")
+            cur.execute("DELETE FROM meta WHERE key='legacy_migrated_id'")
+    con.close()
+    if log:
+        log(f"migration finished: {total} rows in {time.perf_counter() - started:.1f}s")
+    return total
+
+
+def start_background(db_path=None):
+    # Called by the entry points after init_db; a no-op once migrated.
+    db_path = os.path.abspath(db_path or DB)
+    con = connect(db_path)
+    pending = has_table(con.cursor(), "signups_legacy")
+    con.close()
+    if not pending or db_path in _running:
+        return None
+    _running.add(db_path)
+
+    def run():
+        try:
+            total = migrate(db_path)
+            print(f"migrate_schema: moved {total} legacy signups into {db_path}")
+        finally:
+            _running.discard(db_path)
+
+    thread = threading.Thread(target=run, name="migrate-schema", daemon=True)
+    thread.start()
+    return thread
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Copy schema.sql signups into the normalized rides/signups tables.")
+    parser.add_argument("--db", default=DB)
+    parser.add_argument("--batch", type=int, default=BATCH)
+    parser.add_argument("--pause", type=float, default=PAUSE)
+    parser.add_argument("--keep-legacy", action="store_true",
+                        help="leave signups_legacy in place after copying")
+    args = parser.parse_args(argv)
+
+    init_db(args.db)
+    migrate(args.db, args.batch, args.pause, drop=not args.keep_legacy, log=print)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+import ipaddress
+import os
+import threading
+import time
+from collections import Counter
+
+# All state is in-process memory; nothing here touches the database.
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, capacity, now):
+        self.tokens = capacity
+        self.updated = now
+
+
+class RateLimiter:
+    # capacity requests in a burst, refilled at `rate` tokens per second.
+    def __init__(self, capacity, rate, max_keys=10000):
+        self.capacity = capacity
+        self.rate = rate
+        self.max_keys = max_keys
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def allow(self, key):
+        now = time.monotonic()
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                if len(self.buckets) >= self.max_keys:
+                    self._prune(now)
+                bucket = self.buckets[key] = TokenBucket(self.capacity, now)
+            else:
+                bucket.tokens = min(self.capacity,
+                                    bucket.tokens + (now - bucket.updated) * self.rate)
+                bucket.updated = now
+            if bucket.tokens < 1:
+                return False
+            bucket.tokens -= 1
+            return True
+
+    def _prune(self, now):
+        # Drop buckets that would be full again anyway.
+        full_after = self.capacity / self.rate
+        for key in [k for k, b in self.buckets.items() if now - b.updated > full_after]:
+            del self.buckets[key]
+
+
+class IdempotencyWindow:
+    # Remembers the result for a key for `seconds` so a repeat submit
+    # (double tap, resend) gets the original answer instead of a new row.
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        now = time.monotonic()
+        with self.lock:
+            hit = self.entries.get(key)
+            if hit and now - hit[0] <= self.seconds:
+                return hit[1]
+            return None
+
+    def put(self, key, value):
+        now = time.monotonic()
+        with self.lock:
+            if len(self.entries) > 1000:
+                self.entries = {k: v for k, v in self.entries.items()
+                                if now - v[0] <= self.seconds}
+            self.entries[key] = (now, value)
+
+
+# ---------- APP LIMITS ----------
+signup_session = RateLimiter(capacity=5, rate=1 / 10)
+signup_ip      = RateLimiter(capacity=30, rate=1 / 2)
+cancel_session = RateLimiter(capacity=5, rate=1 / 30)
+cancel_ip      = RateLimiter(capacity=20, rate=1 / 10)
+lookup_session = RateLimiter(capacity=10, rate=1 / 5)
+lookup_ip      = RateLimiter(capacity=60, rate=1)
+recent_signups = IdempotencyWindow(seconds=10)
+
+rejected = Counter()
+
+
+# Reverse proxies (addresses or networks, comma-separated) whose
+# X-Forwarded-For is believed. From anyone else the header is ignored,
+# since a client can put any address in it and get a fresh bucket.
+TRUSTED_PROXIES = [ipaddress.ip_network(p.strip(), strict=False)
+                   for p in os.getenv("TEAMUGLY_TRUSTED_PROXIES", "").split(",") if p.strip()]
+
+
+def trusted(host):
+    try:
+        addr = ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return any(addr in net for net in TRUSTED_PROXIES)
+
+
+def connection_ip(conn):
+    # conn: a Starlette Request, or a Shiny session's http_conn. Behind
+    # trusted proxies, the client is the rightmost forwarded address that
+    # isn't one of them (entries further left are client-supplied).
+    host = conn.client.host if conn.client else "unknown"
+    if not trusted(host):
+        return host
+    hops = [h.strip() for h in conn.headers.get("x-forwarded-for", "").split(",") if h.strip()]
+    for hop in reversed(hops):
+        if not trusted(hop):
+            return hop
+    return hops[0] if hops else host
+
+
+def client_ip(session):
+    return connection_ip(session.http_conn)
+
+
+def allow(kind, session_limiter, ip_limiter, session):
+    if not session_limiter.allow(session.id):
+        rejected[kind + "_session"] += 1
+        return False
+    if not ip_limiter.allow(client_ip(session)):
+        rejected[kind + "_ip"] += 1
+        return False
+    return True
+
+
+def allow_signup(session):
+    return allow("signup", signup_session, signup_ip, session)
+
+
+def allow_cancel(session):
+    return allow("cancel", cancel_session, cancel_ip, session)
+
+
+def allow_lookup(session):
+    return allow("lookup", lookup_session, lookup_ip, session)
+
+
+# HTTP API clients have no session; they share the per-IP buckets with
+# the UI, so switching between the two doesn't double anyone's allowance.
+def allow_request(kind, request):
+    limiter = {"signup": signup_ip, "cancel": cancel_ip, "lookup": lookup_ip}[kind]
+    if not limiter.allow(connection_ip(request)):
+        rejected[kind + "_ip"] += 1
+        return False
+    return True
+
+
+def signup_key(ride_id, full_name):
+    return str(ride_id), " ".join(full_name.lower().split())
@@ -0,0 +1,293 @@
+import argparse
+import asyncio
+import datetime
+import os
+import smtplib
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from zoneinfo import ZoneInfo
+
+import notify
+from database import DB, ENGINE, connect, now_utc_iso
+from email_utils import SMTP_HOST, SMTP_PORT, smtp_bytes
+from ical import CAL_TIMEZONE
+
+# Day-before reminders for riders who signed up with an email address
+# (TU_Rides.py signups). Every TICK the scheduler finds rides starting
+# within REMIND_HOURS through the partial index on active rides'
+# ride_date, and queues a 'REMINDER' row in the outbox for each of their
+# active signups. A unique index on the outbox allows one reminder per
+# signup, so re-queueing after a restart, or from TU_Rides.py and the app
+# at once, is a no-op. Sending claims up to BATCH queued reminders in one
+# short transaction, marking them sent before they go out, so two workers
+# never get the same rows. A crash mid-batch loses those reminders rather
+# than sending them twice. A batch goes over one SMTP connection; if the
+# server can't be reached, or drops the connection, the unsent rest of the
+# batch is unclaimed and retried next tick. A message the server refuses
+# is counted as failed and not retried.
+#
+# Off unless TEAMUGLY_SMTP_HOST (read by email_utils) is set.
+# `python reminders.py --sink` runs a local SMTP stand-in that appends
+# whatever it receives to an mbox file. Like a strict real server, it
+# refuses lines that don't end in CRLF.
+REMIND_HOURS = float(os.getenv("TEAMUGLY_REMIND_HOURS", "24"))
+APP_URL      = os.getenv("TEAMUGLY_APP_URL", "")
+
+TICK  = 300     # seconds between scheduler passes
+BATCH = 50      # reminders claimed and sent per SMTP connection
+
+TIME_FORMATS = ("%I:%M %p", "%I:%M%p", "%I %p", "%H:%M")
+
+_running = set()
+stats = {"queued": 0, "sent": 0, "skipped": 0, "failed": 0}
+
+
+def local_now():
+    # Ride dates and times are Chicago wall-clock time (the zone the
+    # calendar feed publishes), whatever zone the server runs in.
+    return datetime.datetime.now(ZoneInfo(CAL_TIMEZONE)).replace(tzinfo=None)
+
+
+def ride_start(date, start_time):
+    # Rides store free-text times ("7:00 AM"); an unreadable one counts as
+    # the start of the day, so its reminder goes out early, not never.
+    try:
+        day = datetime.date.fromisoformat(date)
+    except (TypeError, ValueError):
+        return None
+    for fmt in TIME_FORMATS:
+        try:
+            t = datetime.datetime.strptime((start_time or "").strip().upper(), fmt).time()
+            return datetime.datetime.combine(day, t)
+        except ValueError:
+            continue
+    return datetime.datetime.combine(day, datetime.time())
+
+
+def due_rides(cur, now):
+    # Only the few days ahead are read, through idx_rides_active_date.
+    last = now + datetime.timedelta(hours=REMIND_HOURS)
+    rows = cur.execute("""
+        SELECT id, ride_date, start_time FROM rides
+        WHERE status = 'ACTIVE' AND ride_date BETWEEN ? AND ?
+    """, (now.date().isoformat(), last.date().isoformat())).fetchall()
+    return [ride_id for ride_id, date, start_time in rows
+            if (start := ride_start(date, start_time)) and now < start <= last]
+
+
+def enqueue(db_path=None, now=None):
+    now = now or local_now()
+    con = connect(db_path)
+    cur = con.cursor()
+    queued = 0
+    with con:
+        for ride_id in due_rides(cur, now):
+            cur.execute("""
+                INSERT OR IGNORE INTO outbox (kind, signup_id, created_utc)
+                SELECT 'REMINDER', s.id, ? FROM signups s
+                WHERE s.ride_id = ? AND s.status = 'ACTIVE' AND s.email_key IS NOT NULL
+            """, (now_utc_iso(), ride_id))
+            queued += cur.rowcount
+    con.close()
+    stats["queued"] += queued
+    return queued
+
+
+def claim(db_path=None, batch=BATCH):
+    # Rows for the next batch, already marked sent. Reminders whose signup
+    # was cancelled (or ride deleted) since queueing are marked and dropped.
+    con = connect(db_path)
+    cur = con.cursor()
+    with con:
+        cur.execute("BEGIN IMMEDIATE")
+        rows = cur.execute("""
+            SELECT o.id, s.email, s.full_name, s.confirm_code, s.cancel_token,
+                   s.status = 'ACTIVE' AND r.status = 'ACTIVE',
+                   r.id, r.ride_name, r.ride_date, r.start_time, r.meeting_point, r.route_link
+            FROM outbox o
+            JOIN signups s ON s.id = o.signup_id
+            JOIN rides r ON r.id = s.ride_id
+            WHERE o.kind = 'REMINDER' AND o.sent_utc IS NULL
+            ORDER BY o.id
+            LIMIT ?
+        """, (batch,)).fetchall()
+        cur.executemany("UPDATE outbox SET sent_utc=? WHERE id=?",
+                        [(now_utc_iso(), row[0]) for row in rows])
+    con.close()
+    stats["skipped"] += sum(1 for row in rows if not row[5])
+    return [row for row in rows if row[5]], len(rows)
+
+
+def unclaim(db_path, ids):
+    con = connect(db_path)
+    with con:
+        con.executemany("UPDATE outbox SET sent_utc=NULL WHERE id=?", [(i,) for i in ids])
+    con.close()
+
+
+def ride_day(date, today):
+    # How the reminder names the ride: a short REMIND_HOURS window can
+    # catch a ride later the same day, a long one rides days out.
+    try:
+        day = datetime.date.fromisoformat(date)
+    except (TypeError, ValueError):
+        return "an upcoming ride"
+    if day == today:
+        return "today's ride"
+    if day == today + datetime.timedelta(days=1):
+        return "tomorrow's ride"
+    return f"the ride on {day:%A}"
+
+
+def messages(rows, today=None):
+    # (outbox id, email, message bytes), rendered one ride at a time.
+    today = today or local_now().date()
+    by_ride = defaultdict(list)
+    for row in rows:
+        by_ride[row[6:]].append(row)
+    for (ride_id, *details), group in by_ride.items():
+        context = dict(notify.ride_context(details, APP_URL, ""), when=ride_day(details[1], today))
+        contacts = [{"email": email, "first": (name or "").split(" ")[0], "code": code,
+                     "cancel_link": f"{APP_URL}?cancel={token}" if APP_URL and token else ""}
+                    for _, email, name, code, token, *_ in group]
+        rendered = notify.message_batch(notify.render_messages(contacts, context, "reminder"))
+        for row, (to, data) in zip(group, rendered):
+            yield row[0], to, data
+
+
+def send_batch(db_path=None, batch=BATCH):
+    # Returns the number of reminders claimed (0 when the queue is empty).
+    rows, claimed = claim(db_path, batch)
+    if not rows:
+        return claimed
+    outgoing = list(messages(rows))
+    sent = done = 0
+    try:
+        with smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=30) as smtp:
+            for _, to, data in outgoing:
+                try:
+                    smtp.sendmail(notify.MAIL_FROM, [to], smtp_bytes(data))
+                    sent += 1
+                except (smtplib.SMTPRecipientsRefused, smtplib.SMTPResponseException) as e:
+                    # The server turned down this message (bad address,
+                    # rejected content); the connection is still good.
+                    stats["failed"] += 1
+                    print(f"reminders: {to} refused: {e}")
+                done += 1
+    except (OSError, smtplib.SMTPServerDisconnected) as e:
+        # The connection failed or dropped: nothing from this message on
+        # went out, so put the rest back in the queue.
+        unclaim(db_path, [i for i, _, _ in outgoing[done:]])
+        print(f"reminders: SMTP {SMTP_HOST}:{SMTP_PORT} failed after {sent} sent: {e}")
+        claimed = 0
+    stats["sent"] += sent
+    return claimed
+
+
+def run_once(db_path=None, now=None):
+    queued = enqueue(db_path, now)
+    sent_before = stats["sent"]
+    while send_batch(db_path) == BATCH:
+        pass
+    return queued, stats["sent"] - sent_before
+
+
+def start_background(db_path=None):
+    if not SMTP_HOST or ENGINE == "memory":
+        return None
+    db_path = os.path.abspath(db_path or DB)
+    if db_path in _running:
+        return None
+    _running.add(db_path)
+
+    def loop():
+        while True:
+            try:
+                queued, sent = run_once(db_path)
+                if queued or sent:
+                    print(f"reminders: queued {queued}, sent {sent}")
+            except sqlite3.Error as e:
+                print(f"reminders: pass failed: {e}")
+            time.sleep(TICK)
+
+    thread = threading.Thread(target=loop, name="reminders", daemon=True)
+    thread.start()
+    return thread
+
+
+# ---------- SMTP STAND-IN ----------
+async def sink_session(reader, writer, mbox):
+    def say(line):
+        writer.write(line.encode("ascii") + b"\r\n")
+
+    say("220 teamugly SMTP stand-in")
+    while True:
+        line = await reader.readline()
+        if not line:
+            break
+        if not line.endswith(b"\r\n"):
+            say("500 5.5.2 Bare LF received; end lines with CRLF")
+            await writer.drain()
+            continue
+        verb = line[:4].decode("ascii", "replace").upper()
+        if verb in ("HELO", "EHLO", "MAIL", "RCPT", "RSET", "NOOP"):
+            say("250 OK")
+        elif verb == "DATA":
+            say("354 End data with <CR><LF>.<CR><LF>")
+            await writer.drain()
+            lines, bare = [], False
+            while (line := await reader.readline()) not in (b".\r\n", b""):
+                bare = bare or not line.endswith(b"\r\n") or b"\r" in line[:-2]
+                lines.append(line[1:] if line.startswith(b"..") else line)
+            if bare:
+                say("550 5.6.2 Message has bare LF or CR line endings; use CRLF")
+                await writer.drain()
+                continue
+            data = b"".join(lines).replace(b"\r\n", b"\n")
+            with open(mbox, "ab") as fh:
+                fh.write(b"From MAILER-DAEMON Thu Jan  1 00:00:00 1970\n" +
+                         notify.FROM_LINE.sub(b">From ", data) + b"\n")
+            say("250 OK")
+        elif verb == "QUIT":
+            say("221 Bye")
+            await writer.drain()
+            break
+        else:
+            say("502 Command not implemented")
+        await writer.drain()
+    writer.close()
+
+
+async def sink(port, mbox):
+    os.makedirs(os.path.dirname(mbox) or ".", exist_ok=True)
+    server = await asyncio.start_server(lambda r, w: sink_session(r, w, mbox), "127.0.0.1", port)
+    print(f"SMTP stand-in on 127.0.0.1:{port}, appending to {mbox}")
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Send day-before ride reminders.")
+    parser.add_argument("--db", default=DB)
+    parser.add_argument("--run", action="store_true", help="queue and send due reminders now")
+    parser.add_argument("--sink", action="store_true",
+                        help="run a local SMTP stand-in that writes messages to --mbox")
+    parser.add_argument("--port", type=int, default=1025)
+    parser.add_argument("--mbox", default="data/reminders.mbox")
+    args = parser.parse_args(argv)
+
+    if args.sink:
+        asyncio.run(sink(args.port, args.mbox))
+    elif args.run:
+        if not SMTP_HOST:
+            parser.error("set TEAMUGLY_SMTP_HOST (and TEAMUGLY_SMTP_PORT) first")
+        queued, sent = run_once(args.db)
+        print(f"queued {queued}, sent {sent}, skipped {stats['skipped']}, refused {stats['failed']}")
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
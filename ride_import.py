@@ -0,0 +1,179 @@
+import csv
+import datetime
+import io
+import zoneinfo
+
+from database import create_rides_bulk
+from ical import CAL_TIMEZONE
+
+
+# ---------- FIELD HELPERS ----------
+def pick(row, *names):
+    for n in names:
+        v = row.get(n)
+        if v:
+            return v.strip()
+    return ""
+
+
+def normalize_date(value):
+    value = (value or "").strip()
+    for fmt in ("%Y-%m-%d", "%m/%d/%Y", "%m/%d/%y", "%Y%m%d"):
+        try:
+            return datetime.datetime.strptime(value, fmt).date().isoformat()
+        except ValueError:
+            continue
+    return None
+
+
+def format_time(hour, minute):
+    suffix = "AM" if hour < 12 else "PM"
+    return f"{hour % 12 or 12}:{minute:02d} {suffix}"
+
+
+# ---------- CSV ----------
+def parse_csv(text):
+    # Yields (row_number, ride_tuple_or_None, error_or_None).
+    # Header names follow the admin form: Ride Name, Date, Start Time,
+    # Meeting Point, GPS Link (lowercase/underscore variants accepted).
+    reader = csv.DictReader(io.StringIO(text))
+    for i, row in enumerate(reader, start=2):
+        name = pick(row, "Ride Name", "ride_name", "Name", "name")
+        raw_date = pick(row, "Date", "Ride Date", "ride_date", "date")
+        time = pick(row, "Start Time", "start_time", "Time", "time")
+        loc = pick(row, "Meeting Point", "meeting_point", "Location", "location")
+        route = pick(row, "GPS Link", "Route Link", "route_link", "route")
+        if not name:
+            yield i, None, "missing ride name"
+            continue
+        date = normalize_date(raw_date)
+        if not date:
+            yield i, None, f"bad date '{raw_date}'"
+            continue
+        yield i, (name, date, time, loc, route), None
+
+
+# ---------- ICALENDAR ----------
+def unfold_ics(text):
+    lines = []
+    for line in text.splitlines():
+        if line[:1] in (" ", "\t") and lines:
+            lines[-1] += line[1:]
+        elif line:
+            lines.append(line)
+    return lines
+
+
+def unescape_ics(value):
+    return (value.replace("\\n", "\n").replace("\\N", "\n")
+                 .replace("\\,", ",").replace("\\;", ";").replace("\\\\", "\\"))
+
+
+def ics_zone(tzid):
+    # Unknown TZIDs (Outlook writes Windows names such as "Central Standard
+    # Time") are read as wall-clock time rather than rejected.
+    try:
+        return zoneinfo.ZoneInfo(tzid.strip('"'))
+    except (zoneinfo.ZoneInfoNotFoundError, ValueError):
+        return None
+
+
+def parse_ics_datetime(value, tzid=""):
+    # Rides are stored as Chicago wall-clock time: UTC ("Z") values and
+    # values with a known TZID are converted; floating values are kept.
+    if "T" in value:
+        try:
+            dt = datetime.datetime.strptime(value[:15], "%Y%m%dT%H%M%S")
+        except ValueError:
+            return None, ""
+        zone = datetime.timezone.utc if value.endswith("Z") else (tzid and ics_zone(tzid))
+        if zone:
+            dt = dt.replace(tzinfo=zone).astimezone(zoneinfo.ZoneInfo(CAL_TIMEZONE))
+        return dt.date().isoformat(), format_time(dt.hour, dt.minute)
+    return normalize_date(value), ""
+
+
+def ics_param(params, name):
+    for p in params.split(";"):
+        key, _, value = p.partition("=")
+        if key.upper() == name:
+            return value
+    return ""
+
+
+def parse_ics(text):
+    # Same contract as parse_csv; the row number is the VEVENT's position.
+    event = None
+    n = 0
+    for line in unfold_ics(text):
+        if line == "BEGIN:VEVENT":
+            event = {}
+            n += 1
+            continue
+        if line == "END:VEVENT" and event is not None:
+            name = unescape_ics(event.get("SUMMARY", "")).strip()
+            if not name:
+                yield n, None, "missing SUMMARY"
+            else:
+                date, time = parse_ics_datetime(
+                    event.get("DTSTART", ""),
+                    ics_param(event.get("DTSTART;", ""), "TZID"))
+                if not date:
+                    yield n, None, f"bad DTSTART '{event.get('DTSTART', '')}'"
+                else:
+                    loc = unescape_ics(event.get("LOCATION", "")).strip()
+                    route = event.get("URL", "").strip()
+                    yield n, (name, date, time, loc, route), None
+            event = None
+            continue
+        if event is None or ":" not in line:
+            continue
+        key, value = line.split(":", 1)
+        name, _, params = key.partition(";")
+        name = name.upper()
+        if name not in event:
+            # Parameters (TZID=...) are kept under "NAME;".
+            event[name] = value
+            event[name + ";"] = params
+
+
+# ---------- IMPORT ----------
+def import_rides(filename, text):
+    # Returns (inserted_count, messages) where messages lists per-row
+    # errors and skipped duplicates for display in the admin panel.
+    if filename.lower().endswith((".ics", ".ical")):
+        parsed = parse_ics(text)
+        label = "Event"
+    else:
+        parsed = parse_csv(text)
+        label = "Row"
+
+    rides = []
+    messages = []
+    for n, ride, err in parsed:
+        if err:
+            messages.append(f"{label} {n}: {err}")
+        else:
+            rides.append(ride)
+
+    inserted, skipped = create_rides_bulk(rides)
+    for ride in skipped:
+        messages.append(f"Skipped duplicate: {ride[0]} on {ride[1]}")
+    return inserted, messages
+
+
+def decode_upload(data):
+    # Excel on Windows saves CSVs as cp1252, not UTF-8. Returns (text, note).
+    try:
+        return data.decode("utf-8-sig"), None
+    except UnicodeDecodeError:
+        return (data.decode("cp1252", errors="replace"),
+                "File is not UTF-8; read it as Windows-1252 (check accented names).")
+
+
+def import_file(filename, path):
+    # Reads and imports an uploaded file; runs on the database pool.
+    with open(path, "rb") as fh:
+        text, note = decode_upload(fh.read())
+    inserted, messages = import_rides(filename, text)
+    return inserted, ([note] if note else []) + messages
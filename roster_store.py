@@ -0,0 +1,69 @@
+import sys
+from array import array
+
+import numpy as np
+import pandas as pd
+
+
+class RosterRow:
+    __slots__ = ("ride_name", "ride_date", "full_name")
+
+    def __init__(self, ride_name, ride_date, full_name):
+        self.ride_name = ride_name
+        self.ride_date = ride_date
+        self.full_name = full_name
+
+
+class CompactRoster:
+    # Columnar roster: each ride's name/date is stored once in the ride
+    # dimension; signups are an int32 array of ride indexes plus a list of
+    # interned rider names (a rider on many rides shares one string).
+
+    def __init__(self, rides):
+        # rides: [(id, ride_name, ride_date)] in display order
+        self.ride_names = [r[1] for r in rides]
+        self.ride_dates = [r[2] for r in rides]
+        self._index = {r[0]: i for i, r in enumerate(rides)}
+        self.ride_idx = array("i")
+        self.names = []
+
+    def append(self, ride_id, full_name):
+        self.ride_idx.append(self._index[ride_id])
+        self.names.append(sys.intern(full_name or ""))
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self, i):
+        r = self.ride_idx[i]
+        return RosterRow(self.ride_names[r], self.ride_dates[r], self.names[i])
+
+    def __iter__(self):
+        # (ride_name, ride_date, full_name), as database.roster() returns
+        names, dates = self.ride_names, self.ride_dates
+        for r, name in zip(self.ride_idx, self.names):
+            yield names[r], dates[r], name
+
+    def by_ride(self):
+        # [(ride_id, ride_name, ride_date, [full_name, ...])] in display order
+        riders = [[] for _ in self.ride_names]
+        for r, name in zip(self.ride_idx, self.names):
+            riders[r].append(name)
+        return [(ride_id, self.ride_names[i], self.ride_dates[i], riders[i])
+                for ride_id, i in self._index.items()]
+
+    def to_frame(self):
+        # Ride and Date become categoricals over the ride dimension, so the
+        # frame holds small integer codes instead of one string per signup.
+        idx = np.frombuffer(self.ride_idx, dtype=np.intc)
+        return pd.DataFrame({
+            "Ride": categorical(self.ride_names, idx),
+            "Date": categorical(self.ride_dates, idx),
+            "Name": self.names,
+        })
+
+
+def categorical(values, idx):
+    # Rides can share a name or date; factorize so categories are unique.
+    codes, uniques = pd.factorize(pd.Index(values, dtype=object))
+    return pd.Categorical.from_codes(codes[idx], uniques)
@@ -0,0 +1,101 @@
+import asyncio
+import hashlib
+import os
+import sys
+import time
+from collections import OrderedDict
+
+from shiny import reactive
+
+IDLE_MINUTES  = float(os.getenv("TEAMUGLY_SESSION_IDLE_MIN", "30"))
+REAP_INTERVAL = 60
+PAYLOAD_SLOTS = 32
+
+# session id -> {"session", "values", "started", "active"}
+_sessions = {}
+_reaper = None
+
+# Shared store for large per-ride payloads (notification URLs and the
+# mailing list). Sessions keep only the key; identical payloads prepared by
+# several admins are held once.
+_payloads = OrderedDict()
+
+
+# ---------- PAYLOADS ----------
+def store_payload(payload):
+    key = hashlib.sha1(repr(payload).encode("utf-8")).hexdigest()[:16]
+    _payloads[key] = payload
+    _payloads.move_to_end(key)
+    while len(_payloads) > PAYLOAD_SLOTS:
+        _payloads.popitem(last=False)
+    return key
+
+
+def get_payload(key):
+    return _payloads.get(key)
+
+
+# ---------- REGISTRY ----------
+def track(session, values):
+    # values: the session's reactive.Value objects, for memory accounting.
+    global _reaper
+    now = time.monotonic()
+    _sessions[session.id] = {"session": session, "values": values,
+                             "started": now, "active": now}
+    session.on_ended(lambda: _sessions.pop(session.id, None))
+    if _reaper is None or _reaper.done():
+        _reaper = asyncio.get_running_loop().create_task(reap_idle())
+
+
+def touch(session_id):
+    entry = _sessions.get(session_id)
+    if entry:
+        entry["active"] = time.monotonic()
+
+
+def session_bytes(entry):
+    total = 0
+    with reactive.isolate():
+        for v in entry["values"]:
+            total += sys.getsizeof(v.get())
+    return total
+
+
+def report():
+    sizes = [session_bytes(e) for e in list(_sessions.values())]
+    payload_bytes = sum(sys.getsizeof(p) + sum(sys.getsizeof(x) for x in p)
+                        for p in _payloads.values())
+    return {
+        "sessions": len(sizes),
+        "session_bytes": sum(sizes),
+        "largest_session_bytes": max(sizes, default=0),
+        "payloads": len(_payloads),
+        "payload_bytes": payload_bytes,
+    }
+
+
+# ---------- IDLE REAPER ----------
+async def reap_idle():
+    while _sessions:
+        await asyncio.sleep(REAP_INTERVAL)
+        cutoff = time.monotonic() - IDLE_MINUTES * 60
+        for entry in [e for e in _sessions.values() if e["active"] < cutoff]:
+            _sessions.pop(entry["session"].id, None)
+            await entry["session"].close()
+
+
+# Client side: report activity at most once a minute so idle tracking
+# costs one tiny input message per active minute.
+activity_js = """
+    (function() {
+        var last = 0;
+        $(document).on('shiny:inputchanged', function(e) {
+            if (e.name === 'last_active' || e.name.indexOf('.clientdata') === 0) return;
+            var now = Date.now();
+            if (now - last > 60000) {
+                last = now;
+                Shiny.setInputValue('last_active', now);
+            }
+        });
+    })();
+"""
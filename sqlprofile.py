@@ -0,0 +1,170 @@
+import atexit
+import os
+import re
+import sqlite3
+import threading
+import time
+
+# Opt-in SQL profiling. With TEAMUGLY_SQL_PROFILE=1, database.connect()
+# hands out connections whose cursors time every statement (execute plus
+# the fetches that drain it), count rows, and capture EXPLAIN QUERY PLAN
+# the first time each statement text is seen. Table scans (SCAN without
+# an index) are flagged, and marked HOT once the statement has run
+# HOT_CALLS times. The report prints at shutdown and admins can download
+# it from the admin panel.
+ENABLED   = os.getenv("TEAMUGLY_SQL_PROFILE", "") not in ("", "0")
+HOT_CALLS = int(os.getenv("TEAMUGLY_SQL_PROFILE_HOT", "20"))
+
+PLANNED = re.compile(r"\s*(SELECT|WITH|INSERT|UPDATE|DELETE|REPLACE)\b", re.I)
+
+_stats = {}
+_lock = threading.Lock()
+
+
+class Stat:
+    __slots__ = ("sql", "calls", "seconds", "max", "rows", "plan")
+
+    def __init__(self, sql):
+        self.sql = sql
+        self.calls = 0
+        self.seconds = 0.0
+        self.max = 0.0
+        self.rows = 0
+        self.plan = None
+
+    @property
+    def scans(self):
+        return [line for line in self.plan or []
+                if line.startswith("SCAN ") and " USING " not in line
+                and "VIRTUAL TABLE" not in line and not line.startswith("SCAN CONSTANT")]
+
+
+def explain(con, sql, params):
+    if not PLANNED.match(sql):
+        return []
+    try:
+        rows = sqlite3.Connection.execute(con, "EXPLAIN QUERY PLAN " + sql, params).fetchall()
+    except sqlite3.Error as e:
+        return [f"(no plan: {e})"]
+    return [row[3] for row in rows]
+
+
+# ---------- CURSOR / CONNECTION ----------
+class ProfilingCursor(sqlite3.Cursor):
+    _stat = None
+    _elapsed = 0.0
+
+    def _start(self, sql, params):
+        key = " ".join(sql.split())
+        with _lock:
+            stat = _stats.get(key)
+            new = stat is None
+            if new:
+                stat = _stats[key] = Stat(key)
+            stat.calls += 1
+        if new:
+            stat.plan = explain(self.connection, sql, params)
+        self._stat, self._elapsed = stat, 0.0
+
+    def _add(self, seconds, rows):
+        stat = self._stat
+        if stat is None:
+            return
+        self._elapsed += seconds
+        with _lock:
+            stat.seconds += seconds
+            stat.rows += rows
+            stat.max = max(stat.max, self._elapsed)
+
+    def execute(self, sql, params=()):
+        self._start(sql, params)
+        t0 = time.perf_counter()
+        super().execute(sql, params)
+        self._add(time.perf_counter() - t0, 0 if self.description else max(self.rowcount, 0))
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        seq_of_params = list(seq_of_params)
+        self._start(sql, seq_of_params[0] if seq_of_params else ())
+        t0 = time.perf_counter()
+        super().executemany(sql, seq_of_params)
+        self._add(time.perf_counter() - t0, max(self.rowcount, 0))
+        return self
+
+    def fetchone(self):
+        t0 = time.perf_counter()
+        row = super().fetchone()
+        self._add(time.perf_counter() - t0, row is not None)
+        return row
+
+    def fetchmany(self, size=None):
+        t0 = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._add(time.perf_counter() - t0, len(rows))
+        return rows
+
+    def fetchall(self):
+        t0 = time.perf_counter()
+        rows = super().fetchall()
+        self._add(time.perf_counter() - t0, len(rows))
+        return rows
+
+    def __next__(self):
+        t0 = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._add(time.perf_counter() - t0, 0)
+            raise
+        self._add(time.perf_counter() - t0, 1)
+        return row
+
+
+class ProfilingConnection(sqlite3.Connection):
+    def cursor(self, factory=ProfilingCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
+
+
+# ---------- REPORT ----------
+def report(limit=None):
+    with _lock:
+        stats = sorted(_stats.values(), key=lambda s: -s.seconds)
+    if limit:
+        stats = stats[:limit]
+    lines = [f"{len(_stats)} statements, {sum(s.calls for s in stats)} calls, "
+             f"{sum(s.seconds for s in stats) * 1000:.1f} ms total",
+             f"{'calls':>7} {'total ms':>10} {'mean ms':>9} {'max ms':>9} {'rows':>9}  flags"]
+    for s in stats:
+        flags = []
+        if s.scans:
+            flags.append("SCAN")
+            if s.calls >= HOT_CALLS:
+                flags.append("HOT")
+        lines.append(f"{s.calls:>7} {s.seconds * 1000:>10.1f} {s.seconds / s.calls * 1000:>9.2f} "
+                     f"{s.max * 1000:>9.2f} {s.rows:>9}  {' '.join(flags)}")
+        lines.append(f"        {s.sql[:200]}")
+        for step in s.plan or []:
+            lines.append(f"          {'!! ' if step in s.scans else ''}{step}")
+    return "\n".join(lines) + "\n"
+
+
+def reset():
+    with _lock:
+        _stats.clear()
+
+
+def dump():
+    if _stats:
+        print("---------- SQL PROFILE ----------")
+        print(report(), end="")
+
+
+if ENABLED:
+    atexit.register(dump)
+
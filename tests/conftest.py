@@ -0,0 +1,45 @@
+import datetime
+import os
+import sys
+
+# Every test gets its own in-process database (TEAMUGLY_DB_ENGINE=memory),
+# so nothing touches data/ and the suite needs no cleanup. The engine is
+# read when database is imported, so it is set before that.
+os.environ["TEAMUGLY_DB_ENGINE"] = "memory"
+os.environ.pop("TEAMUGLY_SMTP_HOST", None)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import database
+
+
+@pytest.fixture
+def db(monkeypatch, tmp_path):
+    path = str(tmp_path / "teamugly.sqlite")
+    monkeypatch.setattr(database, "DB", path)
+    database.init_db()
+    database.forget_my_rides()
+    yield path
+    database.forget_my_rides()
+    database._memory.pop(path).close()
+
+
+def future(days):
+    return (datetime.date.today() + datetime.timedelta(days=days)).isoformat()
+
+
+def add_ride(name, date, capacity=None):
+    database.create_ride(name, date, "7:00 AM", "Park", "", capacity=capacity)
+    con = database.connect()
+    ride_id = con.execute("SELECT max(id) FROM rides").fetchone()[0]
+    con.close()
+    return ride_id
+
+
+def statuses(ride_id):
+    con = database.connect()
+    rows = con.execute("SELECT full_name, status FROM signups WHERE ride_id=? ORDER BY id",
+                       (ride_id,)).fetchall()
+    con.close()
+    return rows
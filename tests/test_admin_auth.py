@@ -0,0 +1,34 @@
+import pytest
+
+import admin_auth
+
+
+@pytest.fixture
+def auth(monkeypatch):
+    # PBKDF2 is deliberately slow; the lockout logic doesn't need it.
+    monkeypatch.setattr(admin_auth, "check_password", lambda password: password == "right")
+    monkeypatch.setattr(admin_auth, "_failures", {})
+
+
+def test_client_is_locked_out_after_max_failures(auth):
+    for _ in range(admin_auth.MAX_FAILURES):
+        assert admin_auth.login("wrong", "10.0.0.1")[0] is None
+    token, message = admin_auth.login("right", "10.0.0.1")
+    assert token is None and "Too many failed attempts" in message
+    assert admin_auth.verify_token(admin_auth.login("right", "10.0.0.2")[0])
+
+
+def test_mistakes_from_many_clients_do_not_lock_everyone_out(auth):
+    for i in range(50):
+        for _ in range(admin_auth.MAX_FAILURES - 1):
+            admin_auth.login("wrong", f"10.0.1.{i}")
+    assert admin_auth.verify_token(admin_auth.login("right", "10.0.2.1")[0])
+
+
+def test_shared_limit_still_caps_spread_out_guessing(auth, monkeypatch):
+    monkeypatch.setattr(admin_auth, "GLOBAL_MAX_FAILURES", 12)
+    for i in range(12):
+        admin_auth.login("wrong", f"10.0.3.{i}")
+    token, message = admin_auth.login("right", "10.0.4.1")
+    assert token is None
+    assert admin_auth.locked_for(admin_auth.ALL_CLIENTS) <= admin_auth.GLOBAL_LOCKOUT
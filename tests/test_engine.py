@@ -0,0 +1,40 @@
+import os
+import threading
+
+import database
+
+
+def count(table, db_path=None):
+    con = database.connect(db_path)
+    n = con.execute(f"SELECT count(*) FROM {table}").fetchone()[0]
+    con.close()
+    return n
+
+
+def test_memory_database_is_shared_between_connections(db):
+    database.create_ride("Hills", "2030-01-01", "7:00 AM", "Park", "")
+    assert count("rides") == 1
+    threads = [threading.Thread(target=database.create_ride,
+                                args=(f"Ride {i}", "2030-01-02", "7:00 AM", "Park", ""))
+               for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert count("rides") == 5
+
+
+def test_memory_databases_are_separate_per_path(db, tmp_path):
+    other = str(tmp_path / "other.sqlite")
+    database.init_db(other)
+    database.create_ride("Hills", "2030-01-01", "7:00 AM", "Park", "")
+    assert count("rides", other) == 0
+    database._memory.pop(other).close()
+
+
+def test_memory_engine_writes_nothing_to_disk(db):
+    database.create_ride("Hills", "2030-01-01", "7:00 AM", "Park", "")
+    assert database.signup(1, "Ann")
+    assert not os.path.exists(db)
+    assert not os.path.exists(database.journal_path(db))
+    assert database.replay_journal(db) == (0, 0)
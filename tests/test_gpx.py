@@ -0,0 +1,50 @@
+import io
+import re
+
+import numpy as np
+
+import database
+import gpx
+from conftest import add_ride, future
+
+
+def gpx_file(points):
+    pts = "".join(f'<trkpt lat="{lat}" lon="{lon}"><ele>{ele}</ele></trkpt>'
+                  for lat, lon, ele in points)
+    return io.BytesIO(('<?xml version="1.0"?><gpx xmlns="http://www.topografix.com/GPX/1/1">'
+                       f"<trk><trkseg>{pts}</trkseg></trk></gpx>").encode())
+
+
+def test_polyline_round_trips_to_about_a_metre():
+    lat = np.array([41.8781, 41.9, 41.95])
+    lon = np.array([-87.6298, -87.65, -87.7])
+    back_lat, back_lon = gpx.decode_polyline(gpx.encode_polyline(lat, lon))
+    assert np.abs(back_lat - lat).max() <= 0.5 / gpx.POLYLINE_SCALE
+    assert np.abs(back_lon - lon).max() <= 0.5 / gpx.POLYLINE_SCALE
+
+
+def test_attached_route_is_drawn_in_the_ride_view(db):
+    ride = add_ride("Hills", future(3))
+    # An L: north 0.01 deg, then east 0.01 deg, with a near-collinear
+    # point on each leg that simplify() drops.
+    stats = gpx.attach_gpx(ride, gpx_file([(41.0, -87.0, 180), (41.005, -87.0, 185),
+                                           (41.01, -87.0, 190), (41.01, -86.995, 188),
+                                           (41.01, -86.99, 200)]))
+    assert stats["point_count"] == 5
+    distance, gain, count, polyline = database.get_ride_route(ride)
+    assert (distance, gain, count) == (stats["distance_m"], 22.0, 5)
+    svg = gpx.route_svg(polyline, width=100, height=100, pad=0)
+    points = [tuple(map(float, p.split(","))) for p in
+              re.search(r'points="([^"]*)"', svg).group(1).split()]
+    # Start bottom left, corner top left, end at the right; north is up.
+    assert len(points) == 3
+    (x0, y0), (x1, y1), (x2, y2) = points
+    assert x0 == x1 < x2 and y1 == y2 < y0
+    assert all(0 <= v <= 100 for p in points for v in p)
+
+
+def test_degenerate_route_draws_nothing():
+    assert gpx.route_svg(None) == ""
+    assert gpx.route_svg(gpx.encode_polyline(np.array([41.0]), np.array([-87.0]))) == ""
+    same = gpx.encode_polyline(np.array([41.0, 41.0]), np.array([-87.0, -87.0]))
+    assert gpx.route_svg(same) == ""
@@ -0,0 +1,104 @@
+import fcntl
+import os
+import shutil
+
+import pytest
+
+import database
+import journal
+from conftest import add_ride, future
+
+
+@pytest.fixture
+def file_db(monkeypatch, tmp_path):
+    # replay_journal() is a no-op on a memory database (nothing survives
+    # the process to replay into), so these tests use a file.
+    path = str(tmp_path / "teamugly.sqlite")
+    monkeypatch.setattr(database, "ENGINE", "file")
+    monkeypatch.setattr(database, "JOURNALED", True)
+    monkeypatch.setattr(database, "DB", path)
+    database.init_db()
+    yield path
+    journal.rotate(database.journal_path(path))
+
+
+def codes():
+    con = database.connect()
+    rows = dict(con.execute("SELECT confirm_code, status FROM signups").fetchall())
+    con.close()
+    return rows
+
+
+def journaled():
+    journal.flush()
+    return [(r["op"], r["code"]) for r in journal.read(database.journal_path())]
+
+
+def lost_signup(code, ride):
+    # A committed signup whose row the database has since lost.
+    journal.append(database.journal_path(), {"t": database.now_utc_iso(), "op": "signup",
+                                             "code": code, "ride": ride, "name": "Cy"})
+
+
+def test_only_committed_writes_are_journaled(file_db):
+    ride = add_ride("Hills", future(3))
+    code = database.signup(ride, "Ann")
+    assert database.signup(ride + 1, "Bo") is None
+    assert database.cancel_signup("NOPE0000") == 0
+    database.cancel_signup(code)
+    assert journaled() == [("signup", code), ("cancel", code)]
+
+
+def test_replay_restores_only_lost_writes(file_db):
+    ride = add_ride("Hills", future(3))
+    kept = database.signup(ride, "Ann")
+    cancelled = database.signup(ride, "Bo")
+    lost_signup("LOST0001", ride)
+    journal.append(database.journal_path(), {"t": database.now_utc_iso(), "op": "cancel",
+                                             "code": cancelled})
+    assert database.replay_journal(file_db) == (1, 1)
+    assert codes() == {kept: "ACTIVE", cancelled: "CANCELLED", "LOST0001": "ACTIVE"}
+
+
+def test_replaying_twice_changes_nothing(file_db):
+    ride = add_ride("Hills", future(3))
+    code = database.signup(ride, "Ann")
+    database.cancel_signup(code)
+    database.signup(ride, "Bo")
+    lost_signup("LOST0001", ride)
+    path = database.journal_path()
+    journal.flush()
+    shutil.copy(path, path + ".saved")
+    assert database.replay_journal(file_db) == (1, 0)
+    before = codes()
+    shutil.copy(path + ".saved", path)
+    assert database.replay_journal(file_db) == (0, 0)
+    assert codes() == before
+
+
+def test_replay_skips_deleted_rides_and_cancelled_dates(file_db):
+    ride = add_ride("Gone", future(3))
+    series = database.create_series("Tuesday", future(7), "6:00 PM", "Park", "")
+    key = database.occurrence_key(series, future(7))
+    lost_signup("LOST0001", ride)
+    lost_signup("LOST0002", key)
+    lost_signup("LOST0003", "s42-2030-01-01")
+    database.delete_ride(ride)
+    database.delete_ride(key)
+    assert database.replay_journal(file_db) == (0, 0)
+    assert codes() == {}
+
+
+def test_rotate_leaves_a_journal_another_process_is_appending_to(file_db):
+    ride = add_ride("Hills", future(3))
+    lost_signup("LOST0001", ride)
+    path = database.journal_path()
+    other = os.open(path, os.O_WRONLY | os.O_APPEND)
+    fcntl.flock(other, fcntl.LOCK_SH)
+    try:
+        assert database.replay_journal(file_db) == (1, 0)
+        assert os.path.exists(path) and not os.path.exists(path + ".1")
+    finally:
+        os.close(other)
+    assert journal.rotate(path)
+    assert os.path.exists(path + ".1") and not os.path.exists(path)
@@ -0,0 +1,122 @@
+import uuid
+
+import pytest
+
+import database
+import email_utils
+from conftest import add_ride, future
+
+
+def rsvp(ride_name, date, name, email):
+    token = str(uuid.uuid4())
+    database.insert_signup(None, database.now_utc_iso(), ride_name, date, "7:00 AM", "Park", "",
+                           name, email, "", "", "", 1, token)
+    con = database.connect()
+    code = con.execute("SELECT confirm_code FROM signups WHERE cancel_token=?",
+                       (token,)).fetchone()[0]
+    con.close()
+    return code
+
+
+def test_code_shows_only_its_own_signup(db):
+    hills = add_ride("Hills", future(3))
+    flats = add_ride("Flats", future(5))
+    mine = database.signup(hills, "Ann Lee")
+    database.signup(flats, "Ann Lee")
+    database.signup(flats, "ann lee")
+    rows = database.my_rides(mine.lower())
+    assert [(r[0], r[2]) for r in rows] == [(mine, hills)]
+
+
+def test_code_never_reveals_rides_under_the_same_email(db):
+    date = future(3)
+    add_ride("Hills", date)
+    mine = rsvp("Hills", date, "Ann", "ann@example.org")
+    other = rsvp("Flats", future(4), "Ann", "Ann@Example.org")
+    assert [r[0] for r in database.my_rides(mine)] == [mine]
+    assert [r[0] for r in database.my_rides(other)] == [other]
+
+
+def test_email_is_not_a_lookup_key(db):
+    rsvp("Hills", future(3), "Ann", "ann@example.org")
+    assert database.my_rides("ann@example.org") is None
+    assert database.my_rides("NOPE0000") is None
+    assert database.my_rides("") is None
+
+
+def test_cancelled_and_past_signups_drop_out(db):
+    past = add_ride("Old", "2000-01-01")
+    hills = add_ride("Hills", future(3))
+    old = database.signup(past, "Ann")
+    code = database.signup(hills, "Ann")
+    assert database.my_rides(old) == []
+    database.cancel_signup(code)
+    assert database.my_rides(code) == []
+
+
+def test_merged_duplicate_code_shows_the_kept_signup_under_that_code(db):
+    date = future(3)
+    first = rsvp("Hills", date, "Ann", "ann@example.org")
+    extra = rsvp("Hills", date, "Ann", "ann+rides@example.org" if database.FOLD_PLUS
+                 else "ANN@example.org")
+    con = database.connect()
+    with con:
+        assert database.dedupe_signups(con.cursor()) == 1
+    con.close()
+    database.forget_my_rides()
+    assert [r[0] for r in database.my_rides(extra)] == [extra]
+    assert [r[0] for r in database.my_rides(first)] == [first]
+
+
+def test_email_list_goes_only_to_that_address(db, monkeypatch):
+    rsvp("Hills", future(3), "Ann", "ann@example.org")
+    rsvp("Flats", future(4), "Ann", "ANN@example.org")
+    rsvp("Flats", future(4), "Bo", "bo@example.org")
+    sent = []
+    monkeypatch.setattr(email_utils, "send", lambda messages: sent.extend(messages))
+    assert email_utils.email_my_rides("Ann@Example.org") == 2
+    assert [m[0] for m in sent] == ["Ann@Example.org"]
+    assert email_utils.email_my_rides("nobody@example.org") == 0
+    assert len(sent) == 1
+
+
+def test_email_list_needs_a_mail_server(db):
+    rsvp("Hills", future(3), "Ann", "ann@example.org")
+    with pytest.raises(RuntimeError):
+        email_utils.email_my_rides("ann@example.org")
+
+
+# ---------- /api/my-rides ----------
+@pytest.fixture
+def client(db):
+    from starlette.applications import Starlette
+    from starlette.testclient import TestClient
+
+    import api
+    import ratelimit
+    ratelimit.lookup_ip.buckets.clear()
+    return TestClient(Starlette(routes=api.routes))
+
+
+def test_api_code_lookup(client):
+    ride = add_ride("Hills", future(3), capacity=1)
+    database.signup(ride, "Ann")
+    code = database.signup(ride, "Bo")
+    r = client.get("/api/my-rides", params={"q": code.lower()})
+    assert r.status_code == 200
+    assert [(x["id"], x["confirmation_code"], x["waitlisted"]) for x in r.json()["rides"]] == [
+        (ride, code, True)]
+    assert client.get("/api/my-rides", params={"q": "NOPE0000"}).status_code == 404
+    assert client.get("/api/my-rides").status_code == 400
+
+
+def test_api_email_lookup_never_returns_rides(client, monkeypatch):
+    rsvp("Hills", future(3), "Ann", "ann@example.org")
+    assert client.get("/api/my-rides", params={"q": "ann@example.org"}).status_code == 503
+    sent = []
+    monkeypatch.setattr(email_utils, "SMTP_HOST", "mail.example.org")
+    monkeypatch.setattr(email_utils, "send", lambda messages: sent.extend(messages))
+    for address in ("ann@example.org", "nobody@example.org"):
+        r = client.get("/api/my-rides", params={"q": address})
+        assert (r.status_code, r.json()) == (202, {"emailed": True})
+    assert [m[0] for m in sent] == ["ann@example.org"]
@@ -0,0 +1,118 @@
+import datetime
+from zoneinfo import ZoneInfo
+
+import database
+import reminders
+from conftest import add_ride
+
+
+def rsvp(ride_id, name, email):
+    # A TU_Rides.py-style signup with an email address.
+    code = database.signup(ride_id, name)
+    con = database.connect()
+    with con:
+        con.execute("UPDATE signups SET email=?, email_key=email_key(?) WHERE confirm_code=?",
+                    (email, email, code))
+    con.close()
+    return code
+
+
+def queued():
+    con = database.connect()
+    rows = con.execute("""
+        SELECT s.full_name FROM outbox o JOIN signups s ON s.id = o.signup_id
+        WHERE o.kind = 'REMINDER' ORDER BY s.full_name
+    """).fetchall()
+    con.close()
+    return [name for name, in rows]
+
+
+def test_only_rides_starting_within_the_window_are_queued(db):
+    now = datetime.datetime(2030, 6, 1, 8, 0)
+    for name, date in (("Ann", "2030-06-02"), ("Bo", "2030-06-03"), ("Cy", "2030-06-01")):
+        rsvp(add_ride(f"{name}'s ride", date), name, f"{name.lower()}@example.com")
+    # 7:00 AM tomorrow is inside 24 hours; the day after is too far out,
+    # and this morning's ride has already started.
+    assert reminders.enqueue(now=now) == 1
+    assert queued() == ["Ann"]
+    assert reminders.enqueue(now=now) == 0
+
+
+def test_signups_without_email_are_not_queued(db):
+    ride = add_ride("Hills", "2030-06-02")
+    database.signup(ride, "Ann")
+    assert reminders.enqueue(now=datetime.datetime(2030, 6, 1, 8, 0)) == 0
+
+
+def test_now_is_chicago_wall_clock_time():
+    before = datetime.datetime.now(ZoneInfo("America/Chicago")).replace(tzinfo=None)
+    now = reminders.local_now()
+    assert now.tzinfo is None
+    assert datetime.timedelta(0) <= now - before < datetime.timedelta(seconds=5)
+
+
+def test_reminder_names_the_day_relative_to_chicago_today():
+    today = datetime.date(2030, 6, 1)
+    assert reminders.ride_day("2030-06-01", today) == "today's ride"
+    assert reminders.ride_day("2030-06-02", today) == "tomorrow's ride"
+    assert reminders.ride_day("2030-06-04", today) == "the ride on Tuesday"
+
+
+class FakeSMTP:
+    # Stands in for smtplib.SMTP; errors maps a recipient to the
+    # exception sendmail raises for it.
+    def __init__(self, errors):
+        self.errors = errors
+        self.sent = []
+
+    def __call__(self, host, port, timeout=None):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def sendmail(self, sender, to, data):
+        if to[0] in self.errors:
+            raise self.errors[to[0]]
+        self.sent.append(to[0])
+
+
+def pending():
+    con = database.connect()
+    n = con.execute("SELECT count(*) FROM outbox WHERE sent_utc IS NULL").fetchone()[0]
+    con.close()
+    return n
+
+
+def queue_three(monkeypatch):
+    ride = add_ride("Hills", "2030-06-02")
+    for name in ("Ann", "Bo", "Cy"):
+        rsvp(ride, name, f"{name.lower()}@example.com")
+    reminders.enqueue(now=datetime.datetime(2030, 6, 1, 8, 0))
+    monkeypatch.setitem(reminders.stats, "sent", 0)
+    monkeypatch.setitem(reminders.stats, "failed", 0)
+
+
+def test_rejected_message_is_failed_and_the_batch_goes_on(db, monkeypatch):
+    queue_three(monkeypatch)
+    smtp = FakeSMTP({"bo@example.com": reminders.smtplib.SMTPDataError(554, b"rejected")})
+    monkeypatch.setattr(reminders.smtplib, "SMTP", smtp)
+    assert reminders.send_batch() == 3
+    assert smtp.sent == ["ann@example.com", "cy@example.com"]
+    assert (reminders.stats["sent"], reminders.stats["failed"]) == (2, 1)
+    assert pending() == 0
+
+
+def test_dropped_connection_requeues_the_unsent_rest(db, monkeypatch):
+    queue_three(monkeypatch)
+    smtp = FakeSMTP({"bo@example.com": reminders.smtplib.SMTPServerDisconnected("gone")})
+    monkeypatch.setattr(reminders.smtplib, "SMTP", smtp)
+    assert reminders.send_batch() == 0
+    assert smtp.sent == ["ann@example.com"]
+    assert pending() == 2
+    smtp.errors.clear()
+    assert reminders.send_batch() == 2
+    assert smtp.sent == ["ann@example.com", "bo@example.com", "cy@example.com"]
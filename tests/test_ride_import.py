@@ -0,0 +1,43 @@
+from ride_import import parse_ics, parse_ics_datetime
+
+
+def test_utc_start_is_converted_to_chicago():
+    # 12:00 UTC is 7:00 AM CDT in June and 6:00 AM CST in January.
+    assert parse_ics_datetime("20250601T120000Z") == ("2025-06-01", "7:00 AM")
+    assert parse_ics_datetime("20250115T120000Z") == ("2025-01-15", "6:00 AM")
+
+
+def test_utc_start_can_move_the_date():
+    assert parse_ics_datetime("20250601T030000Z") == ("2025-05-31", "10:00 PM")
+
+
+def test_tzid_is_honored():
+    assert parse_ics_datetime("20250601T090000", "America/New_York") == ("2025-06-01", "8:00 AM")
+    assert parse_ics_datetime("20250601T090000", "America/Chicago") == ("2025-06-01", "9:00 AM")
+
+
+def test_floating_and_unknown_tzid_are_wall_clock():
+    assert parse_ics_datetime("20250601T090000") == ("2025-06-01", "9:00 AM")
+    assert parse_ics_datetime("20250601T090000", "Central Standard Time") == ("2025-06-01", "9:00 AM")
+    assert parse_ics_datetime("20250601") == ("2025-06-01", "")
+
+
+def test_parse_ics_passes_tzid_through():
+    text = "\r\n".join([
+        "BEGIN:VCALENDAR",
+        "BEGIN:VEVENT",
+        "SUMMARY:Hill Repeats",
+        "DTSTART;TZID=America/Denver:20250601T060000",
+        "LOCATION:Trailhead",
+        "END:VEVENT",
+        "BEGIN:VEVENT",
+        "SUMMARY:Lake Loop",
+        "DTSTART:20250602T120000Z",
+        "END:VEVENT",
+        "END:VCALENDAR",
+    ])
+    rides = [ride for _, ride, _ in parse_ics(text)]
+    assert rides == [
+        ("Hill Repeats", "2025-06-01", "7:00 AM", "Trailhead", ""),
+        ("Lake Loop", "2025-06-02", "7:00 AM", "", ""),
+    ]
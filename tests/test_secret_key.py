@@ -0,0 +1,28 @@
+import database
+
+
+def test_secret_key_is_created_once_and_kept_as_text(db):
+    key = database.secret_key()
+    assert isinstance(key, str) and len(key) == 64
+    assert database.secret_key() == key
+
+
+def test_all_digit_key_stays_text(db):
+    con = database.connect()
+    with con:
+        con.execute("INSERT INTO app_secrets (name, value) VALUES ('secret_key', ?)", ("0" + "1" * 63,))
+    con.close()
+    assert database.secret_key() == "0" + "1" * 63
+
+
+def test_key_in_meta_is_moved_to_app_secrets(db):
+    con = database.connect()
+    with con:
+        con.execute("DROP TABLE app_secrets")
+        con.execute("INSERT INTO meta (key, value) VALUES ('secret_key', ?)", ("ab" * 32,))
+    con.close()
+    database.init_db()
+    assert database.secret_key() == "ab" * 32
+    con = database.connect()
+    assert con.execute("SELECT count(*) FROM meta WHERE key='secret_key'").fetchone()[0] == 0
+    con.close()
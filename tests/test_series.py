@@ -0,0 +1,57 @@
+import datetime
+
+import database
+from conftest import future
+
+
+def occurrences(first, weeks=4):
+    con = database.connect()
+    rows = database.expand_series(con.cursor(), datetime.date.fromisoformat(first), weeks)
+    con.close()
+    return rows
+
+
+def week(first, n):
+    return (datetime.date.fromisoformat(first) + datetime.timedelta(weeks=n)).isoformat()
+
+
+def test_weekly_series_expands_from_start(db):
+    first = future(7)
+    series = database.create_series("Tuesday Hammer", first, "6:00 PM", "Park", "")
+    rows = occurrences(first)
+    assert [r[2] for r in rows[:4]] == [week(first, n) for n in range(4)]
+    assert rows[0][0] == database.occurrence_key(series, first)
+    assert rows[0][1:4] == ("Tuesday Hammer", first, "6:00 PM")
+
+
+def test_interval_and_until_date(db):
+    first = future(7)
+    database.create_series("Every Other", first, "6:00 PM", "Park", "",
+                           until_date=week(first, 4), interval_weeks=2)
+    assert [r[2] for r in occurrences(first, weeks=8)] == [week(first, 0), week(first, 2),
+                                                            week(first, 4)]
+
+
+def test_exceptions_cancel_and_override_single_dates(db):
+    first = future(7)
+    series = database.create_series("Tuesday Hammer", first, "6:00 PM", "Park", "")
+    database.delete_ride(database.occurrence_key(series, week(first, 1)))
+    database.change_ride(database.occurrence_key(series, week(first, 2)), time="5:30 PM")
+    rows = {r[2]: r for r in occurrences(first, weeks=3)}
+    assert week(first, 1) not in rows
+    assert rows[week(first, 2)][3] == "5:30 PM"
+    assert rows[week(first, 3)][3] == "6:00 PM"
+    assert database.signup(database.occurrence_key(series, week(first, 1)), "Ann") is None
+
+
+def test_first_signup_materializes_the_date_once(db):
+    first = future(7)
+    series = database.create_series("Tuesday Hammer", first, "6:00 PM", "Park", "", capacity=5)
+    key = database.occurrence_key(series, first)
+    database.signup(key, "Ann")
+    database.signup(key, "Bo")
+    assert first not in [r[2] for r in occurrences(first)]
+    listed = [r for r in database.list_ride_details() if r[2] == first]
+    assert len(listed) == 1 and isinstance(listed[0][0], int)
+    assert database.occurrence_keys() == {str(listed[0][0]): key}
+    assert database.ride_spots(key) == (5, 2, 0)
@@ -0,0 +1,97 @@
+import uuid
+
+import pytest
+
+import database
+import waitlist
+from conftest import add_ride, future, statuses
+
+
+def codes_from(monkeypatch, *codes):
+    queue = list(codes)
+    monkeypatch.setattr(database, "new_code", lambda: queue.pop(0))
+
+
+def test_colliding_code_is_replaced_not_reused(db, monkeypatch):
+    ride = add_ride("Hills", future(3))
+    codes_from(monkeypatch, "AAAA0001", "AAAA0001", "BBBB0002")
+    assert database.signup(ride, "Ann") == "AAAA0001"
+    assert database.signup(ride, "Bo") == "BBBB0002"
+    con = database.connect()
+    assert con.execute("SELECT confirm_code, full_name FROM signups ORDER BY id").fetchall() == [
+        ("AAAA0001", "Ann"), ("BBBB0002", "Bo")]
+    con.close()
+
+
+def test_signup_gives_up_after_repeated_collisions(db, monkeypatch):
+    ride = add_ride("Hills", future(3))
+    codes_from(monkeypatch, *["AAAA0001"] * (database.CODE_ATTEMPTS + 1))
+    database.signup(ride, "Ann")
+    with pytest.raises(database.sqlite3.IntegrityError):
+        database.signup(ride, "Bo")
+    con = database.connect()
+    assert con.execute("SELECT count(*) FROM signups").fetchone()[0] == 1
+    con.close()
+
+
+def test_capacity_fills_then_waitlists_in_order(db):
+    ride = add_ride("Hills", future(3), capacity=2)
+    codes = [database.signup(ride, name) for name in ("Ann", "Bo", "Cy", "Di")]
+    assert statuses(ride) == [("Ann", "ACTIVE"), ("Bo", "ACTIVE"),
+                              ("Cy", "WAITLISTED"), ("Di", "WAITLISTED")]
+    assert [database.waitlist_position(c) for c in codes] == [None, None, 1, 2]
+    assert database.ride_spots(ride) == (2, 2, 2)
+
+
+def test_new_signup_queues_behind_waitlist_after_cancel(db):
+    ride = add_ride("Hills", future(3), capacity=1)
+    ann = database.signup(ride, "Ann")
+    database.signup(ride, "Bo")
+    assert database.cancel_signup(ann) == 1
+    # The freed spot belongs to Bo, not to whoever signs up next.
+    database.signup(ride, "Cy")
+    assert statuses(ride)[1:] == [("Bo", "WAITLISTED"), ("Cy", "WAITLISTED")]
+    assert waitlist.sweep() == 1
+    assert statuses(ride)[1:] == [("Bo", "ACTIVE"), ("Cy", "WAITLISTED")]
+
+
+def test_open_ride_has_no_waitlist(db):
+    ride = add_ride("Social", future(3))
+    for name in ("Ann", "Bo", "Cy"):
+        database.signup(ride, name)
+    assert {status for _, status in statuses(ride)} == {"ACTIVE"}
+
+
+def test_rsvp_signups_share_capacity_and_waitlist(db):
+    ride = add_ride("Hills", future(3), capacity=1)
+    database.signup(ride, "Ann")
+    token = str(uuid.uuid4())
+    status = database.insert_signup(None, database.now_utc_iso(), "Hills", future(3), "7:00 AM",
+                                    "Park", "", "Bo", "bo@example.org", "", "", "", 1, token)
+    assert status == "WAITLISTED"
+    assert database.cancel_signup_by_token(None, token)
+    assert not database.cancel_signup_by_token(None, token)
+
+
+def test_rsvp_code_collision_keeps_this_riders_status(db, monkeypatch):
+    # Bo's RSVP first draws Ann's code. Ann holds the only spot, so Bo must
+    # be waitlisted under a code of his own, not reported as ACTIVE.
+    ride = add_ride("Hills", future(3), capacity=1)
+    codes_from(monkeypatch, "AAAA0001", "AAAA0001", "BBBB0002")
+    database.signup(ride, "Ann")
+    status = database.insert_signup(None, database.now_utc_iso(), "Hills", future(3), "7:00 AM",
+                                    "Park", "", "Bo", "bo@example.org", "", "", "", 1,
+                                    str(uuid.uuid4()))
+    assert status == "WAITLISTED"
+    assert statuses(ride) == [("Ann", "ACTIVE"), ("Bo", "WAITLISTED")]
+
+
+def test_signup_for_missing_or_deleted_ride_is_refused(db):
+    ride = add_ride("Gone", future(3))
+    database.delete_ride(ride)
+    assert database.signup(ride, "Ann") is None
+    assert database.signup(ride + 1, "Ann") is None
+    assert database.signup("s99-2030-01-01", "Ann") is None
+    con = database.connect()
+    assert con.execute("SELECT count(*) FROM signups").fetchone()[0] == 0
+    con.close()
@@ -0,0 +1,90 @@
+import uuid
+
+import database
+import waitlist
+from conftest import add_ride, future
+
+# rider_stats.full_name is only the display spelling of rider_key (the
+# triggers keep the first one seen, a rebuild picks min()), so it is left
+# out; every count is compared.
+STATS_TABLES = {
+    "rider_stats": "SELECT rider_key, signups, cancellations, checked_in, last_signup_utc "
+                   "FROM rider_stats WHERE signups OR cancellations OR checked_in "
+                   "ORDER BY rider_key",
+    "ride_stats": "SELECT ride_id, signups, cancellations, checked_in FROM ride_stats "
+                  "WHERE signups OR cancellations OR checked_in ORDER BY ride_id",
+    "weekly_turnout": "SELECT week, signups, cancellations, checked_in FROM weekly_turnout "
+                      "WHERE signups OR cancellations OR checked_in ORDER BY week",
+}
+
+
+def snapshot(cur):
+    return {name: cur.execute(sql).fetchall() for name, sql in STATS_TABLES.items()}
+
+
+def test_triggers_match_rebuild(db):
+    hills = add_ride("Hills", future(3), capacity=2)
+    flats = add_ride("Flats", future(10))
+    gone = add_ride("Gone", future(17))
+    ann = database.signup(hills, "Ann Lee")
+    database.signup(hills, " ann lee ")
+    database.signup(hills, "Bo")
+    database.cancel_signup(ann)
+    waitlist.sweep()
+    database.signup(flats, "Ann Lee")
+    database.signup(gone, "Cy")
+    database.delete_ride(gone)
+    for name in ("Di", "Di"):
+        database.insert_signup(None, database.now_utc_iso(), "Flats", future(10), "7:00 AM",
+                               "Park", "", name, "di@example.org", "", "", "", 1,
+                               str(uuid.uuid4()))
+    con = database.connect()
+    cur = con.cursor()
+    with con:
+        database.dedupe_signups(cur)
+    ids = [r[0] for r in database.checkin_roster(hills)]
+    database.record_checkins(hills, [(i, database.now_utc_iso()) for i in ids])
+
+    live = snapshot(cur)
+    with con:
+        database.rebuild_stats(cur)
+    assert snapshot(cur) == live
+    assert live["ride_stats"]
+    con.close()
+
+
+def rsvp(date, name, email):
+    database.insert_signup(None, database.now_utc_iso(), "Flats", date, "7:00 AM", "Park", "",
+                           name, email, "", "", "", 1, str(uuid.uuid4()))
+
+
+def riders():
+    con = database.connect()
+    rows = con.execute("SELECT rider_key, signups FROM rider_stats WHERE signups "
+                       "ORDER BY rider_key").fetchall()
+    con.close()
+    return rows
+
+
+def test_riders_are_keyed_on_email_then_name(db):
+    first, second = future(3), future(10)
+    add_ride("Flats", first)
+    add_ride("Flats", second)
+    rsvp(first, "Sam Ng", "sam@example.org")
+    rsvp(first, "Sam Ng", "sam.ng@example.com")
+    rsvp(second, "Samuel Ng", "SAM@example.org ")
+    database.signup(add_ride("Hills", future(4)), " sam ng")
+    assert riders() == [("sam ng", 1), ("sam.ng@example.com", 1), ("sam@example.org", 2)]
+
+
+def test_name_keyed_stats_are_rebuilt_on_upgrade(db):
+    ride = add_ride("Flats", future(3))
+    rsvp(future(3), "Sam Ng", "sam@example.org")
+    database.signup(ride, "Bo")
+    con = database.connect()
+    with con:
+        con.execute("UPDATE rider_stats SET rider_key = 'sam ng' WHERE rider_key = 'sam@example.org'")
+        con.execute("UPDATE meta SET value = 1 WHERE key = 'stats_key_version'")
+    con.close()
+    database.init_db()
+    assert riders() == [("bo", 1), ("sam@example.org", 1)]
@@ -0,0 +1,134 @@
+import os
+import sqlite3
+import threading
+import time
+
+from database import DB, connect, forget_my_rides, now_utc_iso
+
+BATCH = 50       # waitlisted riders promoted per transaction
+PAUSE = 0.01     # seconds between transactions, leaving the write lock free
+POLL  = 30       # seconds between sweeps when nobody calls wake()
+
+# Promotes waitlisted riders when spots open on a ride with a capacity.
+# Cancelling only flips the signup's status and calls wake(); a single
+# background worker then fills the freed spots. Each promotion transaction
+# covers one ride and at most BATCH riders: it picks the oldest waitlisted
+# signups, marks them ACTIVE and queues a 'PROMOTED' notice per rider in
+# the outbox, all in the same transaction, so a rider is never promoted
+# without a notice (or noticed without a spot). A burst of cancellations
+# just sets the wake flag repeatedly and is handled by one sweep.
+
+_wake = threading.Event()
+_running = set()
+stats = {"promoted": 0, "sweeps": 0}
+
+
+def wake():
+    _wake.set()
+
+
+def promote_ride(con, ride_id, batch=BATCH):
+    # Returns the number of riders promoted.
+    cur = con.cursor()
+    with con:
+        cur.execute("BEGIN IMMEDIATE")
+        row = cur.execute("""
+            SELECT r.capacity - (SELECT count(*) FROM signups a
+                                 WHERE a.ride_id = r.id AND a.status = 'ACTIVE')
+            FROM rides r
+            WHERE r.id = ? AND r.status = 'ACTIVE'
+        """, (ride_id,)).fetchone()
+        if row is None:
+            return 0
+        free = batch if row[0] is None else min(max(row[0], 0), batch)
+        ids = [r[0] for r in cur.execute("""
+            SELECT id FROM signups
+            WHERE ride_id = ? AND status = 'WAITLISTED'
+            ORDER BY id
+            LIMIT ?
+        """, (ride_id, free))]
+        if not ids:
+            return 0
+        marks = ",".join("?" * len(ids))
+        cur.execute(f"UPDATE signups SET status='ACTIVE' WHERE id IN ({marks})", ids)
+        now = now_utc_iso()
+        cur.executemany("""
+            INSERT INTO outbox (kind, signup_id, created_utc) VALUES ('PROMOTED', ?, ?)
+        """, [(i, now) for i in ids])
+    return len(ids)
+
+
+def sweep(db_path=None, batch=BATCH, pause=PAUSE):
+    con = connect(db_path)
+    cur = con.cursor()
+    total = 0
+    try:
+        rides = [r[0] for r in cur.execute("""
+            SELECT DISTINCT ride_id FROM signups WHERE status = 'WAITLISTED'
+        """)]
+        for ride_id in rides:
+            while True:
+                n = promote_ride(con, ride_id, batch)
+                total += n
+                if n < batch:
+                    break
+                time.sleep(pause)
+    finally:
+        con.close()
+    if total:
+        forget_my_rides()
+    stats["promoted"] += total
+    stats["sweeps"] += 1
+    return total
+
+
+def start_background(db_path=None):
+    db_path = os.path.abspath(db_path or DB)
+    if db_path in _running:
+        return None
+    _running.add(db_path)
+
+    def loop():
+        while True:
+            _wake.wait(POLL)
+            _wake.clear()
+            try:
+                sweep(db_path)
+            except sqlite3.Error as e:
+                print(f"waitlist: promotion sweep failed: {e}")
+
+    thread = threading.Thread(target=loop, name="waitlist", daemon=True)
+    thread.start()
+    wake()
+    return thread
+
+
+# ---------- NOTICES ----------
+# Promotion notices wait in the outbox until an admin has passed them on
+# (riders sign up with just a name, so there is no address to mail).
+
+def pending_notices(limit=50):
+    con = connect()
+    cur = con.cursor()
+    rows = cur.execute("""
+        SELECT o.id, s.full_name, s.confirm_code, r.ride_name, r.ride_date, o.created_utc
+        FROM outbox o
+        JOIN signups s ON s.id = o.signup_id
+        JOIN rides r ON r.id = s.ride_id
+        WHERE o.sent_utc IS NULL AND o.kind = 'PROMOTED'
+        ORDER BY o.id
+        LIMIT ?
+    """, (limit,)).fetchall()
+    con.close()
+    return rows
+
+
+def mark_sent(ids):
+    con = connect()
+    cur = con.cursor()
+    with con:
+        cur.executemany("UPDATE outbox SET sent_utc=? WHERE id=? AND sent_utc IS NULL",
+                        [(now_utc_iso(), i) for i in ids])
+        done = cur.rowcount
+    con.close()
+    return done